@@ -29,6 +29,8 @@ require('app/core/set.php');                // Array manipulation library
 require('app/core/config.php');             // Configuration wrapper
 //require('app/core/ldap.php');             // LDAP lookups for users
 require('app/core/ibis.php');               // Use Ibis database; much more robust than ldap
+require('app/core/sync.php');               // Incremental mirror of Ibis people and institutions
+require('app/core/visibility.php');         // Compiled post visibility rules
 require('app/lib/ucam_webauth.php');        // Cantab authentication library
 require('app/core/raven.php');              // Interface between WP and Raven
 require('app/error/auth_exception.php');    // Exceptions
@@ -37,6 +39,8 @@ require('pages/options.php');               // Options page for wp-admin
 // Initialise Raven
 add_action('init', 'WPRavenAuth\setup');
 register_activation_hook( __FILE__, 'WPRavenAuth\activate' );
+register_deactivation_hook( __FILE__, 'WPRavenAuth\deactivate' );
+add_action('WPRavenAuth_sync', 'WPRavenAuth\sync');
     
 function generateRandomString($length = 20) {
     $characters = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ';
@@ -49,10 +53,33 @@ function generateRandomString($length = 20) {
     
 function activate() {
     Config::set('salt', generateRandomString());
+    scheduleSync();
+}
+    
+// Schedule the sync, unless it already is. This is also done on every
+// request, since updating the plugin doesn't run the activation hook.
+function scheduleSync() {
+    if (!wp_next_scheduled('WPRavenAuth_sync')) {
+        wp_schedule_event(time(), 'hourly', 'WPRavenAuth_sync');
+    }
+}
+    
+function deactivate() {
+    wp_clear_scheduled_hook('WPRavenAuth_sync');
+}
+    
+// Bring the local mirror of Ibis data up to date (run hourly by WP cron)
+function sync() {
+    $sync = new Sync(Ibis::ibisConnection(), new WPSyncStore());
+    $sync->run();
 }
     
 function setup()
 {
+    // People mirrored by sync are read from the mirror, not Lookup
+    Ibis::setMirror(new WPSyncStore());
+    scheduleSync();
+    
     // Need to require here so other ACF plugins are loaded first
     require('app/core/custom_fields.php');      // Custom fields for visibility settings
     
@@ -70,6 +97,9 @@ function setup()
     // Add filters for authentication on pages
     add_filter('the_posts', 'WPRavenAuth\showPost');
     add_filter('get_pages', 'WPRavenAuth\showPost');
+    add_filter('acf/update_value/name=custom_visibility', array('WPRavenAuth\Visibility', 'updateValue'), 10, 3);
+    add_action('added_post_meta', array('WPRavenAuth\Visibility', 'metaChanged'), 10, 4);
+    add_action('updated_post_meta', array('WPRavenAuth\Visibility', 'metaChanged'), 10, 4);
     
     if (strcmp(Config::get('cookie_key'), 'rand0m+alphanum3r!icstr!n&') == 0) {
         // cookie_key has not been changed - warn the user
@@ -158,55 +188,45 @@ function getCurrentUser()
     return wp_get_current_user();
 }
     
-function userCanAccessPost($postID, $crsid)
+// $memberships is the user's membership set from Ibis::getMemberships. It is
+// fetched when first needed, so callers checking many posts should pass the
+// same variable for each one. $visibility is the post's compiled visibility,
+// if the caller has already fetched it with Visibility::forPosts.
+function userCanAccessPost($postID, $crsid, &$memberships = null, $visibility = null)
 {
-    $postVisibility = get_field('custom_visibility', $postID);
-    
-    if (!is_array($postVisibility))
-        $postVisibility = array('public');
+    if (is_null($visibility))
+        $visibility = Visibility::forPost($postID);
     
-    if (in_array('public', $postVisibility))
-        return true;
-    elseif (in_array('raven', $postVisibility))
-        return is_user_logged_in();
-    elseif (is_user_logged_in())
-    {
-        $person = Ibis::getPerson($crsid);
-        foreach ($postVisibility as $inst)
-        {
-            $inst_split = explode('-',$inst);
-            if (strcmp($inst_split[0], 'COLL') == 0)
-            {
-                if (Ibis::isMemberOfCollege($person, $inst_split[1]))
-                    return true;
-            }
-            elseif (strcmp($inst_split[0], 'INST') == 0)
-            {
-                if (Ibis::isMemberOfInst($person, $inst_split[1]))
-                    return true;
-            }
-        }
-    }
-    return false;
+    return Visibility::allows($visibility, is_user_logged_in(), $crsid, $memberships);
 }
     
 function showPost($aPosts = array())
 {
     $aShowPosts = array();
     $userCRSID = '';
-    if (is_user_logged_in())
+    $loggedIn = is_user_logged_in();
+    if ($loggedIn)
     {
         $currentUser = getCurrentUser();
         $userCRSID = $currentUser->user_login;
     }
+    
+    // Decide on every post at once: one meta query for all of their
+    // visibility, and at most one Lookup for the user (which the person
+    // cache then memoises for any later filters in this request)
+    $postIDs = array();
+    foreach ($aPosts as $aPost)
+        $postIDs[] = $aPost->ID;
+    $access = Visibility::evaluate($postIDs, $loggedIn, $userCRSID);
+    
     foreach ($aPosts as $aPost)
     {
-        if (!userCanAccessPost($aPost->ID,$userCRSID))
+        if (!$access[$aPost->ID])
         {
             //$aPost->post_title = "Restricted Content";
             $postContent = get_field('error_message', $aPost->ID);
             $excerptContent = $postContent;
-            if (!is_user_logged_in())
+            if (!$loggedIn)
             {
                 $postContent .= '<p>You may be able to access this content if you <a href="' . wp_login_url() . '?redirect_to=' . get_permalink($aPost->ID) . '">login</a>.</p>';
                 $excerptContent .= ' <a href="' . wp_login_url() . '?redirect_to=' . get_permalink($aPost->ID) . '">Try logging in?</a>.';
@@ -27,6 +27,9 @@ class Config {
         'cookie_key' => 'rand0m+alphanum3r!icstr!n&',
         'salt'       => '',
         'colleges'   => '',
+        'ibis_cache_ttl'  => 3600,
+        'ibis_cache_size' => 1000,
+        'sync_max_age'    => 7200,
     );
 
     /**
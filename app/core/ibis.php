@@ -24,6 +24,83 @@ require_once(WPRavenAuth_dir . '/app/lib/ibis-client/ibisclient/methods/PersonMe
     
 class Ibis {
     
+    /**
+     * PERSON_FETCH
+     * The attributes and references fetched for each person: the college
+     * attribute and institutions, which the membership checks below use.
+     */
+    const PERSON_FETCH = 'jdCollege,all_insts';
+    
+    /**
+     * $ibisConn
+     * The connection to Ibis, created on first use.
+     *
+     * @var    ClientConnection
+     * @access protected
+     */
+    protected static $ibisConn = null;
+    
+    /**
+     * $ibisPM
+     * The PersonMethods object for the connection, created on first use.
+     *
+     * @var    PersonMethods
+     * @access protected
+     */
+    protected static $ibisPM = null;
+    
+    /**
+     * $personCache
+     * The cache of people fetched by getPerson, created on first use.
+     *
+     * @var    PersonCache
+     * @access protected
+     */
+    protected static $personCache = null;
+    
+    /**
+     * $mirror
+     * The local mirror of Lookup kept by Sync, if any, which getPerson
+     * reads people from before asking Lookup.
+     *
+     * @var    WPSyncStore
+     * @access protected
+     */
+    protected static $mirror = null;
+    
+    /**
+     * ibisConnection
+     * Get the connection to Ibis
+     *
+     * @access public
+     *
+     * @returns IbisClientConnection
+     */
+    public static function ibisConnection()
+    {
+        if(is_null(Ibis::$ibisConn)) {
+            Ibis::$ibisConn = \IbisClientConnection::createConnection();
+        }
+        
+        return Ibis::$ibisConn;
+    }
+    
+    /**
+     * setConnection
+     * Use a different connection to Ibis (e.g. a test server)
+     *
+     * @param ClientConnection $conn The connection.
+     *
+     * @access public
+     *
+     * @returns void
+     */
+    public static function setConnection($conn)
+    {
+        Ibis::$ibisConn = $conn;
+        Ibis::$ibisPM = null;
+    }
+    
     /**
      * ibisPM
      * Get a PersonMethods obejct for Ibis
@@ -34,23 +111,95 @@ class Ibis {
      */
     protected static function ibisPM()
     {
-        static $ibisConn = null;
-        static $ibisPM = null;
-        
-        if(is_null($ibisConn)) {
-            $ibisConn = \IbisClientConnection::createConnection();
+        if(is_null(Ibis::$ibisPM)) {
+            Ibis::$ibisPM = new \PersonMethods(Ibis::ibisConnection());
         }
         
-        if(is_null($ibisPM)) {
-            $ibisPM = new \PersonMethods($ibisConn);
+        return Ibis::$ibisPM;
+    }
+    
+    /**
+     * personCache
+     * Get the cache of people, configured by the ibis_cache_ttl and
+     * ibis_cache_size options
+     *
+     * @access public
+     *
+     * @returns PersonCache
+     */
+    public static function personCache()
+    {
+        if(is_null(Ibis::$personCache)) {
+            Ibis::$personCache = new PersonCache(Config::get('ibis_cache_ttl'),
+                                                 Config::get('ibis_cache_size'));
         }
         
-        return $ibisPM;
+        return Ibis::$personCache;
+    }
+    
+    /**
+     * setPersonCache
+     * Use a different cache of people
+     *
+     * @param PersonCache $cache The cache.
+     *
+     * @access public
+     *
+     * @returns void
+     */
+    public static function setPersonCache($cache)
+    {
+        Ibis::$personCache = $cache;
+    }
+    
+    /**
+     * setMirror
+     * Read people from a local mirror of Lookup (normally the WPSyncStore
+     * kept up to date by Sync), when they are not in the person cache
+     *
+     * @param WPSyncStore $mirror The mirror, or null to always ask Lookup.
+     *
+     * @access public
+     *
+     * @returns void
+     */
+    public static function setMirror($mirror)
+    {
+        Ibis::$mirror = $mirror;
+    }
+    
+    /**
+     * lookup
+     * Fetches a person from Ibis, or from the person cache if they have been
+     * fetched recently, or from the mirror if they are mirrored
+     *
+     * @param string $crsid User's CRSID.
+     *
+     * @access protected
+     *
+     * @return array The person and their membership set.
+     */
+    protected static function lookup($crsid)
+    {
+        $cache = Ibis::personCache();
+        $entry = $cache->get($crsid);
+        if ($entry === false)
+        {
+            $person = is_null(Ibis::$mirror) ? null : Ibis::$mirror->get('person', $crsid);
+            if (is_null($person))
+            {
+                $pm = Ibis::ibisPM();
+                $person = $pm->getPerson("crsid", $crsid, Ibis::PERSON_FETCH);
+            }
+            $entry = $cache->set($crsid, $person);
+        }
+        return $entry;
     }
     
     /**
      * getPerson
-     * Fetches a person and their attributes from Ibis
+     * Fetches a person and their attributes from Ibis, or from the person
+     * cache if they have been fetched recently
      *
      * @param string $crsid User's CRSID.
      *
@@ -60,15 +209,89 @@ class Ibis {
      */
     public static function getPerson($crsid)
     {
-        $pm = Ibis::ibisPM();
-        return $pm->getPerson("crsid", $crsid, "jdCollege,all_insts");
+        $entry = Ibis::lookup($crsid);
+        return $entry['person'];
+    }
+    
+    /**
+     * getMemberships
+     * Fetches a person's membership set (see membershipSet), which is built
+     * once when they are cached
+     *
+     * @param string $crsid User's CRSID.
+     *
+     * @access public
+     *
+     * @return array
+     */
+    public static function getMemberships($crsid)
+    {
+        $entry = Ibis::lookup($crsid);
+        return $entry['memberships'];
+    }
+    
+    /**
+     * membershipSet
+     * Builds the set of a person's college and institutions, keyed in the
+     * same form as the custom_visibility choices ('COLL-<collegeID>' and
+     * 'INST-<instID>'), so that each visibility rule is checked with a
+     * single isset
+     *
+     * @param IbisPerson $person The person, or null.
+     *
+     * @access public
+     *
+     * @return array
+     */
+    public static function membershipSet($person)
+    {
+        $set = array();
+        if (is_null($person))
+            return $set;
+        
+        if (!empty($person->attributes))
+        {
+            foreach ($person->attributes as $attr)
+            {
+                if (strcmp($attr->scheme, 'jdCollege') == 0)
+                    $set['COLL-' . $attr->value] = true;
+            }
+        }
+        if (!empty($person->institutions))
+        {
+            foreach ($person->institutions as $inst)
+                $set['INST-' . $inst->instid] = true;
+        }
+        return $set;
+    }
+    
+    /**
+     * matchesAny
+     * Checks whether a membership set satisfies any of a list of visibility
+     * rules
+     *
+     * @param array $memberships The membership set, from getMemberships.
+     * @param array $rules The 'COLL-' and 'INST-' rules.
+     *
+     * @access public
+     *
+     * @return Boolean
+     */
+    public static function matchesAny($memberships, $rules)
+    {
+        foreach ($rules as $rule)
+        {
+            if (isset($memberships[$rule]))
+                return true;
+        }
+        return false;
     }
     
     /**
      * isMemberOfCollege
      * Checks whether a person belongs to a certain college
      *
-     * @param string $crsid User's CRSID.
+     * @param IbisPerson $person The person.
      * @param string $collegeID The college identifier. Full list can be obtained from
      *                                  https://www.lookup.cam.ac.uk/api/v1/inst/COLL?fetch=child_insts
      *
@@ -78,7 +301,8 @@ class Ibis {
      */
     public static function isMemberOfCollege($person, $collegeID)
     {
-        return (strcmp($person->attributes[0]->value, $collegeID) == 0);
+        $memberships = Ibis::membershipSet($person);
+        return isset($memberships['COLL-' . $collegeID]);
     }
     
     /**
@@ -107,4 +331,362 @@ class Ibis {
         return $result;
     }
 }
+
+/**
+ * PersonCache
+ * Caches the people fetched from Ibis, with their membership sets, in memory
+ * for the rest of the request and in WordPress transients (and so in the
+ * object cache, if there is one) for later requests. Cached people expire
+ * after a TTL, and the least recently used are evicted when there are more
+ * than a maximum number. People who don't exist are cached for a shorter
+ * TTL, and aren't counted.
+ */
+class PersonCache {
+    /**
+     * The prefix of the transient holding each cached person.
+     */
+    const TRANSIENT = 'WPRavenAuthIbisPerson_';
+    
+    /**
+     * The option holding the cached CRSids, least recently used first, with
+     * the time each was last used.
+     */
+    const INDEX_OPTION = 'WPRavenAuthIbisPersonIndex';
+    
+    /**
+     * The number of seconds for which unknown people are cached (or the
+     * TTL, if that is shorter).
+     */
+    const UNKNOWN_TTL = 300;
+    
+    /**
+     * $ttl
+     * The number of seconds for which people are cached.
+     *
+     * @var    int
+     * @access protected
+     */
+    protected $ttl;
+    
+    /**
+     * $size
+     * The maximum number of people cached.
+     *
+     * @var    int
+     * @access protected
+     */
+    protected $size;
+    
+    /**
+     * $memo
+     * The entries fetched in this request, by lowercase CRSid.
+     *
+     * @var    array
+     * @access protected
+     */
+    protected $memo = array();
+    
+    /**
+     * $index
+     * The cached CRSids, loaded on first use.
+     *
+     * @var    array
+     * @access protected
+     */
+    protected $index = null;
+    
+    /**
+     * $dirty
+     * Whether the index has changed since it was loaded, and so needs to be
+     * written by flush.
+     *
+     * @var    boolean
+     * @access protected
+     */
+    protected $dirty = false;
+    
+    /**
+     * $stats
+     * Counts of the lookups answered from this request's memo ('memo_hits')
+     * and from the persistent cache ('hits'), of the lookups that were not
+     * ('misses'), and of the people evicted, for this request.
+     *
+     * @var    array
+     * @access protected
+     */
+    protected $stats = array(
+        'memo_hits' => 0,
+        'hits'      => 0,
+        'misses'    => 0,
+        'evictions' => 0,
+    );
+    
+    /**
+     * Constructor
+     *
+     * @param int $ttl  the number of seconds for which people are cached
+     * @param int $size the maximum number of people cached
+     */
+    public function __construct($ttl = 3600, $size = 1000)
+    {
+        $this->ttl = max(1, intval($ttl));
+        $this->size = max(1, intval($size));
+        
+        // Write the index once, at the end of the request
+        if (function_exists('add_action'))
+            add_action('shutdown', array($this, 'flush'));
+    }
+    
+    /**
+     * get
+     * Retrieves a cached person, as an entry holding the person ('person',
+     * null if they are known not to exist) and their membership set
+     * ('memberships').
+     *
+     * @access public
+     *
+     * @param  string      $crsid the person's CRSid
+     * @return array|false        the entry, or false if they are not cached
+     */
+    public function get($crsid)
+    {
+        $crsid = strtolower($crsid);
+        if (isset($this->memo[$crsid])) {
+            $this->stats['memo_hits']++;
+            return $this->memo[$crsid];
+        }
+        
+        $entry = $this->fetch($crsid);
+        if (!is_array($entry)) {
+            $this->stats['misses']++;
+            return false;
+        }
+        
+        $this->stats['hits']++;
+        $this->memo[$crsid] = $entry;
+        if (!is_null($entry['person']))
+            $this->touch($crsid, false);
+        return $entry;
+    }
+    
+    /**
+     * set
+     * Caches a person, building their membership set.
+     *
+     * @access public
+     *
+     * @param  string          $crsid  the person's CRSid
+     * @param  IbisPerson|null $person the person, or null if they don't exist
+     * @return array                   the new entry
+     */
+    public function set($crsid, $person)
+    {
+        $crsid = strtolower($crsid);
+        $entry = array(
+            'person'      => $person,
+            'memberships' => Ibis::membershipSet($person),
+        );
+        $this->memo[$crsid] = $entry;
+        if (!is_null($person)) {
+            $this->store($crsid, $entry, $this->ttl);
+            $this->touch($crsid, true);
+        } else {
+            $this->store($crsid, $entry, min($this->ttl, self::UNKNOWN_TTL));
+        }
+        return $entry;
+    }
+    
+    /**
+     * forget
+     * Removes a person from the cache, so they are fetched again.
+     *
+     * @access public
+     *
+     * @param  string $crsid the person's CRSid
+     * @return void
+     */
+    public function forget($crsid)
+    {
+        $crsid = strtolower($crsid);
+        unset($this->memo[$crsid]);
+        $this->discard($crsid);
+        
+        $this->loadIndex();
+        if (isset($this->index[$crsid])) {
+            unset($this->index[$crsid]);
+            $this->dirty = true;
+        }
+    }
+    
+    /**
+     * flush
+     * Writes the index to the database, if it has changed in this request.
+     * This is called at the end of the request.
+     *
+     * @access public
+     *
+     * @return void
+     */
+    public function flush()
+    {
+        if ($this->dirty) {
+            $this->saveIndex($this->index);
+            $this->dirty = false;
+        }
+    }
+    
+    /**
+     * stats
+     * The hit, miss and eviction counts for this request.
+     *
+     * @access public
+     *
+     * @return array the counts
+     */
+    public function stats()
+    {
+        return $this->stats;
+    }
+    
+    /**
+     * touch
+     * Marks a person as the most recently used, dropping expired people from
+     * the index and evicting the least recently used if the cache is full.
+     * To save changing the index on every hit, a hit only marks a person if
+     * they were last marked more than a tenth of the TTL ago. The index is
+     * written by flush.
+     *
+     * @access protected
+     *
+     * @param  string  $crsid the person's (lowercase) CRSid
+     * @param  boolean $force whether to mark the person regardless
+     * @return void
+     */
+    protected function touch($crsid, $force)
+    {
+        $this->loadIndex();
+        $now = $this->now();
+        if (!$force && isset($this->index[$crsid]) &&
+            $now - $this->index[$crsid] < $this->ttl / 10)
+            return;
+        
+        unset($this->index[$crsid]);
+        $this->index[$crsid] = $now;
+        
+        // The index is in order of use, so expired people are at the front
+        reset($this->index);
+        while (current($this->index) <= $now - $this->ttl) {
+            unset($this->index[key($this->index)]);
+            reset($this->index);
+        }
+        
+        while (sizeof($this->index) > $this->size) {
+            reset($this->index);
+            $oldest = key($this->index);
+            unset($this->index[$oldest]);
+            $this->discard($oldest);
+            $this->stats['evictions']++;
+        }
+        
+        $this->dirty = true;
+    }
+    
+    /**
+     * loadIndex
+     * Loads the index, if it has not been loaded yet.
+     *
+     * @access protected
+     * @return void
+     */
+    protected function loadIndex()
+    {
+        if (is_null($this->index)) {
+            $index = $this->readIndex();
+            $this->index = is_array($index) ? $index : array();
+        }
+    }
+    
+    /**
+     * fetch
+     * Reads an entry from the persistent cache.
+     *
+     * @access protected
+     *
+     * @param  string      $crsid the person's (lowercase) CRSid
+     * @return array|false        the entry, or false if not cached
+     */
+    protected function fetch($crsid)
+    {
+        return get_transient(self::TRANSIENT . $crsid);
+    }
+    
+    /**
+     * store
+     * Writes an entry to the persistent cache.
+     *
+     * @access protected
+     *
+     * @param  string $crsid the person's (lowercase) CRSid
+     * @param  array  $entry the entry
+     * @param  int    $ttl   the number of seconds for which to cache it
+     * @return void
+     */
+    protected function store($crsid, $entry, $ttl)
+    {
+        set_transient(self::TRANSIENT . $crsid, $entry, $ttl);
+    }
+    
+    /**
+     * discard
+     * Deletes a person from the persistent cache.
+     *
+     * @access protected
+     *
+     * @param  string $crsid the person's (lowercase) CRSid
+     * @return void
+     */
+    protected function discard($crsid)
+    {
+        delete_transient(self::TRANSIENT . $crsid);
+    }
+    
+    /**
+     * readIndex
+     * Reads the index from the database.
+     *
+     * @access protected
+     * @return array|false the index, or false if there isn't one
+     */
+    protected function readIndex()
+    {
+        return get_option(self::INDEX_OPTION);
+    }
+    
+    /**
+     * saveIndex
+     * Writes the index to the database. It isn't autoloaded, since it is
+     * only needed when someone is looked up.
+     *
+     * @access protected
+     *
+     * @param  array $index the index
+     * @return void
+     */
+    protected function saveIndex($index)
+    {
+        update_option(self::INDEX_OPTION, $index, false);
+    }
+    
+    /**
+     * now
+     * The current time.
+     *
+     * @access protected
+     * @return int the current Unix timestamp
+     */
+    protected function now()
+    {
+        return time();
+    }
+}
 ?>
\ No newline at end of file
@@ -0,0 +1,411 @@
+<?php
+/*
+    Sync
+    ----
+
+    Keeps a local mirror of Lookup people, institutions and groups up to date,
+    by fetching only the entities modified since the last sync.
+
+    @file    sync.php
+    @license BSD 3-Clause
+    @package WPRavenAuth
+    @author  Gideon Farrell <me@gideonfarrell.co.uk>
+ */
+
+namespace WPRavenAuth;
+
+if(!defined('DS'))
+    define('DS', '/');
+if (!defined('WPRavenAuth_dir'))
+    define('WPRavenAuth_dir', substr(__FILE__, 0, strpos(__FILE__, 'app') - 1));
+
+require_once(WPRavenAuth_dir . '/app/core/ibis.php');
+require_once(WPRavenAuth_dir . '/app/lib/ibis-client/ibisclient/client/IbisBatch.php');
+require_once(WPRavenAuth_dir . '/app/lib/ibis-client/ibisclient/methods/IbisMethods.php');
+require_once(WPRavenAuth_dir . '/app/lib/ibis-client/ibisclient/methods/PersonMethods.php');
+require_once(WPRavenAuth_dir . '/app/lib/ibis-client/ibisclient/methods/InstitutionMethods.php');
+require_once(WPRavenAuth_dir . '/app/lib/ibis-client/ibisclient/methods/GroupMethods.php');
+
+/**
+ * SyncStore
+ * The local store that Sync mirrors Lookup entities into. The entity types
+ * are 'person', 'inst' and 'group', and each entity is keyed on its CRSid,
+ * instid or groupid.
+ */
+interface SyncStore {
+    /**
+     * getLastTransactionId
+     * The Lookup transaction id that the store is up to date with.
+     *
+     * @return int|null the transaction id, or null if never synced
+     */
+    public function getLastTransactionId();
+
+    /**
+     * setLastTransactionId
+     * Records that the store is up to date with a Lookup transaction id.
+     *
+     * @param  int  $txId the transaction id
+     * @return void
+     */
+    public function setLastTransactionId($txId);
+
+    /**
+     * setLastSyncTime
+     * Records the time of the last sync that completed successfully.
+     *
+     * @param  int  $time the Unix timestamp
+     * @return void
+     */
+    public function setLastSyncTime($time);
+
+    /**
+     * getIds
+     * The ids of the entities of a type that should be mirrored.
+     *
+     * @param  string   $type the entity type
+     * @return string[]       the ids
+     */
+    public function getIds($type);
+
+    /**
+     * save
+     * Adds or replaces an entity in the store.
+     *
+     * @param  string $type   the entity type
+     * @param  string $id     the entity's id
+     * @param  object $entity the IbisPerson, IbisInstitution or IbisGroup
+     * @return void
+     */
+    public function save($type, $id, $entity);
+
+    /**
+     * remove
+     * Removes an entity (which has been cancelled, or no longer exists) from
+     * the store.
+     *
+     * @param  string $type the entity type
+     * @param  string $id   the entity's id
+     * @return void
+     */
+    public function remove($type, $id);
+}
+
+class Sync {
+    /**
+     * $txnBatchSize
+     * The maximum number of Lookup transactions whose changes are fetched
+     * at once. The store's transaction id is saved after each batch, so an
+     * interrupted sync resumes from the last complete batch.
+     *
+     * @var    int
+     * @access protected
+     */
+    protected $txnBatchSize = 1000;
+
+    /**
+     * $fetch
+     * The attributes and references fetched for each entity type.
+     *
+     * @var    array
+     * @access protected
+     */
+    protected $fetch = array(
+        'person' => Ibis::PERSON_FETCH,
+        'inst'   => null,
+        'group'  => null,
+    );
+
+    protected $store;
+    protected $m;
+    protected $pm;
+    protected $im;
+    protected $gm;
+
+    /**
+     * Constructor
+     *
+     * @param ClientConnection $conn    the connection to Lookup
+     * @param SyncStore        $store   the local store
+     * @param array            $options 'txnBatchSize' and/or 'fetch' (per type)
+     */
+    public function __construct($conn, $store, $options = array())
+    {
+        $this->store = $store;
+        $this->m = new \IbisMethods($conn);
+        $this->pm = new \PersonMethods($conn);
+        $this->im = new \InstitutionMethods($conn);
+        $this->gm = new \GroupMethods($conn);
+
+        if (isset($options['txnBatchSize']))
+            $this->txnBatchSize = max(1, intval($options['txnBatchSize']));
+        if (isset($options['fetch']))
+            $this->fetch = array_merge($this->fetch, $options['fetch']);
+    }
+
+    /**
+     * run
+     * Brings the store up to date with Lookup. The first sync loads every
+     * entity in the store; later syncs fetch only the entities modified
+     * since the last one, in batches of transactions and of ids. The time
+     * is recorded once the store is up to date.
+     *
+     * @access public
+     *
+     * @return array the number of entities saved and removed, by type
+     */
+    public function run()
+    {
+        $stats = array();
+        foreach (array_keys($this->fetch) as $type)
+            $stats[$type] = array('saved' => 0, 'removed' => 0);
+
+        $latest = $this->m->getLastTransactionId();
+        $last = $this->store->getLastTransactionId();
+
+        // The ids to mirror are only read once per sync
+        $ids = array();
+        foreach (array_keys($this->fetch) as $type)
+            $ids[$type] = $this->store->getIds($type);
+
+        if (is_null($last)) {
+            // The transaction id is read before loading, so anything that
+            // changes during the load is fetched again next time
+            foreach (array_keys($this->fetch) as $type)
+                $this->load($type, $ids[$type], $stats);
+            $this->store->setLastTransactionId($latest);
+        } else {
+            for ($minTxId = $last; $minTxId < $latest; $minTxId = $maxTxId) {
+                $maxTxId = min($minTxId + $this->txnBatchSize, $latest);
+                foreach (array_keys($this->fetch) as $type)
+                    $this->update($type, $ids[$type], $minTxId, $maxTxId, $stats);
+                $this->store->setLastTransactionId($maxTxId);
+            }
+        }
+
+        $this->store->setLastSyncTime(time());
+        return $stats;
+    }
+
+    /**
+     * load
+     * Loads every entity of a type into the store, removing any that Lookup
+     * no longer returns.
+     *
+     * @access protected
+     *
+     * @param  string   $type   the entity type
+     * @param  string[] $ids    the ids of the entities to mirror
+     * @param  array    &$stats the counts to update
+     * @return void
+     */
+    protected function load($type, $ids, &$stats)
+    {
+        if (empty($ids))
+            return;
+
+        $fetch = $this->fetch[$type];
+        if ($type == 'person')
+            $entities = $this->pm->listPeopleBatched($ids, $fetch);
+        elseif ($type == 'inst')
+            $entities = $this->im->listInstsBatched($ids, $fetch);
+        else
+            $entities = $this->gm->listGroupsBatched($ids, $fetch);
+
+        $found = array();
+        foreach ($entities as $entity)
+            $found[strtolower($this->apply($type, $entity, $stats))] = true;
+
+        foreach ($ids as $id) {
+            if (!isset($found[strtolower($id)])) {
+                $this->store->remove($type, $id);
+                $stats[$type]['removed']++;
+            }
+        }
+    }
+
+    /**
+     * update
+     * Applies the changes to entities of a type made in a range of
+     * transactions.
+     *
+     * @access protected
+     *
+     * @param  string   $type    the entity type
+     * @param  string[] $ids     the ids of the entities to mirror
+     * @param  int      $minTxId changes after (but not including) this transaction
+     * @param  int      $maxTxId changes up to and including this transaction
+     * @param  array    &$stats  the counts to update
+     * @return void
+     */
+    protected function update($type, $ids, $minTxId, $maxTxId, &$stats)
+    {
+        if (empty($ids))
+            return;
+
+        $fetch = $this->fetch[$type];
+        foreach (\IbisBatch::batchIds(\IbisBatch::uniqueIds($ids)) as $chunk) {
+            if ($type == 'person')
+                $entities = $this->pm->modifiedPeople($minTxId, $maxTxId, $chunk,
+                                                      true, true, false, $fetch);
+            elseif ($type == 'inst')
+                $entities = $this->im->modifiedInsts($minTxId, $maxTxId, $chunk,
+                                                     true, false, false, $fetch);
+            else
+                $entities = $this->gm->modifiedGroups($minTxId, $maxTxId, $chunk,
+                                                      true, false, $fetch);
+
+            if (!empty($entities)) {
+                foreach ($entities as $entity)
+                    $this->apply($type, $entity, $stats);
+            }
+        }
+    }
+
+    /**
+     * apply
+     * Saves an entity to the store, or removes it if it has been cancelled.
+     *
+     * @access protected
+     *
+     * @param  string $type    the entity type
+     * @param  object $entity  the entity
+     * @param  array  &$stats  the counts to update
+     * @return string          the entity's id
+     */
+    protected function apply($type, $entity, &$stats)
+    {
+        $id = \IbisBatch::resultCursor($entity);
+        if ($entity->cancelled) {
+            $this->store->remove($type, $id);
+            $stats[$type]['removed']++;
+        } else {
+            $this->store->save($type, $id, $entity);
+            $stats[$type]['saved']++;
+        }
+        return $id;
+    }
+}
+
+class WPSyncStore implements SyncStore {
+    /**
+     * The option holding the last transaction id synced.
+     */
+    const TXN_OPTION = 'WPRavenAuthSyncTxId';
+
+    /**
+     * The option holding the time of the last successful sync.
+     */
+    const TIME_OPTION = 'WPRavenAuthSyncTime';
+
+    /**
+     * The prefix of the option holding each mirrored entity.
+     */
+    const ENTITY_OPTION = 'WPRavenAuthIbis_';
+
+    /**
+     * get
+     * Retrieves a mirrored entity. Ibis::lookup reads mirrored people from
+     * here (see Ibis::setMirror) before asking Lookup. Nothing is read once
+     * the mirror is out of date (see isFresh), so that a sync that stops
+     * running can't leave people with their old memberships.
+     *
+     * @access public
+     *
+     * @param  string      $type the entity type
+     * @param  string      $id   the entity's id
+     * @return object|null       the entity, or null if not mirrored
+     */
+    public function get($type, $id)
+    {
+        if (!$this->isFresh())
+            return null;
+
+        $entity = get_option(self::ENTITY_OPTION . $type . '_' . strtolower($id));
+        return $entity ? $entity : null;
+    }
+
+    public function getLastTransactionId()
+    {
+        $txId = get_option(self::TXN_OPTION);
+        return ($txId === false) ? null : intval($txId);
+    }
+
+    public function setLastTransactionId($txId)
+    {
+        update_option(self::TXN_OPTION, $txId);
+    }
+
+    public function setLastSyncTime($time)
+    {
+        update_option(self::TIME_OPTION, $time);
+    }
+
+    /**
+     * isFresh
+     * Whether the last successful sync was recent enough (within the
+     * sync_max_age option) for the mirror to be used.
+     *
+     * @access public
+     *
+     * @return boolean
+     */
+    public function isFresh()
+    {
+        $time = get_option(self::TIME_OPTION);
+        return $time !== false && time() - intval($time) <= intval(Config::get('sync_max_age'));
+    }
+
+    /**
+     * getIds
+     * People are mirrored for every WordPress user, and institutions for
+     * every institution available for post visibility. No groups are
+     * mirrored.
+     */
+    public function getIds($type)
+    {
+        $ids = array();
+        if ($type == 'person') {
+            foreach (get_users(array('fields' => array('user_login'))) as $user)
+                $ids[] = $user->user_login;
+        } elseif ($type == 'inst') {
+            global $available_colleges;
+            $colleges = Config::get('colleges');
+            if (is_array($colleges)) {
+                foreach ($colleges as $college) {
+                    $ids[] = $college;
+                    if (isset($available_colleges[$college])) {
+                        foreach (array_keys($available_colleges[$college]) as $inst) {
+                            $inst_split = explode('-', $inst);
+                            if (strcmp($inst_split[0], 'INST') == 0)
+                                $ids[] = $inst_split[1];
+                        }
+                    }
+                }
+            }
+        }
+        return $ids;
+    }
+
+    /**
+     * save
+     * Mirrors an entity. A person is only dropped from the person cache, so
+     * that the cache refills itself (from the mirror) when they are next
+     * looked up, rather than every mirrored person being pushed into it.
+     */
+    public function save($type, $id, $entity)
+    {
+        update_option(self::ENTITY_OPTION . $type . '_' . strtolower($id), $entity, false);
+
+        if ($type == 'person')
+            Ibis::personCache()->forget($id);
+    }
+
+    public function remove($type, $id)
+    {
+        delete_option(self::ENTITY_OPTION . $type . '_' . strtolower($id));
+        if ($type == 'person')
+            Ibis::personCache()->forget($id);
+    }
+}
+?>
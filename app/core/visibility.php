@@ -0,0 +1,276 @@
+<?php
+/*
+    Visibility
+    ----------
+
+    Compiles each post's custom_visibility choices when they are saved, and
+    stores the compiled form with the post so that a whole page of posts can
+    be checked with a single meta query. The compiled form records a hash of
+    the choices it was compiled from, so that it is recompiled (in memory,
+    when the post is shown) if they have been changed some other way.
+
+    @file    visibility.php
+    @license BSD 3-Clause
+    @package WPRavenAuth
+    @author  Gideon Farrell <me@gideonfarrell.co.uk>
+ */
+
+namespace WPRavenAuth;
+
+if(!defined('DS'))
+    define('DS', '/');
+if (!defined('WPRavenAuth_dir'))
+    define('WPRavenAuth_dir', substr(__FILE__, 0, strpos(__FILE__, 'app') - 1));
+
+class Visibility {
+    /**
+     * The post meta key holding a post's compiled visibility.
+     */
+    const META_KEY = '_WPRavenAuthVisibility';
+
+    /**
+     * The post meta key holding a post's custom_visibility choices (the ACF
+     * field's name).
+     */
+    const SOURCE_KEY = 'custom_visibility';
+
+    /**
+     * The visibility levels, in order of precedence: public posts can be
+     * seen by anyone, raven posts by anyone logged in, and members posts by
+     * those satisfying one of the rules.
+     */
+    const LEVEL_PUBLIC  = 'public';
+    const LEVEL_RAVEN   = 'raven';
+    const LEVEL_MEMBERS = 'members';
+
+    /**
+     * compile
+     * Compiles the custom_visibility choices into a level and, for members
+     * posts, the list of 'COLL-' and 'INST-' rules to match against a
+     * user's membership set.
+     *
+     * @static
+     * @access public
+     * @param  mixed $choices the field value (anything but an array is public)
+     * @return array          the compiled visibility ('level' and 'rules')
+     */
+    public static function compile($choices) {
+        if(!is_array($choices) || in_array('public', $choices)) {
+            return array('level' => self::LEVEL_PUBLIC, 'rules' => array());
+        }
+        if(in_array('raven', $choices)) {
+            return array('level' => self::LEVEL_RAVEN, 'rules' => array());
+        }
+
+        $rules = array();
+        foreach($choices as $choice) {
+            if(strncmp($choice, 'COLL-', 5) == 0 || strncmp($choice, 'INST-', 5) == 0) {
+                $rules[$choice] = true;
+            }
+        }
+        return array('level' => self::LEVEL_MEMBERS, 'rules' => array_keys($rules));
+    }
+
+    /**
+     * sourceHash
+     * Hashes a post's custom_visibility choices, to record which choices
+     * its visibility was compiled from.
+     *
+     * @static
+     * @access public
+     * @param  mixed  $choices the field value
+     * @return string          the hash
+     */
+    public static function sourceHash($choices) {
+        return md5(serialize($choices));
+    }
+
+    /**
+     * compileForStorage
+     * Compiles the custom_visibility choices (see compile), adding the hash
+     * of the choices ('source').
+     *
+     * @static
+     * @access public
+     * @param  mixed $choices the field value
+     * @return array          the compiled visibility to store
+     */
+    public static function compileForStorage($choices) {
+        $compiled = self::compile($choices);
+        $compiled['source'] = self::sourceHash($choices);
+        return $compiled;
+    }
+
+    /**
+     * current
+     * Returns a post's stored visibility if it was compiled from its current
+     * custom_visibility choices, or else compiles them now.
+     *
+     * @static
+     * @access public
+     * @param  mixed $stored  the stored visibility, if any
+     * @param  mixed $choices the field value
+     * @return array          the compiled visibility
+     */
+    public static function current($stored, $choices) {
+        if(is_array($stored) && isset($stored['level'], $stored['source']) &&
+           $stored['source'] === self::sourceHash($choices)) {
+            return $stored;
+        }
+        return self::compileForStorage($choices);
+    }
+
+    /**
+     * store
+     * Compiles and stores a post's visibility, unless the stored visibility
+     * was already compiled from the same choices.
+     *
+     * @static
+     * @access public
+     * @param  int   $postID  the post id
+     * @param  mixed $choices the field value
+     * @return void
+     */
+    public static function store($postID, $choices) {
+        $stored = get_post_meta($postID, self::META_KEY, true);
+        $compiled = self::current($stored, $choices);
+        if($compiled !== $stored) {
+            update_post_meta($postID, self::META_KEY, $compiled);
+        }
+    }
+
+    /**
+     * updateValue
+     * Compiles and stores a post's visibility whenever ACF saves its
+     * custom_visibility field (hooked to acf/update_value).
+     *
+     * @static
+     * @access public
+     * @param  mixed      $value   the field value
+     * @param  int|string $post_id the post id (or 'options', 'user_1', ...)
+     * @param  array      $field   the field
+     * @return mixed               the unchanged value
+     */
+    public static function updateValue($value, $post_id, $field = null) {
+        if(is_numeric($post_id)) {
+            self::store($post_id, $value);
+        }
+        return $value;
+    }
+
+    /**
+     * metaChanged
+     * Compiles and stores a post's visibility whenever its custom_visibility
+     * meta is added or updated by anything other than ACF (hooked to
+     * added_post_meta and updated_post_meta).
+     *
+     * @static
+     * @access public
+     * @param  int    $metaID   the meta id
+     * @param  int    $postID   the post id
+     * @param  string $metaKey  the meta key
+     * @param  mixed  $value    the new meta value
+     * @return void
+     */
+    public static function metaChanged($metaID, $postID, $metaKey, $value) {
+        if($metaKey === self::SOURCE_KEY) {
+            self::store($postID, $value);
+        }
+    }
+
+    /**
+     * forPosts
+     * Retrieves the compiled visibility of many posts, priming the meta
+     * cache for all of them with a single query. Posts whose stored
+     * visibility is missing or out of date (see current) are compiled now,
+     * but nothing is stored, since this is called when posts are shown.
+     *
+     * @static
+     * @access public
+     * @param  int[] $postIDs the post ids
+     * @return array          the compiled visibility, by post id
+     */
+    public static function forPosts($postIDs) {
+        $postIDs = array_unique(array_map('intval', $postIDs));
+        if(empty($postIDs)) {
+            return array();
+        }
+
+        update_meta_cache('post', $postIDs);
+
+        $visibility = array();
+        foreach($postIDs as $postID) {
+            $visibility[$postID] = self::current(get_post_meta($postID, self::META_KEY, true),
+                                                 get_post_meta($postID, self::SOURCE_KEY, true));
+        }
+        return $visibility;
+    }
+
+    /**
+     * forPost
+     * Retrieves the compiled visibility of a post.
+     *
+     * @static
+     * @access public
+     * @param  int   $postID the post id
+     * @return array         the compiled visibility
+     */
+    public static function forPost($postID) {
+        $visibility = self::forPosts(array($postID));
+        return reset($visibility);
+    }
+
+    /**
+     * evaluate
+     * Decides which of a set of posts a user can see. The posts' visibility
+     * is fetched together (see forPosts), and the user's membership set is
+     * looked up at most once, and only if one of the posts needs it.
+     *
+     * @static
+     * @access public
+     * @param  int[]   $postIDs  the post ids
+     * @param  boolean $loggedIn whether the user is logged in
+     * @param  string  $crsid    the user's CRSid
+     * @return array             whether the user can see each post, by post id
+     */
+    public static function evaluate($postIDs, $loggedIn, $crsid) {
+        $memberships = null;
+        $access = array();
+        foreach(self::forPosts($postIDs) as $postID => $compiled) {
+            $access[$postID] = self::allows($compiled, $loggedIn, $crsid, $memberships);
+        }
+        return $access;
+    }
+
+    /**
+     * allows
+     * Checks a compiled visibility against a user. The user's membership
+     * set is only needed for members posts, so it is passed by reference
+     * and fetched on first use.
+     *
+     * @static
+     * @access public
+     * @param  array      $compiled     the compiled visibility
+     * @param  boolean    $loggedIn     whether the user is logged in
+     * @param  string     $crsid        the user's CRSid
+     * @param  array|null &$memberships the user's membership set, or null
+     * @return boolean                  whether the user can see the post
+     */
+    public static function allows($compiled, $loggedIn, $crsid, &$memberships = null) {
+        if($compiled['level'] == self::LEVEL_PUBLIC) {
+            return true;
+        }
+        if(!$loggedIn) {
+            return false;
+        }
+        if($compiled['level'] == self::LEVEL_RAVEN) {
+            return true;
+        }
+
+        if(is_null($memberships)) {
+            $memberships = Ibis::getMemberships($crsid);
+        }
+        return Ibis::matchesAny($memberships, $compiled['rules']);
+    }
+}
+?>
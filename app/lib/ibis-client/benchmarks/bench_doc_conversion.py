@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+# --------------------------------------------------------------------------
+# Copyright (c) 2012, University of Cambridge Computing Service
+#
+# This file is part of the Lookup/Ibis client library.
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+
+"""
+Micro-benchmarks of the javadoc conversion functions used by
+generate-client-methods: javadocs_to_pydocs(), javadocs_to_phpdocs() and
+list_items_to_text().
+
+Each converter is timed over the docs of every method in application.wadl,
+both uncached and (where there is a cache) cached, and over a single long
+doc comment with many multi-line <code> blocks and NOTE paragraphs, to show
+how it scales with the length of the docs.
+
+Usage: bench_doc_conversion.py [<generator_file>]
+
+By default the current generate-client-methods.py is measured. Another
+version of it (e.g., from an earlier commit) may be given for comparison.
+"""
+
+import sys
+import timeit
+
+from common import GENERATOR, WADL_FILE, load_generator
+
+REPEAT = 5
+
+def long_docs(num_blocks):
+    docs = [ "    /**" ]
+    for n in range(num_blocks):
+        docs.append("     * NOTE: Paragraph %d refers to {@link #getPerson}" % n)
+        docs.append("     * and {@code null} values.")
+        docs.append("     * <code>")
+        docs.append("     *   example(%d)" % n)
+        docs.append("     * </code>")
+        docs.append("     *")
+    docs.append("     */")
+    return "\n".join(docs)
+
+def best_time(func, number):
+    return min(timeit.repeat(func, repeat=REPEAT, number=number)) / number
+
+def report(name, seconds, count):
+    print("%-40s %9.1f us/doc" % (name, seconds * 1e6 / count))
+
+def clear_caches(gen):
+    for name in ("pydocs_cache", "phpdocs_cache"):
+        cache = getattr(gen, name, None)
+        if cache != None: cache.clear()
+
+if __name__ == "__main__":
+    gen = load_generator(sys.argv[1] if len(sys.argv) > 1 else GENERATOR)
+    if hasattr(gen, "read_wadl"):
+        app = gen.read_wadl(WADL_FILE)
+    else:
+        import xml.dom.minidom
+        app = gen.Application(xml.dom.minidom.parse(WADL_FILE).documentElement)
+
+    methods = [ (cls, method) for cls in app.classes for method in cls.methods ]
+    docs = [ (cls, method, method.get_docs()) for cls, method in methods ]
+    count = len(docs)
+
+    def pydocs():
+        for cls, method, d in docs:
+            gen.javadocs_to_pydocs(d, cls, "        ", method)
+
+    def phpdocs():
+        for cls, method, d in docs:
+            gen.javadocs_to_phpdocs(d)
+
+    def list_items():
+        for cls, method, d in docs:
+            gen.list_items_to_text(d)
+
+    def uncached(func):
+        def run():
+            clear_caches(gen)
+            func()
+        return run
+
+    print("%d method docs from %s\n" % (count, WADL_FILE))
+    report("javadocs_to_pydocs (uncached)", best_time(uncached(pydocs), 5), count)
+    report("javadocs_to_pydocs (cached)", best_time(pydocs, 5), count)
+    report("javadocs_to_phpdocs (uncached)", best_time(uncached(phpdocs), 5), count)
+    report("javadocs_to_phpdocs (cached)", best_time(phpdocs, 5), count)
+    report("list_items_to_text", best_time(list_items, 5), count)
+
+    cls, method = methods[0]
+    for num_blocks in (100, 1000):
+        d = long_docs(num_blocks)
+        print("\nLong docs with %d <code> blocks (%d KB)"
+              % (num_blocks, len(d) // 1024))
+        report("javadocs_to_pydocs (uncached)",
+               best_time(uncached(lambda: gen.javadocs_to_pydocs(d, cls)), 1), 1)
+        report("javadocs_to_phpdocs (uncached)",
+               best_time(uncached(lambda: gen.javadocs_to_phpdocs(d)), 1), 1)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+# --------------------------------------------------------------------------
+# Copyright (c) 2012, University of Cambridge Computing Service
+#
+# This file is part of the Lookup/Ibis client library.
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+
+"""
+Time generate-client-methods runs with the -cache option on a synthetic
+WADL file: a cold run with an empty cache, a no-op re-run, and a re-run
+after the docs of a single top-level resource have been edited.
+
+Usage: bench_generation_cache.py [<lang>] [<num_methods>]
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import GENERATOR, write_synthetic_wadl
+
+def run_generator(lang, out_dir, cache_file, wadl_file):
+    start = time.perf_counter()
+    subprocess.check_call([sys.executable, GENERATOR, "-lang", lang,
+                           "-d", out_dir, "-cache", cache_file, wadl_file],
+                          stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    lang = sys.argv[1] if len(sys.argv) > 1 else "php"
+    min_methods = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        wadl_file = os.path.join(work_dir, "application.wadl")
+        cache_file = os.path.join(work_dir, "cache.json")
+        out_dir = os.path.join(work_dir, "out")
+        os.mkdir(out_dir)
+
+        num_classes, num_methods = write_synthetic_wadl(wadl_file, min_methods)
+        print("Synthetic WADL: %d classes, %d methods (-lang %s)\n"
+              % (num_classes, num_methods, lang))
+
+        print("cold run:              %7.3f s"
+              % run_generator(lang, out_dir, cache_file, wadl_file))
+        print("no-op re-run:          %7.3f s"
+              % run_generator(lang, out_dir, cache_file, wadl_file))
+
+        with open(wadl_file) as f:
+            wadl = f.read()
+        with open(wadl_file, "w") as f:
+            f.write(wadl.replace("Common methods for searching",
+                                 "Common methods for finding", 1))
+        print("one resource changed:  %7.3f s"
+              % run_generator(lang, out_dir, cache_file, wadl_file))
+    finally:
+        shutil.rmtree(work_dir)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+# --------------------------------------------------------------------------
+# Copyright (c) 2012, University of Cambridge Computing Service
+#
+# This file is part of the Lookup/Ibis client library.
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+
+"""
+Profile the generation of the python3 methods module from a large synthetic
+WADL file, reporting the time spent in the string building helpers
+(comment_out() and aligned_output()) and the peak memory allocated while
+the module is streamed to the output file, compared with its size.
+
+Usage: bench_output_assembly.py [<num_methods>]
+"""
+
+import cProfile
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+from common import load_generator, write_synthetic_wadl
+
+HELPERS = ("comment_out", "aligned_output", "write",
+           "generate_python3_module")
+
+if __name__ == "__main__":
+    min_methods = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    gen = load_generator()
+    work_dir = tempfile.mkdtemp()
+    try:
+        wadl_file = os.path.join(work_dir, "application.wadl")
+        out_file = os.path.join(work_dir, "methods.py")
+        num_classes, num_methods = write_synthetic_wadl(wadl_file, min_methods)
+        app = gen.read_wadl(wadl_file)
+
+        # Peak memory allocated while generating and writing the module
+        tracemalloc.start()
+        writer = gen.OutputWriter()
+        writer.write(out_file, gen.generate_python3_module(app))
+        writer.commit()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # Profile of a second, identical, run (reading and comparing the
+        # existing file as it goes)
+        gen.pydocs_cache.clear()
+        profile = cProfile.Profile()
+        profile.enable()
+        writer = gen.OutputWriter()
+        writer.write(out_file, gen.generate_python3_module(app))
+        writer.commit()
+        profile.disable()
+
+        print("\nSynthetic WADL: %d classes, %d methods" % (num_classes,
+                                                            num_methods))
+        print("methods.py size:      %8.1f MB"
+              % (os.path.getsize(out_file) / 1048576.0))
+        print("peak memory writing:  %8.1f MB\n" % (peak / 1048576.0))
+
+        stats = pstats.Stats(profile)
+        print("%-28s %9s %10s %10s" % ("function", "calls", "tottime",
+                                       "cumtime"))
+        for (filename, line, name), (cc, nc, tt, ct, callers)\
+            in sorted(stats.stats.items()):
+            if name in HELPERS:
+                print("%-28s %9d %9.3fs %9.3fs" % (name, nc, tt, ct))
+        total = sum(ct for (f, l, n), (cc, nc, tt, ct, c)
+                    in stats.stats.items() if n == "write")
+        print("%-28s %9s %10s %9.3fs" % ("total", "", "", total))
+    finally:
+        shutil.rmtree(work_dir)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# --------------------------------------------------------------------------
+# Copyright (c) 2012, University of Cambridge Computing Service
+#
+# This file is part of the Lookup/Ibis client library.
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+
+"""
+Compare serial and parallel (-j) runs of generate-client-methods for all
+languages on a synthetic WADL file with hundreds of resources, checking
+that the generated files are byte-identical.
+
+Usage: bench_parallel_generation.py [<jobs>] [<num_methods>]
+"""
+
+import filecmp
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import GENERATOR, write_synthetic_wadl
+
+LANGUAGES = ("java", "php", "python", "python3")
+
+def run_generator(jobs, out_dir, wadl_file):
+    langs = ",".join("%s=%s" % (lang, os.path.join(out_dir, lang))
+                     for lang in LANGUAGES)
+    for lang in LANGUAGES:
+        os.makedirs(os.path.join(out_dir, lang))
+    start = time.perf_counter()
+    subprocess.check_call([sys.executable, GENERATOR, "-lang", langs,
+                           "-j", str(jobs), wadl_file],
+                          stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+def same_files(dir1, dir2):
+    for lang in LANGUAGES:
+        cmp = filecmp.dircmp(os.path.join(dir1, lang), os.path.join(dir2, lang))
+        if cmp.left_only or cmp.right_only:
+            return False
+        match, mismatch, errors = filecmp.cmpfiles(cmp.left, cmp.right,
+                                                   cmp.common_files,
+                                                   shallow=False)
+        if mismatch or errors:
+            return False
+    return True
+
+if __name__ == "__main__":
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else multiprocessing.cpu_count()
+    min_methods = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        wadl_file = os.path.join(work_dir, "application.wadl")
+        num_classes, num_methods = write_synthetic_wadl(wadl_file, min_methods)
+        print("Synthetic WADL: %d classes, %d methods, all languages\n"
+              % (num_classes, num_methods))
+
+        serial_dir = os.path.join(work_dir, "serial")
+        parallel_dir = os.path.join(work_dir, "parallel")
+        serial = run_generator(1, serial_dir, wadl_file)
+        parallel = run_generator(jobs, parallel_dir, wadl_file)
+
+        print("-j 1    %7.3f s" % serial)
+        print("-j %-3d  %7.3f s  (x%.2f)" % (jobs, parallel, serial / parallel))
+        print("\nOutput identical: %s" % same_files(serial_dir, parallel_dir))
+    finally:
+        shutil.rmtree(work_dir)
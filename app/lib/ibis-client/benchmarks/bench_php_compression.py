@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+# --------------------------------------------------------------------------
+# Copyright (c) 2012, University of Cambridge Computing Service
+#
+# This file is part of the Lookup/Ibis client library.
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+"""
+Compare the bytes transferred and the per-call latency of the PHP client
+with and without response compression, against the local stub server
+serving a synthetic getMembers result (fetch=all_insts, flattened) in XML
+and in JSON, optionally at a limited rate to simulate a slower network.
+
+Each combination of transport (IbisStreamTransport, which decompresses
+with a zlib.inflate stream filter as the response is parsed, and
+IbisCurlTransport, where curl decompresses as it receives the response),
+compression and format is run in its own php process, which must have the
+curl, openssl and zlib extensions. The bytes are the response bodies sent
+by the stub server, as counted by the server.
+
+Usage: bench_php_compression.py [<num_people>] [<num_requests>] [<mbit_s>]
+                                [<php>]
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from common import CLIENT_DIR, members_xml, xml_to_json
+from stub_server import start_stub_server, stub_stats
+
+DRIVER = r'''
+require_once $argv[1] . "/ibisclient/client/IbisClientConnection.php";
+
+list($port, $transport, $compress, $format) = array_slice($argv, 2, 4);
+$numRequests = intval($argv[6]);
+
+$conn = new IbisClientConnection("https://localhost:" . $port . "/", false);
+$conn->setTransport(new $transport($compress === "gzip"));
+$conn->setFormat($format);
+
+$start = microtime(true);
+for ($i = 0; $i < $numRequests; $i++)
+{
+    $result = $conn->invokeMethod("GET", 'api/v1/inst/%1$s/members',
+                                  array("INST" . $i),
+                                  array("fetch" => "all_insts"));
+    if (!isset($result->people))
+        die("Unexpected result\n");
+}
+$elapsed = microtime(true) - $start;
+
+printf("%-36s %8.2f ms/call  ", "$transport, $compress, $format:",
+       1000 * $elapsed / $numRequests);
+'''
+
+if __name__ == "__main__":
+    num_people = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    num_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    mbit_s = float(sys.argv[3]) if len(sys.argv) > 3 else 0
+    php = sys.argv[4] if len(sys.argv) > 4 else "php"
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        xml = members_xml(num_people, flatten=True)
+        files = { "xml": os.path.join(tmp_dir, "members.xml"),
+                  "json": os.path.join(tmp_dir, "members.json") }
+        with open(files["xml"], "w") as f:
+            f.write(xml)
+        with open(files["json"], "w") as f:
+            json.dump(xml_to_json(xml), f, separators=(",", ":"))
+
+        print("%d requests for %d members, %s\n"
+              % (num_requests, num_people,
+                 "%.1f Mbit/s" % mbit_s if mbit_s else "unlimited rate"))
+        sys.stdout.flush()
+        for fmt in ("xml", "json"):
+            server, port = start_stub_server(0, files[fmt], mbit_s)
+            try:
+                for transport in ("IbisStreamTransport", "IbisCurlTransport"):
+                    for compress in ("identity", "gzip"):
+                        subprocess.check_call([php, "-r", DRIVER, "--",
+                                               CLIENT_DIR, str(port),
+                                               transport, compress, fmt,
+                                               str(num_requests)])
+                        sent, sent_bytes = stub_stats(port)
+                        print("%8.1f KB/call" % (sent_bytes / 1024.0 / sent))
+                        sys.stdout.flush()
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        shutil.rmtree(tmp_dir)
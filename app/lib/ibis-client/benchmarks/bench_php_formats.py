@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+# --------------------------------------------------------------------------
+# Copyright (c) 2012, University of Cambridge Computing Service
+#
+# This file is part of the Lookup/Ibis client library.
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+"""
+Compare the throughput of parsing results from XML and from JSON, for
+synthetic getMembers responses of various sizes (with fetch=all_insts, in
+both the hierarchical and flattened representations). The JSON is made from
+the XML with common.xml_to_json(), so both parse to the same IbisResult.
+
+Usage: bench_php_formats.py [<num_people>] [<repeats>] [<php>]
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from common import CLIENT_DIR, members_xml, xml_to_json
+
+DRIVER = r'''
+require_once $argv[1] . "/ibisclient/dto/IbisResult.php";
+
+$repeats = intval($argv[2]);
+foreach (array_slice($argv, 3) as $filename)
+{
+    $data = file_get_contents($filename);
+    $json = substr($filename, -5) === ".json";
+
+    $start = microtime(true);
+    for ($i = 0; $i < $repeats; $i++)
+    {
+        $parser = new IbisResultParser();
+        $result = $json ? $parser->parseJson($data) : $parser->parseXml($data);
+    }
+    $elapsed = (microtime(true) - $start) / $repeats;
+
+    printf("%-28s %8.1f KB  %8.2f ms  %7.1f MB/s  %8.0f people/s\n",
+           basename($filename) . ":", strlen($data) / 1024.0, 1000 * $elapsed,
+           strlen($data) / 1048576.0 / $elapsed,
+           count($result->people) / $elapsed);
+}
+'''
+
+if __name__ == "__main__":
+    num_people = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    php = sys.argv[3] if len(sys.argv) > 3 else "php"
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        files = []
+        for n in (10, num_people // 10, num_people):
+            for flatten in (False, True):
+                xml = members_xml(n, flatten=flatten)
+                name = "members-%d%s" % (n, "-flat" if flatten else "")
+                filename = os.path.join(tmp_dir, name + ".xml")
+                with open(filename, "w") as f:
+                    f.write(xml)
+                files.append(filename)
+                filename = os.path.join(tmp_dir, name + ".json")
+                with open(filename, "w") as f:
+                    json.dump(xml_to_json(xml), f, separators=(",", ":"))
+                files.append(filename)
+
+        subprocess.check_call([php, "-r", DRIVER, "--", CLIENT_DIR,
+                               str(repeats)] + files)
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# --------------------------------------------------------------------------
+# Copyright (c) 2012, University of Cambridge Computing Service
+#
+# This file is part of the Lookup/Ibis client library.
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+
+"""
+Compare fetching many people one call at a time with fetching them all at
+once using PersonMethods::getPersonMulti, which sends the calls to the
+server concurrently using IbisClientConnection::invokeMethods (curl's
+multi interface), against the local stub server.
+
+The stub server's delay stands in for the round trip time and the time
+the real server takes to answer each call, which concurrent calls overlap.
+The calls are made by the real PHP client library, run by the php command
+line tool, which must have the curl and openssl extensions.
+
+Usage: bench_php_multi.py [<num_people>] [<delay_ms>] [<php>]
+"""
+
+import subprocess
+import sys
+
+from common import CLIENT_DIR
+from stub_server import start_stub_server
+
+DRIVER = r'''
+require_once $argv[1] . "/ibisclient/client/IbisClientConnection.php";
+require_once $argv[1] . "/ibisclient/methods/PersonMethods.php";
+
+$port = $argv[2];
+$numPeople = intval($argv[3]);
+
+$conn = new IbisClientConnection("https://localhost:" . $port . "/", false);
+$pm = new PersonMethods($conn);
+$crsids = array();
+for ($i = 0; $i < $numPeople; $i++)
+    $crsids[] = "abc" . $i;
+
+function report($label, $start, $people, $numPeople)
+{
+    if (count(array_filter($people)) != $numPeople)
+        die("Missing results\n");
+    $elapsed = microtime(true) - $start;
+    printf("%-30s %7.3f s  %8.0f people/s\n", $label . ":",
+           $elapsed, $numPeople / $elapsed);
+}
+
+// Warm up the connection, so neither pays for the first TLS handshake
+$pm->getPerson("crsid", "abc");
+
+$start = microtime(true);
+$people = array();
+foreach ($crsids as $crsid)
+    $people[$crsid] = $pm->getPerson("crsid", $crsid);
+report("getPerson, one at a time", $start, $people, $numPeople);
+
+$start = microtime(true);
+report("getPersonMulti", $start, $pm->getPersonMulti("crsid", $crsids),
+       $numPeople);
+'''
+
+if __name__ == "__main__":
+    num_people = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    delay_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+    php = sys.argv[3] if len(sys.argv) > 3 else "php"
+
+    server, port = start_stub_server(delay_ms)
+    try:
+        print("%d people, %.1f ms server delay\n" % (num_people, delay_ms))
+        sys.stdout.flush()
+        subprocess.check_call([php, "-r", DRIVER, "--", CLIENT_DIR,
+                               str(port), str(num_people)])
+    finally:
+        server.terminate()
+        server.wait()
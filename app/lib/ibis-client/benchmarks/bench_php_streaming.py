@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+# --------------------------------------------------------------------------
+# Copyright (c) 2012, University of Cambridge Computing Service
+#
+# This file is part of the Lookup/Ibis client library.
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+
+"""
+Compare the peak memory use and time of parsing a large result with
+IbisResultParser::parseXmlFile, which builds the complete result, and
+with IbisResultParser::parseXmlFileIter, which returns each top-level
+entity as soon as it has been parsed.
+
+The result is a synthetic multi-megabyte getMembers response, with
+fetch=all_insts, in the hierarchical representation that
+IbisClientConnection::invokeMethodIter asks for. Each parse is run in its
+own php process, so that the peak memory of one doesn't hide the other's.
+
+Usage: bench_php_streaming.py [<num_people>] [<php>]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+from common import CLIENT_DIR, members_xml
+
+DRIVER = r'''
+require_once $argv[1] . "/ibisclient/dto/IbisResult.php";
+
+$mode = $argv[3];
+$file = fopen($argv[2], "r");
+$baseline = memory_get_usage();
+
+$start = microtime(true);
+$parser = new IbisResultParser();
+$count = 0;
+if ($mode === "parseXmlFile")
+{
+    $result = $parser->parseXmlFile($file);
+    foreach ($result->people as $person)
+        $count += sizeof($person->institutions) > 0 ? 1 : 0;
+}
+else
+{
+    foreach ($parser->parseXmlFileIter($file) as $person)
+        $count += sizeof($person->institutions) > 0 ? 1 : 0;
+}
+$elapsed = microtime(true) - $start;
+
+printf("%-18s %7.3f s  %8.1f MB peak  (%d people)\n", $mode . ":", $elapsed,
+       (memory_get_peak_usage() - $baseline) / 1048576, $count);
+'''
+
+if __name__ == "__main__":
+    num_people = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    php = sys.argv[2] if len(sys.argv) > 2 else "php"
+
+    fd, filename = tempfile.mkstemp(suffix=".xml")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(members_xml(num_people))
+        print("%d people, %.1f MB of XML\n"
+              % (num_people, os.path.getsize(filename) / 1048576.0))
+        sys.stdout.flush()
+        for mode in ("parseXmlFile", "parseXmlFileIter"):
+            subprocess.check_call([php, "-r", DRIVER, "--", CLIENT_DIR,
+                                   filename, mode])
+    finally:
+        os.remove(filename)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+# --------------------------------------------------------------------------
+# Copyright (c) 2012, University of Cambridge Computing Service
+#
+# This file is part of the Lookup/Ibis client library.
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+"""
+Compare the per-call latency of the PHP client's transports against the
+local stub server: IbisStreamTransport, which opens a new connection (and
+does a new TLS handshake) for every call, and IbisCurlTransport, which
+keeps its connection alive between calls.
+
+The calls are made by the real PHP client library (so the times include
+parsing the stub's small XML result), run by the php command line tool,
+which must have the curl and openssl extensions.
+
+Usage: bench_php_transports.py [<num_requests>] [<delay_ms>] [<php>]
+"""
+
+import os
+import subprocess
+import sys
+
+from common import CLIENT_DIR
+from stub_server import start_stub_server
+
+DRIVER = r'''
+require_once $argv[1] . "/ibisclient/client/IbisClientConnection.php";
+require_once $argv[1] . "/ibisclient/methods/PersonMethods.php";
+
+$port = $argv[2];
+$numRequests = intval($argv[3]);
+
+foreach (array("IbisStreamTransport", "IbisCurlTransport") as $transport)
+{
+    $conn = new IbisClientConnection("https://localhost:" . $port . "/", false);
+    $conn->setTransport(new $transport());
+    $pm = new PersonMethods($conn);
+
+    $start = microtime(true);
+    for ($i = 0; $i < $numRequests; $i++)
+        $pm->getPerson("crsid", "abc" . $i);
+    $elapsed = microtime(true) - $start;
+
+    printf("%-22s %7.3f s  %8.0f req/s  %7.2f ms/call\n", $transport . ":",
+           $elapsed, $numRequests / $elapsed, 1000 * $elapsed / $numRequests);
+}
+'''
+
+if __name__ == "__main__":
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    delay_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 0
+    php = sys.argv[3] if len(sys.argv) > 3 else "php"
+
+    server, port = start_stub_server(delay_ms)
+    try:
+        print("%d getPerson requests, %.1f ms server delay\n"
+              % (num_requests, delay_ms))
+        sys.stdout.flush()
+        subprocess.check_call([php, "-r", DRIVER, "--", CLIENT_DIR,
+                               str(port), str(num_requests)])
+    finally:
+        server.terminate()
+        server.wait()
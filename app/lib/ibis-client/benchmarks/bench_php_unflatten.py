@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+# --------------------------------------------------------------------------
+# Copyright (c) 2012, University of Cambridge Computing Service
+#
+# This file is part of the Lookup/Ibis client library.
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+
+"""
+Compare the time and peak memory of parsing and unflattening flattened
+results eagerly (the default), and lazily, where the references between
+entities are only resolved when they are used, with and without a shared
+IbisInternTable.
+
+The results are synthetic getMembers responses for a large institution,
+with fetch=all_insts, split into pages as a paged method would fetch
+them. All the people are kept, as a sync job would, and each run either
+ignores the people's institutions or looks at them all.
+
+Each run is in its own php process, so that the peak memory of one
+doesn't hide another's.
+
+Usage: bench_php_unflatten.py [<num_people>] [<num_pages>] [<php>]
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from common import CLIENT_DIR, members_xml
+
+DRIVER = r'''
+require_once $argv[1] . "/ibisclient/dto/IbisResult.php";
+
+list($lazy, $intern, $touch) = explode(",", $argv[2]);
+$files = array_slice($argv, 3);
+$baseline = memory_get_usage();
+
+$start = microtime(true);
+$internTable = $intern === "intern" ? new IbisInternTable() : null;
+$people = array();
+$insts = array();
+foreach ($files as $filename)
+{
+    $file = fopen($filename, "r");
+    $parser = new IbisResultParser($lazy === "lazy", $internTable);
+    foreach ($parser->parseXmlFile($file)->people as $person)
+    {
+        $people[] = $person;
+        if ($touch === "insts")
+            foreach ($person->institutions as $inst)
+                $insts[spl_object_hash($inst)] = $inst->name;
+    }
+    fclose($file);
+}
+$elapsed = microtime(true) - $start;
+
+printf("%-30s %7.3f s  %8.1f MB peak  (%d people, %d institution objects)\n",
+       $argv[2] . ":", $elapsed, (memory_get_peak_usage() - $baseline) / 1048576,
+       count($people), count($insts));
+'''
+
+RUNS = ("eager,-,-", "lazy,-,-", "eager,-,insts", "lazy,-,insts",
+        "lazy,intern,insts")
+
+if __name__ == "__main__":
+    num_people = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    num_pages = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    php = sys.argv[3] if len(sys.argv) > 3 else "php"
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        page_size = (num_people + num_pages - 1) // num_pages
+        files = []
+        for first in range(0, num_people, page_size):
+            filename = os.path.join(tmp_dir, "page%d.xml" % len(files))
+            with open(filename, "w") as f:
+                f.write(members_xml(min(page_size, num_people - first),
+                                    flatten=True, first=first))
+            files.append(filename)
+
+        size = sum(os.path.getsize(x) for x in files)
+        print("%d people in %d pages, %.1f MB of flattened XML\n"
+              % (num_people, len(files), size / 1048576.0))
+        sys.stdout.flush()
+        for run in RUNS:
+            subprocess.check_call([php, "-r", DRIVER, "--", CLIENT_DIR, run]
+                                  + files)
+    finally:
+        shutil.rmtree(tmp_dir)
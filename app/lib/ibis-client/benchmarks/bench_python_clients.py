@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+# --------------------------------------------------------------------------
+# Copyright (c) 2012, University of Cambridge Computing Service
+#
+# This file is part of the Lookup/Ibis client library.
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+"""
+Compare the throughput of the generated python3 methods (using a
+PooledIbisClientConnection, one request at a time) with the generated
+python3-async methods (using an AsyncIbisClientConnection, with all the
+requests issued concurrently) against the local stub server.
+
+The generated modules rely on the hand-written connection and dto modules
+of the Python client library, which are not part of this package, so
+minimal stand-ins for them are used here. The results are therefore a
+measure of the transport alone, not of XML parsing.
+
+Usage: bench_python_clients.py [<num_requests>] [<delay_ms>] [<pool_size>]
+"""
+
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import GENERATOR, WADL_FILE
+from stub_server import start_stub_server
+
+CONNECTION_STANDIN = '''
+class IbisException(Exception):
+    pass
+'''
+
+DTO_STANDIN = '''
+from xml.etree import ElementTree
+
+class IbisAttribute:
+    def encoded_string(self):
+        return ""
+
+class IbisError:
+    def __init__(self, attrs):
+        self.__dict__.update(attrs)
+
+class IbisResult:
+    error = None
+    person = None
+
+class IbisResultParser:
+    def parse_xml(self, data):
+        result = IbisResult()
+        result.person = ElementTree.fromstring(data).find("person")
+        return result
+'''
+
+def create_package(work_dir, name, lang):
+    package_dir = os.path.join(work_dir, name)
+    os.mkdir(package_dir)
+    for filename, content in (("__init__.py", ""),
+                              ("connection.py", CONNECTION_STANDIN),
+                              ("dto.py", DTO_STANDIN)):
+        with open(os.path.join(package_dir, filename), "w") as f:
+            f.write(content)
+    subprocess.check_call([sys.executable, GENERATOR, "-no-fsync",
+                           "-lang", "%s=%s" % (lang, package_dir), WADL_FILE],
+                          stdout=subprocess.DEVNULL)
+
+def run_sync(port, crsids, pool_size):
+    from syncclient.pooled_connection import PooledIbisClientConnection
+    from syncclient.methods import PersonMethods
+
+    conn = PooledIbisClientConnection("localhost", port, "", False, pool_size)
+    pm = PersonMethods(conn)
+    start = time.perf_counter()
+    for crsid in crsids:
+        pm.getPerson("crsid", crsid)
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed
+
+async def run_async(port, crsids, pool_size):
+    from asyncclient.async_connection import AsyncIbisClientConnection
+    from asyncclient.methods import PersonMethods
+
+    conn = AsyncIbisClientConnection("localhost", port, "", False, pool_size)
+    pm = PersonMethods(conn)
+    start = time.perf_counter()
+    await asyncio.gather(*[ pm.getPerson("crsid", crsid) for crsid in crsids ])
+    elapsed = time.perf_counter() - start
+    await conn.close()
+    return elapsed
+
+if __name__ == "__main__":
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    delay_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 2
+    pool_size = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+
+    work_dir = tempfile.mkdtemp()
+    server, port = start_stub_server(delay_ms)
+    try:
+        create_package(work_dir, "syncclient", "python3")
+        create_package(work_dir, "asyncclient", "python3-async")
+        sys.path.insert(0, work_dir)
+
+        crsids = [ "abc%d" % n for n in range(num_requests) ]
+        print("%d getPerson requests, %.1f ms server delay, pool size %d\n"
+              % (num_requests, delay_ms, pool_size))
+
+        elapsed = run_sync(port, crsids, pool_size)
+        print("python3 (sequential):      %7.3f s  %8.0f req/s"
+              % (elapsed, num_requests / elapsed))
+
+        elapsed = asyncio.run(run_async(port, crsids, pool_size))
+        print("python3-async (gather):    %7.3f s  %8.0f req/s"
+              % (elapsed, num_requests / elapsed))
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(work_dir)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+# --------------------------------------------------------------------------
+# Copyright (c) 2012, University of Cambridge Computing Service
+#
+# This file is part of the Lookup/Ibis client library.
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+"""
+Compare the "stream" and "minidom" WADL parsers of generate-client-methods
+on a synthetic WADL file with around 10,000 methods.
+
+Each parser is run in a separate child process, so that the reported peak
+resident memory is that parser's alone.
+
+Usage: bench_wadl_parser.py [<num_methods>]
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import load_generator, write_synthetic_wadl
+
+def run_parser(parser, wadl_file):
+    gen = load_generator()
+    start = time.perf_counter()
+    app = gen.read_wadl(wadl_file, parser)
+    elapsed = time.perf_counter() - start
+    num_methods = sum(len(cls.methods) for cls in app.classes)
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print("%-8s %8d methods  %7.3f s  peak RSS %8d KB"
+          % (parser, num_methods, elapsed, peak_kb))
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        run_parser(sys.argv[2], sys.argv[3])
+        sys.exit(0)
+
+    min_methods = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    fd, wadl_file = tempfile.mkstemp(suffix=".wadl")
+    os.close(fd)
+    try:
+        num_classes, num_methods = write_synthetic_wadl(wadl_file, min_methods)
+        print("Synthetic WADL: %d classes, %d methods, %.1f MB\n"
+              % (num_classes, num_methods,
+                 os.path.getsize(wadl_file) / 1048576.0))
+        sys.stdout.flush()
+
+        for parser in ("stream", "minidom"):
+            subprocess.check_call([sys.executable, os.path.abspath(__file__),
+                                   "--child", parser, wadl_file])
+    finally:
+        os.remove(wadl_file)
@@ -0,0 +1,172 @@
+# --------------------------------------------------------------------------
+# Copyright (c) 2012, University of Cambridge Computing Service
+#
+# This file is part of the Lookup/Ibis client library.
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+"""
+Helpers shared by the generate-client-methods and client benchmarks.
+"""
+
+import os
+import re
+import importlib.machinery
+import importlib.util
+import xml.etree.ElementTree as ElementTree
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CLIENT_DIR = os.path.dirname(BENCH_DIR)
+GENERATOR = os.path.join(CLIENT_DIR, "generate-client-methods.py")
+WADL_FILE = os.path.join(CLIENT_DIR, "application.wadl")
+
+def load_generator(filename=GENERATOR):
+    """
+    Import generate-client-methods.py (or another version of it) as a module
+    (its file name isn't a valid module name, so it can't simply be imported).
+    """
+    loader = importlib.machinery.SourceFileLoader("generate_client_methods",
+                                                  filename)
+    spec = importlib.util.spec_from_loader(loader.name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+def write_synthetic_wadl(filename, min_methods):
+    """
+    Write a synthetic WADL file containing at least min_methods methods,
+    made by repeating the top-level resources of the real application.wadl
+    under new class names. The docs and parameters are therefore realistic.
+    Returns the number of top-level resources and methods written.
+    """
+    with open(WADL_FILE) as f:
+        wadl = f.read()
+
+    start = wadl.index("        <resource ")
+    end = wadl.rindex("        </resource>\n") + len("        </resource>\n")
+    header, body, footer = wadl[:start], wadl[start:end], wadl[end:]
+
+    methods_per_copy = body.count("<method ")
+    classes_per_copy = len(re.findall('className="', body))
+    copies = (min_methods + methods_per_copy - 1) // methods_per_copy
+
+    with open(filename, "w") as f:
+        f.write(header)
+        for n in range(copies):
+            f.write(re.sub('className="([A-Za-z]+)Resource"',
+                           'className="\\g<1>%dResource"' % n, body))
+        f.write(footer)
+
+    return classes_per_copy * copies, methods_per_copy * copies
+
+def members_xml(num_people, flatten=False, num_insts=200, insts_per_person=3,
+                first=0):
+    """
+    Returns the XML of a synthetic result like that of getMembers with
+    fetch=all_insts for an institution with num_people members (starting
+    with the person numbered first), each in insts_per_person of num_insts
+    institutions, with an email attribute. In the flattened representation,
+    the people are references to the entities, and each institution appears
+    just once.
+    """
+    def inst_xml(n, attrs):
+        return ('<institution cancelled="false" instid="INST%d"%s>'
+                '<name>Department of Synthetic Studies %d</name>'
+                '<acronym>DSS%d</acronym></institution>' % (n, attrs, n, n))
+
+    def person_xml(n, attrs):
+        crsid = "abc%d" % n
+        insts = [ (n * 7 + k * 13) % num_insts
+                  for k in range(insts_per_person) ]
+        if flatten:
+            insts = "".join('<institution ref="i%d"/>' % x for x in insts)
+        else:
+            insts = "".join(inst_xml(x, "") for x in insts)
+        return ('<person cancelled="false"%s>'
+                '<identifier scheme="crsid">%s</identifier>'
+                '<displayName>A. Person %d</displayName>'
+                '<registeredName>A. Person %d</registeredName>'
+                '<surname>Person</surname>'
+                '<visibleName>A. Person %d</visibleName>'
+                '<misAffiliation>staff</misAffiliation>'
+                '<attributes><attribute attrid="%d" scheme="email"'
+                ' visibility="university"><value>%s@cam.ac.uk</value>'
+                '</attribute></attributes>'
+                '<institutions>%s</institutions></person>'
+                % (attrs, crsid, n, n, n, 1000 + n, crsid, insts))
+
+    xml = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+           '<result version="1.8"><people>']
+    people = range(first, first + num_people)
+    if flatten:
+        xml.extend('<person ref="p%d"/>' % n for n in people)
+        xml.append('</people><entities><people>')
+        xml.extend(person_xml(n, ' id="p%d"' % n) for n in people)
+        xml.append('</people><institutions>')
+        xml.extend(inst_xml(n, ' id="i%d"' % n) for n in range(num_insts))
+        xml.append('</institutions></entities>')
+    else:
+        xml.extend(person_xml(n, "") for n in people)
+        xml.append('</people>')
+    xml.append('</result>\n')
+    return "".join(xml)
+
+# The XML wrapper elements (@XmlElementWrapper in the JAXB classes), which
+# are lists in JSON
+XML_WRAPPERS = set(("addresses", "attributeSchemes", "attributes",
+                    "childInsts", "contactRows", "directGroups",
+                    "directMembers", "emails", "groups", "identifiers",
+                    "includedByGroups", "includesGroups", "institutions",
+                    "managedByGroups", "managesGroups", "managesInsts",
+                    "members", "membersGroups", "owningInsts", "parentInsts",
+                    "people", "phoneNumbers", "readByGroups", "readsGroups",
+                    "webPages"))
+
+# The XML attributes that are numbers in JSON
+JSON_NUMBERS = set(("attrid", "precedence", "status"))
+
+def xml_to_json(xml):
+    """
+    Returns the JSON representation of an XML result from the server, as a
+    Python object (to be passed to json.dumps()). Wrapper elements become
+    lists, other elements with attributes or child elements become objects
+    (the text of an identifier becoming its "value"), and text elements
+    become strings. This is how the JSON format benchmark's synthetic data
+    is made from XML (the test fixtures are recorded from the server; see
+    test/JsonFixtures.php).
+    """
+    def attr_value(name, value):
+        if value in ("true", "false"):
+            return value == "true"
+        if name in JSON_NUMBERS and value.isdigit():
+            return int(value)
+        return value
+
+    def convert(el):
+        children = list(el)
+        text = el.text if el.text and el.text.strip() else None
+        if el.tag in XML_WRAPPERS and not el.attrib and not text:
+            return [ convert(child) for child in children ]
+        if not el.attrib and not children:
+            return el.text
+        obj = dict((name, attr_value(name, value))
+                   for name, value in el.attrib.items())
+        for child in children:
+            obj[child.tag] = convert(child)
+        if text and not children:
+            obj["value"] = el.text
+        return obj
+
+    return { "result": convert(ElementTree.fromstring(xml.encode("utf-8"))) }
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+# --------------------------------------------------------------------------
+# Copyright (c) 2012, University of Cambridge Computing Service
+#
+# This file is part of the Lookup/Ibis client library.
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+"""
+An asyncio HTTPS stub of the Lookup/Ibis web service API, for benchmarking
+the generated Python clients locally.
+
+Every request gets the same result (by default a small XML result, or the
+contents of a file), optionally after a delay to simulate the server's
+processing time, and optionally sent at a limited rate to simulate a
+slower network. The connections are kept alive (unless the client asks
+otherwise), and many requests may be in progress at once.
+
+The result is compressed with gzip or deflate if the client's
+Accept-Encoding header allows it. A request for the path /stub-stats
+returns the number of results sent, and the number of bytes in their
+bodies, since the last such request.
+
+A self-signed certificate is created for the server using the openssl
+command line tool, so the clients must not check certificates.
+
+Usage: stub_server.py [<port>] [<delay_ms>] [<result_file>] [<mbit_s>]
+"""
+
+import asyncio
+import gzip
+import os
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import urllib.request
+import zlib
+
+RESULT_XML = b"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<result version="1.0">
+  <person cancelled="false" identifier="abc123" displayName="A. Person"
+          registeredName="A. Person" surname="Person" visibleName="A. Person"
+          misAffiliation="staff" student="false" staff="true">
+    <identifier scheme="crsid">abc123</identifier>
+  </person>
+</result>
+"""
+
+def create_ssl_context():
+    """
+    Create a server SSL context with a new self-signed certificate.
+    """
+    cert_dir = tempfile.mkdtemp()
+    try:
+        cert_file = os.path.join(cert_dir, "cert.pem")
+        key_file = os.path.join(cert_dir, "key.pem")
+        subprocess.check_call(["openssl", "req", "-x509", "-newkey", "rsa:2048",
+                               "-nodes", "-days", "1", "-subj", "/CN=localhost",
+                               "-keyout", key_file, "-out", cert_file],
+                              stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_file, key_file)
+        return context
+    finally:
+        shutil.rmtree(cert_dir)
+
+class Result(object):
+    """
+    The result sent for every request, in each encoding (compressed on
+    first use), and the counts of what has been sent.
+    """
+    def __init__(self, body, content_type):
+        self.bodies = { None: body }
+        self.content_type = content_type
+        self.sent = 0
+        self.sent_bytes = 0
+
+    def encode(self, accept_encoding):
+        """
+        Returns the encoding to use for a request with the specified
+        Accept-Encoding header (or None), and the body in that encoding.
+        """
+        encodings = set()
+        for item in accept_encoding.lower().split(b","):
+            coding, sep, params = item.partition(b";")
+            if params.replace(b" ", b"") not in (b"q=0", b"q=0.0"):
+                encodings.add(coding.strip())
+        for encoding in (b"gzip", b"deflate", None):
+            if encoding is None or encoding in encodings:
+                break
+        if encoding not in self.bodies:
+            if encoding == b"gzip":
+                data = gzip.compress(self.bodies[None], mtime=0)
+            else:
+                data = zlib.compress(self.bodies[None])
+            self.bodies[encoding] = data
+        return encoding, self.bodies[encoding]
+
+async def handle_connection(reader, writer, delay, rate, result):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line: break
+
+            content_length = 0
+            accept_encoding = b""
+            keep_alive = not request_line.rstrip().endswith(b"HTTP/1.0")
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""): break
+                name, sep, value = line.partition(b":")
+                name = name.strip().lower()
+                if name == b"content-length":
+                    content_length = int(value)
+                elif name == b"connection":
+                    keep_alive = value.strip().lower() == b"keep-alive"
+                elif name == b"accept-encoding":
+                    accept_encoding = value
+            if content_length:
+                await reader.readexactly(content_length)
+
+            if request_line.split(b" ")[1:2] == [b"/stub-stats"]:
+                body = b"%d %d\n" % (result.sent, result.sent_bytes)
+                result.sent = result.sent_bytes = 0
+                writer.write(b"HTTP/1.1 200 OK\r\n"
+                             b"Content-Type: text/plain\r\n"
+                             b"Content-Length: %d\r\n\r\n" % len(body)
+                             + body)
+                await writer.drain()
+                if not keep_alive: break
+                continue
+
+            if delay: await asyncio.sleep(delay)
+
+            encoding, body = result.encode(accept_encoding)
+            headers = (b"HTTP/1.1 200 OK\r\n"
+                       b"Content-Type: %s\r\n" % result.content_type)
+            if encoding:
+                headers += b"Content-Encoding: %s\r\n" % encoding
+            headers += b"Content-Length: %d\r\n\r\n" % len(body)
+            writer.write(headers)
+            chunk_size = 65536 if rate else len(body)
+            for start in range(0, len(body), chunk_size):
+                chunk = body[start:start + chunk_size]
+                writer.write(chunk)
+                await writer.drain()
+                if rate: await asyncio.sleep(len(chunk) / rate)
+            result.sent += 1
+            result.sent_bytes += len(body)
+            await writer.drain()
+            if not keep_alive: break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(port, delay, rate, result):
+    server = await asyncio.start_server(
+        lambda r, w: handle_connection(r, w, delay, rate, result),
+        "localhost", port, ssl=create_ssl_context())
+    print(server.sockets[0].getsockname()[1])
+    sys.stdout.flush()
+    async with server:
+        await server.serve_forever()
+
+def start_stub_server(delay_ms=0, result_file=None, mbit_s=0):
+    """
+    Start the stub server in a child process on a free port, returning the
+    process and the port number. The result is the contents of result_file,
+    if given (JSON if its name ends with ".json", and otherwise XML), sent
+    at mbit_s megabits per second, if given.
+    """
+    args = [sys.executable, os.path.abspath(__file__), "0", str(delay_ms),
+            result_file or "", str(mbit_s)]
+    process = subprocess.Popen(args, stdout=subprocess.PIPE)
+    port = int(process.stdout.readline())
+    return process, port
+
+def stub_stats(port):
+    """
+    Returns the number of results, and bytes of result bodies, sent by the
+    stub server since this was last called.
+    """
+    context = ssl._create_unverified_context()
+    url = "https://localhost:%d/stub-stats" % port
+    with urllib.request.urlopen(url, context=context) as response:
+        sent, sent_bytes = response.read().split()
+    return int(sent), int(sent_bytes)
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8443
+    delay_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 0
+    rate = float(sys.argv[4]) * 125000 if len(sys.argv) > 4 else 0
+    if len(sys.argv) > 3 and sys.argv[3]:
+        with open(sys.argv[3], "rb") as f:
+            body = f.read()
+        content_type = (b"application/json" if sys.argv[3].endswith(".json")
+                        else b"application/xml")
+        result = Result(body, content_type)
+    else:
+        result = Result(RESULT_XML, b"application/xml")
+    try:
+        asyncio.run(serve(port, delay_ms / 1000.0, rate, result))
+    except KeyboardInterrupt:
+        pass
@@ -33,35 +33,98 @@ auto-generated client methods contain the details of all the API methods,
 including their parameters, documentation and the URLs on the server
 needed to invoke them.
 
+For Python, a pooled_connection module is also generated alongside the
+methods module. This provides a PooledIbisClientConnection, which may be
+used in place of the hand-written IbisClientConnection, and keeps HTTPS
+connections to the server open for re-use between requests.
+
 Usage: generate-client-methods [options] <wadl_file>
 
 Where <wadl_file> is the location of the application.wadl file.
 The following options are supported:
 
-    -lang <language>    Specify the Language of the generated code. This
-                        may be any of the following:
+    -lang <language>[=<output_dir>][,...]
+                        Specify the Language(s) of the generated code. Each
+                        language may be any of the following:
 
                             * "java" (the default)
                             * "php"
                             * "python"
                             * "python3"
+                            * "python3-async" - Python 3 asyncio coroutines,
+                              using the generated async_connection module
+
+                        Multiple languages may be given, either as a comma
+                        separated list or by repeating this option, in which
+                        case the WADL file is parsed only once and shared by
+                        all of them. Each language may have its own output
+                        directory, for example:
+
+                            -lang java=src/methods,php=php/methods
+
+    -d <output_dir>     The directory in which to write the output code for
+                        any language without its own output directory. This
+                        defaults to the current directory.
+
+    -parser <parser>    Specify how the WADL file is parsed. This may be
+                        either of the following:
+
+                            * "stream" (the default) - a single streaming
+                              pass using ElementTree.iterparse(), with
+                              memory use bounded by the largest resource
+                            * "minidom" - build a complete DOM tree first
+
+    -cache <cache_file> Keep a record of the generated files in the specified
+                        cache file, and use it to skip regenerating any
+                        file whose WADL resources are unchanged since the
+                        last run (provided that neither this generator nor
+                        the file itself have been changed since then).
+
+    -j <jobs>           Generate the code using the specified number of
+                        worker processes. The methods of each class are
+                        split into batches, which are generated in parallel.
+                        The output is identical to that produced with the
+                        default of 1 job (no worker processes).
 
-    -d <output_dir>     The directory in which to write the output code.
-                        This defaults to the current directory.
+    -manifest <file>    Write a JSON manifest listing all the generated
+                        files, with their sizes and SHA-1 hashes, whether
+                        or not they were modified.
+
+    -no-fsync           Don't flush the generated files to disk before
+                        renaming them into place. This is faster, but a
+                        crash may leave empty or truncated files behind.
+
+    -v                  List the status of every generated file, rather
+                        than just a summary for each output directory.
 
 NOTE: The generated code files are only touched if they actually need to
-be modified. Otherwise their original timestamps are preserved.
+be modified. Otherwise their original timestamps are preserved. Changed
+files are written to temporary files first, and only renamed into place
+once all the files have been generated successfully.
 
 """
 
 import re
 import os
 import sys
+import json
+import hashlib
+import functools
+import multiprocessing
 import xml.dom.minidom
 from xml.dom import *
+from xml.etree import ElementTree
 
-lang = "java"
+LANGUAGES = ("java", "php", "python", "python3", "python3-async")
+
+targets = []
 out_dir = "."
+parser = "stream"
+cache_file = None
+jobs = 1
+fsync = True
+manifest_file = None
+verbose = False
 wadl_file = None
 
 def error(msg):
@@ -79,14 +142,15 @@ class Param:
     The datatype on the client may be different (e.g., the client uses String
     instead of List<String>).
     """
-    def __init__(self, node):
+    def __init__(self, attrs):
         """
-        Create a Param instance from a <param> node in the WADL file. This may
-        be a path parameter, a query parameter or a form parameter.
+        Create a Param instance from the attributes of a <param> node in the
+        WADL file. This may be a path parameter, a query parameter or a form
+        parameter.
         """
-        self.kind = node.getAttribute("type")
-        self.name = node.getAttribute("name")
-        self.java_type = node.getAttribute("javaType")
+        self.kind = attrs.get("type", "")
+        self.name = attrs.get("name", "")
+        self.java_type = attrs.get("javaType", "")
 
 class Method:
     """
@@ -94,44 +158,31 @@ class Method:
     from the WADL file. Note that there may be multiple methods in a second-
     level resource node (if they have the same path and path parameters).
     """
-    def __init__(self, node, cls, idx):
+    def __init__(self, cls, resource_path, path_params, method_attrs, docs,
+                 query_params, form_params):
         """
-        Create a Method instance from a second-level <resource> node in the
-        WADL file. The idx argument specifies which method to use (0, 1, ...)
-        in the case where the <resource> node contains multiple <method>
-        nodes.
+        Create a Method instance from the parsed contents of a <method> node
+        in a second-level <resource> node of the WADL file. The path_params
+        come from the enclosing <resource> node, the query_params from the
+        method's <request> node and the form_params from the <representation>
+        node inside that.
         """
         # Get the method path and prefix it with the class's path
         path1 = cls.path
         if path1.startswith("/"): path1 = path1[1:]
         if path1.endswith("/"): path1 = path1[:-1]
 
-        path2 = node.getAttribute("path")
+        path2 = resource_path
         if path2.startswith("/"): path2 = path2[1:]
 
         self.path = path1 + "/" + path2
 
-        # Look for path <param> nodes and the required <method> node
-        self.path_params = []
-        method_idx = 0
-        method = None
-        for child in node.childNodes:
-            if child.nodeType == Node.ELEMENT_NODE:
-                if child.tagName == "param":
-                    self.path_params.append(Param(child))
-                elif child.tagName == "method":
-                    if method_idx == idx: method = child
-                    method_idx += 1
-
         # Get the method name and kind (GET, POST, PUT or DELETE)
-        if method == None:
-            error("Failed to find <method> node under <resource> node")
-
-        self.name = method.getAttribute("id")
-        self.kind = method.getAttribute("name")
+        self.name = method_attrs.get("id", "")
+        self.kind = method_attrs.get("name", "")
 
         # Get the method result field and type (colon separated)
-        self.result_field = method.getAttribute("resultField")
+        self.result_field = method_attrs.get("resultField", "")
         idx = self.result_field.find(":")
         if idx == -1:
             error("Invalid method result field '%s'" % self.result_field)
@@ -139,55 +190,116 @@ class Method:
         self.result_type = self.result_field[idx+1:]
         self.result_field = self.result_field[:idx]
 
-        # Find the method docs, if any
-        self.docs = ""
-        for child in method.childNodes:
-            if child.nodeType == Node.ELEMENT_NODE and\
-               child.tagName == "doc":
-                self.docs = child.firstChild.nodeValue
-                break
-
-        # Look for a <request> child node (holds any non-path parameters)
-        request = None
-        for child in method.childNodes:
-            if child.nodeType == Node.ELEMENT_NODE and\
-               child.tagName == "request":
-                if request != None:
-                    error("Can't handle multiple <request> nodes under "\
-                          "a single <method> node")
-                request = child
-
-        # Process any query parameters in the <request> node, and look
-        # out for a <representation> node holding form parameters
-        self.query_params = []
-        representation = None
-        if request != None:
-            for child in request.childNodes:
-                if child.nodeType == Node.ELEMENT_NODE:
-                    if child.tagName == "param":
-                        self.query_params.append(Param(child))
-                    elif child.tagName == "representation":
-                        if representation != None:
-                            error("Can't handle multiple <representation> "\
-                                  "nodes under a <request> node")
-                        representation = child
-
-        # Finally process any form parameters in the <representation> node
-        self.form_params = []
-        if representation != None:
-            for child in representation.childNodes:
-                if child.nodeType == Node.ELEMENT_NODE and\
-                   child.tagName == "param":
-                    self.form_params.append(Param(child))
+        self.docs = docs
+        self.path_params = path_params
+        self.query_params = query_params
+        self.form_params = form_params
 
         self.all_params = self.path_params +\
                           self.query_params + self.form_params
 
+        # The list-style parameter, if this method may also be invoked in
+        # batches (see find_batch_param())
+        self.batch_param = self.find_batch_param()
+
+        # How the results of this method may be paged through, if at all
+        # (see find_paging())
+        self.page_style, self.cursor_param = self.find_paging()
+
+        # The identifier parameter, if this method may also be invoked for
+        # many identifiers concurrently (see find_multi_param())
+        self.multi_param = self.find_multi_param()
+
+        # The decorated docs, built on first use and then shared by all the
+        # languages being generated
+        self.decorated_docs = None
+
+        # The generated code for this method in each language, if it has
+        # already been generated by a worker process (see -j)
+        self.generated = {}
+
+    def find_batch_param(self):
+        """
+        Returns the parameter holding the list of identifiers of a list-style
+        method, or None if this isn't a list-style method. A list-style
+        method is a GET method with no path parameters, returning a list,
+        whose first query parameter is a required java.util.List (a comma-
+        separated list of identifiers). The batched version of such a method
+        splits an arbitrary number of identifiers into multiple calls.
+        """
+        if self.kind != "GET" or self.path_params or not self.query_params:
+            return None
+        if not self.result_type.startswith("java.util.List<"):
+            return None
+
+        param = self.query_params[0]
+        if param.java_type != "java.util.List" or\
+           ("@param %s [required]" % param.name) not in self.docs:
+            return None
+        return param
+
+    def find_multi_param(self):
+        """
+        Returns the path parameter identifying the object fetched by a
+        get-style method, or None if this isn't a get-style method. A get-
+        style method is a GET method returning a single Ibis object, whose
+        path ends with its last path parameter (for example, getPerson,
+        "api/v1/person/{scheme}/{identifier}"). The multi version of such a
+        method fetches the objects for many identifiers concurrently.
+        """
+        if self.kind != "GET" or not self.path_params:
+            return None
+        if not self.result_type.startswith("Ibis"):
+            return None
+
+        param = self.path_params[-1]
+        if not self.path.endswith("{%s}" % param.name):
+            return None
+        return param
+
+    def find_paging(self):
+        """
+        Returns a (page_style, cursor_param) pair describing how the results
+        of this method may be fetched one page at a time, for methods that
+        return a list and have an int "limit" query parameter. The page
+        style is "offset" if the method also has an int "offset" parameter,
+        or "cursor" if it has a single optional string parameter, giving the
+        identifier of the result to start after (the cursor_param). For
+        other methods, the result is (None, None).
+        """
+        if self.kind != "GET" or\
+           not self.result_type.startswith("java.util.List<"):
+            return None, None
+
+        params = dict((x.name, x) for x in self.query_params)
+        limit = params.get("limit")
+        if limit == None or limit.java_type != "int":
+            return None, None
+
+        offset = params.get("offset")
+        if offset != None and offset.java_type == "int":
+            return "offset", None
+
+        cursor_params = [ x for x in self.query_params
+                          if x.java_type == "java.lang.String" and
+                          ("@param %s [optional]" % x.name) in self.docs ]
+        if len(cursor_params) == 1:
+            return "cursor", cursor_params[0]
+        return None, None
+
     def get_docs(self):
         """
         Get the documentation for this method (decorated with the method's
         HTTP method and path).
         """
+        if self.decorated_docs == None:
+            self.decorated_docs = self.decorate_docs()
+        return self.decorated_docs
+
+    def decorate_docs(self):
+        """
+        Decorate the method's docs with its HTTP method and path.
+        """
         required_query_params = []
         for param in self.query_params:
             if ("@param %s [required]" % param.name) in self.docs:
@@ -225,33 +337,32 @@ class MethodClass:
     This corresponds to a /grails-app/resources/<Xxx>Resource.groovy class
     on the server, and a matching <Xxx>Methods class on the client.
     """
-    def __init__(self, node, className, path):
+    def __init__(self, className, path):
         """
-        Create a method class instance from a top-level <resource> node in
-        the WADL file.
+        Create an empty method class instance for a top-level <resource> node
+        in the WADL file. The docs and methods are filled in by the WADL
+        reader as it encounters them.
         """
         self.name = re.sub("Resource$", "Methods", className)
         self.path = path
-
-        # Find the class docs, if any
         self.docs = ""
-        for child in node.childNodes:
-            if child.nodeType == Node.ELEMENT_NODE and\
-               child.tagName == "doc":
-                self.docs = child.firstChild.nodeValue
-                break
-
-        # Find any methods on the class
         self.methods = []
-        for child in node.childNodes:
-            if child.nodeType == Node.ELEMENT_NODE and\
-               child.tagName == "resource":
-                method_idx = 0
-                for grandchild in child.childNodes:
-                    if grandchild.nodeType == Node.ELEMENT_NODE and\
-                       grandchild.tagName == "method":
-                        self.methods.append(Method(child, self, method_idx))
-                        method_idx += 1
+
+    def find_count_method(self, method):
+        """
+        Returns the method that counts the results of the specified method
+        (e.g., searchCount for search), or None if there isn't one. Each of
+        the count method's parameters must also be a parameter of the method
+        whose results it counts.
+        """
+        param_names = set(x.name for x in method.all_params)
+        for count_method in self.methods:
+            if count_method.name == method.name + "Count" and\
+               count_method.kind == "GET" and\
+               count_method.result_type == "int" and\
+               all(x.name in param_names for x in count_method.all_params):
+                return count_method
+        return None
 
 class Application:
     """
@@ -260,35 +371,230 @@ class Application:
     This is basically just a list of top-level resources, which are
     represented as MethodClass objects.
     """
-    def __init__(self, app):
+    def __init__(self):
         """
-        Create the Application from the top-level <application> node in the
-        WADL file, creating all the child objects underneath it.
+        Create an empty Application. The WADL reader adds each top-level
+        <resource> node's MethodClass to it using add_class().
         """
         self.classes = []
+        self.classes_found = set()
+
+        # The Python code for each class, which is the same for the python
+        # and python3 modules. This is set to a list when both modules are
+        # being generated, so that the code is only generated once.
+        self.python_classes = None
+
+    def add_class(self, className, cls):
+        """
+        Add a MethodClass to the application, checking that the same server
+        class isn't defined twice.
+        """
+        if className in self.classes_found:
+            error("Found 2 copies of class '%s'" % className)
+        self.classes_found.add(className)
+        self.classes.append(cls)
+
+# ==========================================================================
+# WADL readers. The WADL file may be read either by building a complete DOM
+# tree with xml.dom.minidom, or by streaming through it with ElementTree's
+# iterparse(), which discards each top-level <resource> node once it has
+# been processed. Both produce exactly the same Application model.
+# ==========================================================================
+
+def local_name(tag):
+    """
+    Strip any "{namespace}" prefix from an ElementTree tag name.
+    """
+    if tag.startswith("{"): return tag[tag.find("}")+1:]
+    return tag
+
+class DomNodes:
+    """
+    Accessors for the child elements, attributes and text of minidom nodes.
+    """
+    @staticmethod
+    def elements(node):
+        for child in node.childNodes:
+            if child.nodeType == Node.ELEMENT_NODE:
+                yield child.tagName, child
+
+    @staticmethod
+    def attrs(node):
+        return dict(node.attributes.items())
+
+    @staticmethod
+    def text(node):
+        return node.firstChild.nodeValue if node.firstChild else ""
+
+class EtreeNodes:
+    """
+    Accessors for the child elements, attributes and text of ElementTree
+    elements.
+    """
+    @staticmethod
+    def elements(node):
+        for child in node:
+            yield local_name(child.tag), child
+
+    @staticmethod
+    def attrs(node):
+        return node.attrib
+
+    @staticmethod
+    def text(node):
+        return node.text or ""
 
-        # Look for the <resources> node
-        resources = None
-        for child in app.childNodes:
-            if child.nodeType == Node.ELEMENT_NODE and\
-               child.tagName == "resources":
-                resources = child
-                break
-        if resources == None:
-            error("Failed to find '<resources>' node")
-
-        # Process each child <resource> node (class definitions)
-        classes_found = set()
-        for child in resources.childNodes:
-            if child.nodeType == Node.ELEMENT_NODE and\
-               child.tagName == "resource":
-                path = child.getAttribute("path")
-                className = child.getAttribute("className")
-                if path != None and className != None:
-                    if className in classes_found:
-                        error("Found 2 copies of class '%s'" % className)
-                    classes_found.add(className)
-                    self.classes.append(MethodClass(child, className, path))
+def read_method_resource(cls, node, nodes):
+    """
+    Read all the methods from a second-level <resource> node in a single
+    pass over its children, adding them to the specified MethodClass. The
+    nodes argument is DomNodes or EtreeNodes, according to the type of node.
+    """
+    path_params = []
+    methods = []
+    for tag, child in nodes.elements(node):
+        if tag == "param":
+            path_params.append(Param(nodes.attrs(child)))
+        elif tag == "method":
+            methods.append(child)
+
+    for method in methods:
+        # Find the method docs, if any, and the <request> node (which holds
+        # any non-path parameters)
+        docs = None
+        request = None
+        for tag, child in nodes.elements(method):
+            if tag == "doc":
+                if docs == None: docs = nodes.text(child)
+            elif tag == "request":
+                if request != None:
+                    error("Can't handle multiple <request> nodes under "\
+                          "a single <method> node")
+                request = child
+
+        # Process any query parameters in the <request> node, and any form
+        # parameters in its <representation> node
+        query_params = []
+        form_params = []
+        if request != None:
+            representation = None
+            for tag, child in nodes.elements(request):
+                if tag == "param":
+                    query_params.append(Param(nodes.attrs(child)))
+                elif tag == "representation":
+                    if representation != None:
+                        error("Can't handle multiple <representation> "\
+                              "nodes under a <request> node")
+                    representation = child
+                    for tag2, child2 in nodes.elements(representation):
+                        if tag2 == "param":
+                            form_params.append(Param(nodes.attrs(child2)))
+
+        cls.methods.append(Method(cls, nodes.attrs(node).get("path", ""),
+                                  path_params, nodes.attrs(method), docs or "",
+                                  query_params, form_params))
+
+def read_wadl_dom(wadl_file):
+    """
+    Read the WADL file by parsing it into a complete xml.dom.minidom tree.
+    """
+    doc = xml.dom.minidom.parse(wadl_file)
+    app = Application()
+
+    # Look for the <resources> node
+    resources = None
+    for tag, child in DomNodes.elements(doc.documentElement):
+        if tag == "resources":
+            resources = child
+            break
+    if resources == None:
+        error("Failed to find '<resources>' node")
+
+    # Process each child <resource> node (class definitions)
+    for tag, child in DomNodes.elements(resources):
+        if tag == "resource":
+            className = child.getAttribute("className")
+            cls = MethodClass(className, child.getAttribute("path"))
+            cls_docs_found = False
+            for tag2, grandchild in DomNodes.elements(child):
+                if tag2 == "doc":
+                    if not cls_docs_found:
+                        cls.docs = DomNodes.text(grandchild)
+                        cls_docs_found = True
+                elif tag2 == "resource":
+                    read_method_resource(cls, grandchild, DomNodes)
+            app.add_class(className, cls)
+
+    return app
+
+def read_wadl_streaming(wadl_file):
+    """
+    Read the WADL file in a single streaming pass using ElementTree's
+    iterparse(). Each second-level <resource> node is converted to Method
+    objects as soon as it has been fully read, and is then discarded, so
+    memory use is bounded by the size of the largest such node rather than
+    the size of the whole file.
+    """
+    app = Application()
+    resources_state = 0 # 0 => not seen, 1 => in <resources>, 2 => done
+    cls = None
+    className = None
+    cls_docs_found = False
+
+    # Stack of (tag, element) pairs for the currently open elements
+    stack = []
+
+    for event, elem in ElementTree.iterparse(wadl_file, ("start", "end")):
+        if event == "start":
+            tag = local_name(elem.tag)
+            depth = len(stack)
+            stack.append((tag, elem))
+
+            if depth == 1 and tag == "resources" and resources_state == 0:
+                resources_state = 1
+            elif depth == 2 and tag == "resource" and resources_state == 1:
+                className = elem.get("className", "")
+                cls = MethodClass(className, elem.get("path", ""))
+                cls_docs_found = False
+            continue
+
+        tag, elem = stack.pop()
+        depth = len(stack)
+
+        if cls != None and depth == 3:
+            # A child of a top-level <resource> node
+            if tag == "doc" and not cls_docs_found:
+                cls.docs = EtreeNodes.text(elem)
+                cls_docs_found = True
+            elif tag == "resource":
+                read_method_resource(cls, elem, EtreeNodes)
+            stack[-1][1].remove(elem)
+        elif cls != None and depth == 2 and tag == "resource":
+            app.add_class(className, cls)
+            cls = None
+            stack[-1][1].remove(elem)
+        elif depth == 1:
+            # Anything else at the top level is no longer needed
+            if tag == "resources" and resources_state == 1:
+                resources_state = 2
+            stack[-1][1].remove(elem)
+
+    if resources_state == 0:
+        error("Failed to find '<resources>' node")
+
+    return app
+
+WADL_READERS = { "stream": read_wadl_streaming,
+                 "minidom": read_wadl_dom }
+
+def read_wadl(wadl_file, parser="stream"):
+    """
+    Read and parse the WADL file using the specified parser ("stream" or
+    "minidom"), returning the Application model.
+    """
+    if parser not in WADL_READERS:
+        error("Unsupported parser: '%s'" % parser)
+    return WADL_READERS[parser](wadl_file)
 
 # ==========================================================================
 # Common code to help generate client code.
@@ -340,15 +646,20 @@ def aligned_output(cols, indent, tab_size=4):
         widths.append(indents[col] - indents[col-1])
 
     # Now output the actual tabular values
-    result = ""
+    rows = []
     for row in range(0, nrows):
-        if row > 0:
-            result += ",\n" + (" " * indent)
-        if len(cols) > 1:
-            for col in range(0, ncols-1):
-                result += cols[col][row].ljust(widths[col])
-        result += cols[-1][row]
-    return result
+        values = [ cols[col][row].ljust(widths[col])
+                   for col in range(0, ncols-1) ]
+        values.append(cols[-1][row])
+        rows.append("".join(values))
+    return (",\n" + (" " * indent)).join(rows)
+
+# Compiled regular expressions used by list_items_to_text()
+UL_TAG_RE = re.compile("</?ul[^>]*>")
+LI_TAG_RE = re.compile("</?li[^>]*>")
+HTML_TAG_RE = re.compile("<[^>]+>")
+LINE_START_SPACE_RE = re.compile("(?m)^\\s*")
+LINE_START_RE = re.compile("(?m)^")
 
 def list_items_to_text(docs):
     """
@@ -360,15 +671,15 @@ def list_items_to_text(docs):
     docs = docs.strip()
 
     # Remove any <ul> tags (the <li> tags are all we need)
-    docs = re.sub("</?ul[^>]*>", "", docs)
+    docs = UL_TAG_RE.sub("", docs)
 
     # Iterate through all the <li> start and end tags, tracking the nested
     # list depth (-1 => not in a list, 0 => in top-level list, ...)
-    result = ''
+    result = []
     depth = -1
     end_idx = 0
 
-    for li_match in re.finditer(re.compile("</?li[^>]*>"), docs):
+    for li_match in LI_TAG_RE.finditer(docs):
         li_start = li_match.start()
         li_end = li_match.end()
         li_text = li_match.group()
@@ -376,22 +687,21 @@ def list_items_to_text(docs):
         # Add on the next segment of text. If we're in a list, remove any
         # other HTML tags it contains so list items are plain text.
         segment = docs[end_idx:li_start].strip()
-        if depth >= 0: segment = re.sub("<[^>]+>", "", segment)
+        if depth >= 0: segment = HTML_TAG_RE.sub("", segment)
 
         if segment:
             if depth >= 0:
                 # We're in a list, so add a bullet point marker to the first
                 # line and align any later lines with the first line's text
-                segment = re.sub("(?m)^\\s*", "  ", segment)
+                segment = LINE_START_SPACE_RE.sub("  ", segment)
                 segment = "* " + segment[2:]
 
                 # Add more indentation according to the list nesting depth
-                if depth > 0: segment = re.sub("(?m)^", "  "*depth, segment)
+                if depth > 0: segment = LINE_START_RE.sub("  "*depth, segment)
 
-            # Add the segment, with a blank line before (and later, after)
-            # for compatibility with Sphinx
-            if result: result += "\n\n"
-            result += segment
+            # Add the segment. The segments are separated by blank lines for
+            # compatibility with Sphinx.
+            result.append(segment)
         end_idx = li_end
 
         # Track the list nesting depth
@@ -401,10 +711,9 @@ def list_items_to_text(docs):
     # Add the final segment (assumed to not be in a list)
     segment = docs[end_idx:].strip()
     if segment:
-        if result: result += "\n\n"
-        result += segment
+        result.append(segment)
 
-    return result
+    return "\n\n".join(result)
 
 def comment_out(text, comment="#"):
     """
@@ -413,43 +722,183 @@ def comment_out(text, comment="#"):
     """
     text = text.strip()
 
-    result = ""
-    for line in text.split("\n"):
-        if line: result += comment+" "+line+"\n"
-        else: result += comment+"\n"
+    lines = [ comment+" "+line if line else comment
+              for line in text.split("\n") ]
 
-    return result.strip()
+    return "\n".join(lines).strip()
 
-def update_file_if_changed(filename, contents):
+def file_digest(filename):
     """
-    Update a file using the specified contents. We deliberately avoid touching
-    the file if it's contents haven't changed, so that re-compiles aren't
-    triggered unnecessariliy, and tar/jar files don't need updating if nothing
-    has really changed.
+    Returns the SHA-1 hex digest of a file's contents.
     """
-    if len(content) < 10:
-        error("Failed to generate valid file contents")
+    h = hashlib.sha1()
+    f = open(filename, "rb")
+    try:
+        for block in iter(lambda: f.read(65536), b""):
+            h.update(block)
+    finally:
+        f.close()
+    return h.hexdigest()
 
-    # Any existing file contents
+def fsync_dir(dirname):
+    """
+    Flush a directory's entries to disk, so that files renamed into it
+    survive a crash. This isn't possible on all platforms (e.g., Windows),
+    in which case it does nothing.
+    """
+    if not hasattr(os, "O_DIRECTORY"): return
+    fd = os.open(dirname, os.O_RDONLY | os.O_DIRECTORY)
     try:
-        f = open(filename, "rb")
-        try:
-            old_content = f.read()
-        finally:
-            f.close()
-    except IOError:
-        old_content = None
-
-    # Write the file if it has changed (or didn't exist)
-    if content != old_content:
-        f = open(filename, "w")
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_file_atomically(filename, data, fsync=True):
+    """
+    Write some data (bytes) to a file by writing a temporary file alongside
+    it and renaming it into place, so that readers never see a partially
+    written file.
+    """
+    tmp_filename = filename + ".tmp"
+    f = open(tmp_filename, "wb")
+    try:
+        f.write(data)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        f.close()
+    os.replace(tmp_filename, filename)
+    if fsync: fsync_dir(os.path.dirname(os.path.abspath(filename)))
+
+class OutputWriter:
+    """
+    Writes the generated files. We deliberately avoid touching any file whose
+    contents haven't changed, so that re-compiles aren't triggered
+    unnecessariliy, and tar/jar files don't need updating if nothing has
+    really changed.
+
+    Each file's contents are streamed into a temporary file alongside the
+    real one, computing their size and hash as they go, so the whole file is
+    never held in memory. An existing file is only read (to hash it) if its
+    size matches. Only changed files are flushed to disk, and they are then
+    renamed into place together by commit(), so if generation fails part way
+    through, none of the existing files are touched (and discard() removes
+    the temporary files).
+    """
+    def __init__(self, fsync=True):
+        self.fsync = fsync
+        self.pending = []
+        self.files = {}
+
+    def write(self, filename, contents):
+        """
+        Write a file, unless it is unchanged. The contents may be a string or
+        an iterable of strings.
+        """
+        if isinstance(contents, str): contents = [ contents ]
+
+        tmp_filename = filename + ".tmp"
+        h = hashlib.sha1()
+        size = 0
+        f = open(tmp_filename, "wb")
         try:
-            f.write(content)
-            print("%s ... *** UPDATED ***" % filename)
-        finally:
-            f.close()
-    else:
-        print("%s ... unchanged" % filename)
+            try:
+                for chunk in contents:
+                    data = chunk.encode("utf-8")
+                    f.write(data)
+                    h.update(data)
+                    size += len(data)
+
+                # Compare with any existing file, by size first and then by
+                # hash, and only flush the file to disk if it has changed
+                digest = h.hexdigest()
+                try:
+                    old_size = os.stat(filename).st_size
+                except OSError:
+                    old_size = None
+                changed = old_size != size or file_digest(filename) != digest
+
+                if changed and size >= 10 and self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            finally:
+                f.close()
+        except BaseException:
+            os.remove(tmp_filename)
+            raise
+
+        if size < 10:
+            os.remove(tmp_filename)
+            error("Failed to generate valid file contents for '%s'" % filename)
+
+        if changed:
+            self.pending.append((tmp_filename, filename))
+            self.files[filename] = (digest, size, "updated")
+        else:
+            os.remove(tmp_filename)
+            self.files[filename] = (digest, size, "unchanged")
+
+    def record_cached(self, filename, digest, size):
+        """
+        Record a file that was skipped because the cache shows that it is
+        unchanged.
+        """
+        self.files[filename] = (digest, size, "cached")
+
+    def commit(self):
+        """
+        Rename all the changed files into place.
+        """
+        dirs = set()
+        for tmp_filename, filename in self.pending:
+            os.replace(tmp_filename, filename)
+            dirs.add(os.path.dirname(os.path.abspath(filename)))
+        if self.fsync:
+            for dirname in sorted(dirs): fsync_dir(dirname)
+        self.pending = []
+
+    def discard(self):
+        """
+        Remove the temporary files of any changed files that have not been
+        committed (if generation failed part way through), leaving the
+        existing files untouched.
+        """
+        for tmp_filename, filename in self.pending:
+            try:
+                os.remove(tmp_filename)
+            except OSError:
+                pass
+        self.pending = []
+
+    def summary(self, verbose=False):
+        """
+        Print a summary of the files written to each output directory, and
+        optionally the status of each file.
+        """
+        dirs = {}
+        for filename in sorted(self.files):
+            status = self.files[filename][2]
+            if verbose: print("%s ... %s" % (filename, status))
+            counts = dirs.setdefault(os.path.dirname(filename) or ".", {})
+            counts[status] = counts.get(status, 0) + 1
+
+        for dirname in sorted(dirs):
+            counts = dirs[dirname]
+            print("%s: %d updated, %d unchanged, %d cached"
+                  % (dirname, counts.get("updated", 0),
+                     counts.get("unchanged", 0), counts.get("cached", 0)))
+
+    def write_manifest(self, filename):
+        """
+        Write a manifest listing all the generated files (whether updated or
+        not), with their sizes and SHA-1 hashes, in JSON format.
+        """
+        files = {}
+        for name, (digest, size, status) in self.files.items():
+            files[name] = { "sha1": digest, "size": size }
+        data = json.dumps({ "files": files }, indent=1, sort_keys=True)
+        write_file_atomically(filename, (data+"\n").encode("utf-8"), self.fsync)
 
 # ==========================================================================
 # Code to generate the Java client classes.
@@ -591,7 +1040,7 @@ def generate_java_class(cls):
     Generate the Java code for a single XxxMethods class, using the
     JAVA_CLASS_TEMPLATE.
     """
-    methods = "".join(generate_java_method(x) for x in cls.methods)
+    methods = "".join(method_code("java", cls, x) for x in cls.methods)
 
     return JAVA_CLASS_TEMPLATE % { "licence": LICENCE,
                                    "class_docs": cls.docs,
@@ -617,6 +1066,353 @@ PYTHON_METHOD_TEMPLATE = '''    def %(method_name)s(%(method_params)s):
         return %(result)s
 '''
 
+PYTHON_ASYNC_METHOD_TEMPLATE = '''    async def %(method_name)s(%(method_params)s):
+        """
+%(method_docs)s
+        """
+        path = "%(method_path)s"
+        path_params = {%(path_params)s}
+        query_params = {%(query_params)s}
+        form_params = {%(form_params)s}
+        result = await self.conn.invoke_method("%(method_kind)s", path,
+                                               path_params, query_params,
+                                               form_params)
+        if result.error:
+            raise IbisException(result.error)
+        return %(result)s
+'''
+
+PYTHON_BATCHED_METHOD_TEMPLATE = '''
+    def %(method_name)sBatched(%(method_params)s):
+        """
+        Batched version of :any:`%(method_name)s`, accepting any number of
+        identifiers.
+
+        The identifiers are split into chunks that fit within the server's
+        URL length limit, and the chunks are fetched using up to
+        `max_workers` concurrent calls to :any:`%(method_name)s`. This
+        requires a connection that may be used from multiple threads, such as
+        a `PooledIbisClientConnection`. Any other parameters are passed on to
+        :any:`%(method_name)s` unchanged.
+
+        **Parameters**
+          `%(batch_param)s` : iterable of str
+            [required] The identifiers.
+
+          `max_workers` : int
+            [optional] The maximum number of concurrent calls (default 4).
+
+        **Returns**
+          %(return_type)s
+            The results, in the order of the identifiers requested. Any
+            identifiers not found are omitted.
+        """
+        ids = _unique_ids(%(batch_param)s)
+        results = _run_batches(lambda chunk: self.%(method_name)s(%(call_args)s),
+                               _batch_ids(ids), max_workers)
+        return _order_results(ids, results)
+'''
+
+PYTHON_ASYNC_BATCHED_METHOD_TEMPLATE = '''
+    async def %(method_name)sBatched(%(method_params)s):
+        """
+        Batched version of :any:`%(method_name)s`, accepting any number of
+        identifiers.
+
+        The identifiers are split into chunks that fit within the server's
+        URL length limit, and the chunks are fetched concurrently (limited
+        by the size of the connection pool). Any other parameters are passed
+        on to :any:`%(method_name)s` unchanged.
+
+        **Parameters**
+          `%(batch_param)s` : iterable of str
+            [required] The identifiers.
+
+        **Returns**
+          %(return_type)s
+            The results, in the order of the identifiers requested. Any
+            identifiers not found are omitted.
+        """
+        ids = _unique_ids(%(batch_param)s)
+        results = await asyncio.gather(*[ self.%(method_name)s(%(call_args)s)
+                                          for chunk in _batch_ids(ids) ])
+        return _order_results(ids, results)
+'''
+
+PYTHON_PAGED_METHOD_TEMPLATE = '''
+    def %(method_name)sIter(%(method_params)s):
+        """
+        Iterate over all the results of :any:`%(method_name)s`, fetching
+        them from the server one page at a time, so that only one page of
+        results need be held in memory at once.%(count_docs)s
+
+        If `prefetch` is true, each page of results is fetched in a
+        background thread while the previous page is being consumed. The
+        other parameters are the same as for :any:`%(method_name)s`.
+
+        **Parameters**
+          `page_size` : int
+            [optional] The number of results to fetch in each call (default
+            100).
+
+          `prefetch` : bool
+            [optional] Whether to fetch each page ahead of time (default
+            True).
+
+        **Returns**
+          iterator of %(result_type)s
+            The results, in the same order as :any:`%(method_name)s`.
+        """
+%(count)s        def fetch_page(%(state)s):
+            results = self.%(method_name)s(%(call_args)s) or []
+            if %(last_page)s:
+                return results, None
+            return results, %(next_state)s
+
+        return _iter_pages(fetch_page, %(first_state)s, prefetch)
+'''
+
+PYTHON_ASYNC_PAGED_METHOD_TEMPLATE = '''
+    async def %(method_name)sIter(%(method_params)s):
+        """
+        Asynchronously iterate over all the results of
+        :any:`%(method_name)s`, fetching them from the server one page at a
+        time, so that only one page of results need be held in memory at
+        once.%(count_docs)s
+
+        If `prefetch` is true, each page of results is fetched in a separate
+        task while the previous page is being consumed. The other parameters
+        are the same as for :any:`%(method_name)s`.
+
+        **Parameters**
+          `page_size` : int
+            [optional] The number of results to fetch in each call (default
+            100).
+
+          `prefetch` : bool
+            [optional] Whether to fetch each page ahead of time (default
+            True).
+
+        **Returns**
+          asynchronous iterator of %(result_type)s
+            The results, in the same order as :any:`%(method_name)s`.
+        """
+%(count)s        async def fetch_page(%(state)s):
+            results = await self.%(method_name)s(%(call_args)s) or []
+            if %(last_page)s:
+                return results, None
+            return results, %(next_state)s
+
+        async for result in _aiter_pages(fetch_page, %(first_state)s, prefetch):
+            yield result
+'''
+
+# Helper functions for the batched and paged methods, included in all the
+# Python methods modules
+PYTHON_HELPERS = '''# The maximum URL-encoded length of the identifiers passed to a single call
+# of a list-style method. The server limits the URL path to around 8000
+# characters, and this leaves room for the rest of the URL.
+MAX_BATCH_IDS_LENGTH = 6000
+
+def _unique_ids(ids):
+    """
+    Returns a list of the identifiers in an iterable, without duplicates.
+    """
+    seen = set()
+    unique_ids = []
+    for id in ids:
+        id = str(id)
+        if id.lower() not in seen:
+            seen.add(id.lower())
+            unique_ids.append(id)
+    return unique_ids
+
+def _batch_ids(ids, max_length=MAX_BATCH_IDS_LENGTH):
+    """
+    Split a list of identifiers into comma-separated chunks, each of which
+    has a URL-encoded length of at most max_length (unless it contains just
+    one very long identifier).
+    """
+    chunks = []
+    chunk = []
+    length = 0
+    for id in ids:
+        id_length = len(quote(id, "")) + 3 # Including an encoded comma
+        if chunk and length + id_length > max_length:
+            chunks.append(",".join(chunk))
+            chunk = []
+            length = 0
+        chunk.append(id)
+        length += id_length
+    if chunk:
+        chunks.append(",".join(chunk))
+    return chunks
+
+def _result_keys(result):
+    """
+    Returns the identifiers (in lowercase) that might have been used to
+    request a person, institution or group.
+    """
+    keys = []
+    identifier = getattr(result, "identifier", None)
+    if identifier is not None:
+        keys.append(identifier.value)
+        keys.append("%s/%s" % (identifier.scheme, identifier.value))
+    for name in ("instid", "groupid", "name"):
+        value = getattr(result, name, None)
+        if value is not None:
+            keys.append(value)
+    return [ str(key).lower() for key in keys ]
+
+def _result_cursor(result):
+    """
+    Returns the identifier of a person, institution or group, for use as the
+    starting point of the next page of results of a paged method.
+    """
+    identifier = getattr(result, "identifier", None)
+    if identifier is not None:
+        return identifier.value
+    return getattr(result, "instid", None) or getattr(result, "groupid", None)
+
+def _order_results(ids, results):
+    """
+    Combine the lists of results from each chunk of a batched call, sorting
+    them into the order of the identifiers requested. Any results that
+    can't be matched to an identifier are put at the end.
+    """
+    positions = dict((id.lower(), idx) for idx, id in enumerate(ids))
+    combined = []
+    for chunk_results in results:
+        if chunk_results:
+            combined.extend(chunk_results)
+
+    def position(result):
+        matches = [ positions[key] for key in _result_keys(result)
+                    if key in positions ]
+        return min(matches) if matches else len(ids)
+
+    return sorted(combined, key=position)
+
+'''
+
+# Helper functions for running the batched methods in multiple threads, and
+# prefetching pages of results in the paged methods, included in the Python
+# 2 and Python 3 methods modules
+PYTHON_THREAD_HELPERS = '''def _run_batches(fn, chunks, max_workers):
+    """
+    Call fn on each chunk, using up to max_workers threads, and return the
+    list of results in the same order as the chunks. If any call fails, the
+    first exception raised is re-raised once all the threads have finished.
+    """
+    results = [None] * len(chunks)
+    if max_workers <= 1 or len(chunks) <= 1:
+        for idx, chunk in enumerate(chunks):
+            results[idx] = fn(chunk)
+        return results
+
+    lock = threading.Lock()
+    next_chunk = [0]
+    errors = []
+
+    def worker():
+        while True:
+            with lock:
+                idx = next_chunk[0]
+                if idx >= len(chunks) or errors: return
+                next_chunk[0] += 1
+            try:
+                results[idx] = fn(chunks[idx])
+            except Exception as e:
+                with lock: errors.append(e)
+                return
+
+    threads = [ threading.Thread(target=worker)
+                for i in range(min(max_workers, len(chunks))) ]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+class _Prefetch(threading.Thread):
+    """
+    A background thread calling fn(arg), used to fetch the next page of
+    results of a paged method ahead of time.
+    """
+    def __init__(self, fn, arg):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.fn = fn
+        self.arg = arg
+        self.value = None
+        self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            self.value = self.fn(self.arg)
+        except Exception as e:
+            self.error = e
+
+    def result(self):
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+def _iter_pages(fetch_page, state, prefetch):
+    """
+    Iterate over the results of a paged method. fetch_page(state) returns a
+    page of results and the state needed to fetch the next page (None after
+    the last page). If prefetch is true, each page is fetched in a
+    background thread while the previous page is being consumed.
+    """
+    results, state = fetch_page(state)
+    while True:
+        pending = None
+        if prefetch and state is not None:
+            pending = _Prefetch(fetch_page, state)
+        for result in results:
+            yield result
+        if state is None:
+            return
+        if pending:
+            results, state = pending.result()
+        else:
+            results, state = fetch_page(state)
+
+'''
+
+# Helper function for iterating over the pages of results of the paged
+# methods, included in the asyncio methods module
+PYTHON_ASYNC_HELPERS = '''async def _aiter_pages(fetch_page, state, prefetch):
+    """
+    Asynchronously iterate over the results of a paged method. fetch_page
+    is a coroutine function returning a page of results and the state needed
+    to fetch the next page (None after the last page). If prefetch is true,
+    each page is fetched in a separate task while the previous page is being
+    consumed.
+    """
+    results, state = await fetch_page(state)
+    while True:
+        pending = None
+        if prefetch and state is not None:
+            pending = asyncio.ensure_future(fetch_page(state))
+        try:
+            for result in results:
+                yield result
+        except BaseException:
+            if pending: pending.cancel()
+            raise
+        if state is None:
+            return
+        if pending:
+            results, state = await pending
+        else:
+            results, state = await fetch_page(state)
+
+'''
+
 def get_python_param_type(param):
     """
     Returns the python type of a parameter (for documentation only).
@@ -664,10 +1460,78 @@ def get_python_return_type(method):
 
     return python_type + ":any:`" + java_type + "`"
 
+# Compiled regular expressions used by javadocs_to_pydocs() and
+# javadocs_to_phpdocs(), in the order in which they are applied
+DOC_LINE_PREFIX_RE = re.compile("(?m)^\\s*[*][ ]?")
+HTML_HEADING_RE = re.compile("(?s)<h[1-5][^>]*>(.+?)</h[1-5]>")
+HTML_BOLD_RE = re.compile("(?s)<b>(.+?)</b>")
+HTML_CODE_NAME_RE = re.compile("<code[^>]*>([^\\s\"]+?)</code>")
+HTML_CODE_LINE_RE = re.compile("<code[^>]*>(.+?)</code>")
+HTML_CODE_BLOCK_RE = re.compile("(?s)<code[^>]*>(.+?)</code>")
+HTML_PRE_BLOCK_RE = re.compile("(?s)<pre[^>]*>(.+?)</pre>")
+HTML_NON_LINK_TAG_RE = re.compile("<(?!a|/a)[^>]+>")
+HTML_LINK_RE = re.compile("(?s)<a href=\"([^\"]*)\"[^>]*>([^<]*)</a>")
+LINK_NAMED_METHOD_RE = re.compile("[{]@link\\s+#([^}\\s]+)\\s+([^}]+)[}]")
+LINK_METHOD_RE = re.compile("[{]@link\\s+#([^}]+)[}]")
+LINK_NAMED_RE = re.compile("[{]@link\\s+([^}\\s]+)\\s+([^}]+)[}]")
+LINK_RE = re.compile("[{]@link\\s+([^}]+)[}]")
+CODE_NULL_RE = re.compile("[{]@code\\s+null[}]")
+CODE_TRUE_RE = re.compile("[{]@code\\s+true[}]")
+CODE_FALSE_RE = re.compile("[{]@code\\s+false[}]")
+CODE_NAME_RE = re.compile("[{]@code\\s+([^}\\s\"]+)[}]")
+CODE_RE = re.compile("[{]@code\\s+([^}]+)[}]")
+LITERAL_RE = re.compile("[{]@literal\\s+([^}]+)[}]")
+AUTHOR_RE = re.compile("@author\\s+(.*)$")
+NOTE_RE = re.compile("(?s)NOTE:\\s+(.*?)(?=(\n\n|$))")
+PARAMS_START_RE = re.compile("(?s)(@param .*)")
+PARAM_RE = re.compile("""(?sx)
+    @param\\s+([^\\s]+)\\s+             # Parameter name
+    (.*?)(?=(@param|@return|@throw|$))  # Parameter docs
+    """)
+RETURN_RE = re.compile("(?s)@return\\s+(.*?)(?=(@throw|$))")
+LINE_END_SPACE_RE = re.compile("(?m)\\s+$")
+
+def indented_code_block(match):
+    """
+    re.sub() callback to replace an HTML <code> or <pre> block with a reST
+    code-block.
+    """
+    code_text = LINE_START_RE.sub("  ", match.group(1).strip())
+    return "\n.. code-block:: python\n\n" + code_text
+
+def note_paragraph(match):
+    """
+    re.sub() callback to replace a "NOTE:" paragraph with a reST note.
+    """
+    note_text = LINE_START_RE.sub("  ", match.group(1).strip())
+    return ".. note::\n" + note_text
+
+# Cache of converted docs. Many methods have identical docs, and the python
+# and python3 modules convert all the same docs.
+pydocs_cache = {}
+
 def javadocs_to_pydocs(docs, cls, line_prefix="", method=None):
     """
     Convert some javadocs to pydocs. This is plain text with some reST
     (reStructuredText) markup.
+
+    The result depends only on the docs, the class name, the line prefix
+    and the method's parameter and result types, so it is cached on those.
+    """
+    key = (docs, cls.name, line_prefix)
+    if method:
+        key += (method.result_type,
+                tuple((p.name, p.kind, p.java_type) for p in method.all_params))
+
+    result = pydocs_cache.get(key)
+    if result == None:
+        result = convert_javadocs_to_pydocs(docs, cls, line_prefix, method)
+        pydocs_cache[key] = result
+    return result
+
+def convert_javadocs_to_pydocs(docs, cls, line_prefix, method):
+    """
+    Convert some javadocs to pydocs (uncached).
     """
     docs = docs.strip()
 
@@ -676,51 +1540,37 @@ def javadocs_to_pydocs(docs, cls, line_prefix="", method=None):
     if docs.endswith("*/"): docs = docs[:-2].strip()
 
     # Remove any comment line prefixes
-    docs = re.sub("(?m)^\\s*[*][ ]?", "", docs)
+    docs = DOC_LINE_PREFIX_RE.sub("", docs)
 
     # == HTML tag processing ==
 
     # Replace HTML headings with reST headings
-    docs = re.sub("(?s)<h[1-5][^>]*>(.+?)</h[1-5]>", "**\\1**", docs)
+    docs = HTML_HEADING_RE.sub("**\\1**", docs)
 
     # Replace <b>XXX</b> with **XXX**
-    docs = re.sub("(?s)<b>(.+?)</b>", "**\\1**", docs)
+    docs = HTML_BOLD_RE.sub("**\\1**", docs)
 
     # Replace simple <code>XXX</code> blocks with `XXX`, when XXX looks like
     # a paramter or field name
-    docs = re.sub("<code[^>]*>([^\\s\"]+?)</code>", "`\\1`", docs)
+    docs = HTML_CODE_NAME_RE.sub("`\\1`", docs)
 
     # Replace other single-line <code>XXX</code> blocks with ``XXX``
-    docs = re.sub("<code[^>]*>(.+?)</code>", "``\\1``", docs)
+    docs = HTML_CODE_LINE_RE.sub("``\\1``", docs)
 
     # Replace all other <code> blocks with reST code-blocks
-    code_pattern = re.compile("(?s)<code[^>]*>(.+?)</code>")
-    code_match = code_pattern.search(docs)
-    while code_match:
-        code_text = code_match.group(1).strip()
-        code_text = re.sub("(?m)^", "  ", code_text)
-        code_text = "\n.. code-block:: python\n\n" + code_text
-        docs = docs[:code_match.start()] + code_text + docs[code_match.end():]
-        code_match = code_pattern.search(docs, code_match.start()+1)
+    docs = HTML_CODE_BLOCK_RE.sub(indented_code_block, docs)
 
     # Similarly, replace <pre> blocks with reST code-blocks
-    pre_pattern = re.compile("(?s)<pre[^>]*>(.+?)</pre>")
-    pre_match = pre_pattern.search(docs)
-    while pre_match:
-        pre_text = pre_match.group(1).strip()
-        pre_text = re.sub("(?m)^", "  ", pre_text)
-        pre_text = "\n.. code-block:: python\n\n" + pre_text
-        docs = docs[:pre_match.start()] + pre_text + docs[pre_match.end():]
-        pre_match = pre_pattern.search(docs, pre_match.start()+1)
+    docs = HTML_PRE_BLOCK_RE.sub(indented_code_block, docs)
 
     # Replace <li> with plain text "*" bullet points (reST format)
     docs = list_items_to_text(docs)
 
     # Remove any other HTML tags, except for <a> tags (links)
-    docs = re.sub("<(?!a|/a)[^>]+>", "", docs)
+    docs = HTML_NON_LINK_TAG_RE.sub("", docs)
 
     # Replace <a href="url">text</a> links with `text <url>`_ reST links
-    docs = re.sub("(?s)<a href=\"([^\"]*)\"[^>]*>([^<]*)</a>", "`\\2 <\\1>`_", docs)
+    docs = HTML_LINK_RE.sub("`\\2 <\\1>`_", docs)
 
     # == End of HTML tag processing ==
 
@@ -733,69 +1583,55 @@ def javadocs_to_pydocs(docs, cls, line_prefix="", method=None):
     # reference, since the Sphinx does not correctly find the right method
     # when there are multiple classes in the same module with methods of the
     # same name.
-    docs = re.sub("[{]@link\\s+#([^}\\s]+)\\s+([^}]+)[}]",
-                  ":any:`\\2 <"+cls.name+".\\1>`", docs)
+    docs = LINK_NAMED_METHOD_RE.sub(":any:`\\2 <"+cls.name+".\\1>`", docs)
 
     # Similiarly, replace method links of the form {@link #XXX} with reST
     # references of the form :any:`${cls.name}.XXX()`.
     #
     # We explicitly add the parentheses, since Sphinx does not do this by
     # default.
-    docs = re.sub("[{]@link\\s+#([^}]+)[}]", ":any:`"+cls.name+".\\1()`", docs)
+    docs = LINK_METHOD_RE.sub(":any:`"+cls.name+".\\1()`", docs)
 
     # Replace any remaining named links of the form {@link XXX YYY} with reST
     # references of the form :any:`YYY <XXX>`.
-    docs = re.sub("[{]@link\\s+([^}\\s]+)\\s+([^}]+)[}]", ":any:`\\2 <\\1>`", docs)
+    docs = LINK_NAMED_RE.sub(":any:`\\2 <\\1>`", docs)
 
     # Then replace any remaining links of the form {@link XXX} with reST
     # references of the form :any:`XXX`.
-    docs = re.sub("[{]@link\\s+([^}]+)[}]", ":any:`\\1`", docs)
+    docs = LINK_RE.sub(":any:`\\1`", docs)
 
     # Replace {@code null} with :any:`None`
-    docs = re.sub("[{]@code\\s+null[}]", ":any:`None`", docs)
+    docs = CODE_NULL_RE.sub(":any:`None`", docs)
 
     # Replace {@code true} with :any:`True`
-    docs = re.sub("[{]@code\\s+true[}]", ":any:`True`", docs)
+    docs = CODE_TRUE_RE.sub(":any:`True`", docs)
 
     # Replace {@code false} with :any:`False`
-    docs = re.sub("[{]@code\\s+false[}]", ":any:`False`", docs)
+    docs = CODE_FALSE_RE.sub(":any:`False`", docs)
 
     # Replace simple {@code XXX} tags with `XXX`, when XXX looks like a
     # paramter or field name
-    docs = re.sub("[{]@code\\s+([^}\\s\"]+)[}]", "`\\1`", docs)
+    docs = CODE_NAME_RE.sub("`\\1`", docs)
 
     # Replace all remaining {@code XXX} tags with ``XXX``
-    docs = re.sub("[{]@code\\s+([^}]+)[}]", "``\\1``", docs)
+    docs = CODE_RE.sub("``\\1``", docs)
 
     # Replace {@literal XXX} with XXX (no special handling)
-    docs = re.sub("[{]@literal\\s+([^}]+)[}]", "\\1", docs)
+    docs = LITERAL_RE.sub("\\1", docs)
 
     # Replace @author with a reST codeauthor directive
-    docs = re.sub("@author\\s+(.*)$", ".. codeauthor:: \\1", docs)
+    docs = AUTHOR_RE.sub(".. codeauthor:: \\1", docs)
 
     # Convert note paragraphs to reST format
-    note_pattern = re.compile("(?s)NOTE:\\s+(.*?)(?=(\n\n|$))")
-    note_match = note_pattern.search(docs)
-    while note_match:
-        note_text = note_match.group(1).strip()
-        note_text = re.sub("(?m)^", "  ", note_text)
-        note_text = ".. note::\n" + note_text
-        docs = docs[:note_match.start()] + note_text + docs[note_match.end():]
-        note_match = note_pattern.search(docs, note_match.start()+1)
+    docs = NOTE_RE.sub(note_paragraph, docs)
 
     # If this is a method's docs, deal with any parameters or returns docs
     if method:
         # Add a parameters section heading, if there are any parameters
-        docs = re.sub("(?s)(@param .*)", "**Parameters**\n\\1", docs)
+        docs = PARAMS_START_RE.sub("**Parameters**\n\\1", docs)
 
         # Convert each parameter to a format the can be handled by Sphinx
-        param_pattern = re.compile("""(?sx)
-            @param\\s+([^\\s]+)\\s+             # Parameter name
-            (.*?)(?=(@param|@return|@throw|$))  # Parameter docs
-            """)
-
-        param_match = param_pattern.search(docs)
-        while param_match:
+        def param_docs(param_match):
             # Get the parameter's name and type
             param_name = param_match.group(1)
             param_type = None
@@ -806,24 +1642,17 @@ def javadocs_to_pydocs(docs, cls, line_prefix="", method=None):
 
             # Construct the new parameter docs
             param_docs = param_match.group(2).strip()
-            param_docs = re.sub("(?m)^", "    ", param_docs)
-            param_docs = "  `" + param_name + "` : " + param_type +\
-                         "\n" + param_docs + "\n\n"
-
-            # Replace the old parameter docs
-            docs = docs[:param_match.start()] +\
-                   param_docs + docs[param_match.end():]
+            param_docs = LINE_START_RE.sub("    ", param_docs)
+            return "  `" + param_name + "` : " + param_type +\
+                   "\n" + param_docs + "\n\n"
 
-            # Move on to the next parameter
-            param_match = param_pattern.search(docs, param_match.start()+1)
+        docs = PARAM_RE.sub(param_docs, docs)
 
         # Convert the return documentation to a similar format
-        return_pattern = re.compile("(?s)@return\\s+(.*?)(?=(@throw|$))")
-
-        return_match = return_pattern.search(docs)
+        return_match = RETURN_RE.search(docs)
         if return_match:
             return_docs = return_match.group(1).strip()
-            return_docs = re.sub("(?m)^", "    ", return_docs)
+            return_docs = LINE_START_RE.sub("    ", return_docs)
             return_docs = "**Returns**\n  " +\
                           get_python_return_type(method) +\
                           "\n" + return_docs
@@ -831,18 +1660,26 @@ def javadocs_to_pydocs(docs, cls, line_prefix="", method=None):
                    return_docs + docs[return_match.end():]
 
     # Add the specified line prefix to each line
-    if line_prefix: docs = re.sub("(?m)^", line_prefix, docs)
+    if line_prefix: docs = LINE_START_RE.sub(line_prefix, docs)
 
     # Strip off end-of-line whitespace
-    docs = re.sub("(?m)\\s+$", "\n", docs)
+    docs = LINE_END_SPACE_RE.sub("\n", docs)
 
     return docs
 
-def generate_python_method(cls, method):
+def generate_python_method(cls, method, is_async=False):
     """
     Generate the Python code for a single web service API method, using the
-    PYTHON_METHOD_TEMPLATE.
+    PYTHON_METHOD_TEMPLATE, or the PYTHON_ASYNC_METHOD_TEMPLATE for an
+    asynchronous method.
     """
+    if is_async:
+        template = PYTHON_ASYNC_METHOD_TEMPLATE
+        indent = 15 + len(method.name)
+    else:
+        template = PYTHON_METHOD_TEMPLATE
+        indent = 9 + len(method.name)
+
     # Method parameters
     last_required_param = 0
     for idx, param in enumerate(method.all_params):
@@ -855,7 +1692,7 @@ def generate_python_method(cls, method):
             param_names.append(param.name+"=None")
         else:
             param_names.append(param.name)
-    method_params = aligned_output([param_names], 9 + len(method.name))
+    method_params = aligned_output([param_names], indent)
 
     # Method docs in plain text
     docs = javadocs_to_pydocs(method.get_docs(), cls, "        ", method)
@@ -886,15 +1723,119 @@ def generate_python_method(cls, method):
     else:
         result = "result.%s" % method.result_field
 
-    return PYTHON_METHOD_TEMPLATE % { "method_name": method.name,
-                                      "method_params": method_params,
-                                      "method_docs": docs,
-                                      "path_params": path_params,
-                                      "query_params": query_params,
-                                      "form_params": form_params,
-                                      "method_kind": method.kind,
-                                      "method_path": path,
-                                      "result": result }
+    code = template % { "method_name": method.name,
+                        "method_params": method_params,
+                        "method_docs": docs,
+                        "path_params": path_params,
+                        "query_params": query_params,
+                        "form_params": form_params,
+                        "method_kind": method.kind,
+                        "method_path": path,
+                        "result": result }
+
+    if method.batch_param:
+        code += generate_python_batched_method(method, param_names, is_async)
+    if method.page_style:
+        code += generate_python_paged_method(cls, method, param_names,
+                                             is_async)
+    return code
+
+def generate_python_batched_method(method, param_names, is_async):
+    """
+    Generate the Python code for the batched version of a list-style method
+    (see Method.find_batch_param()), using the PYTHON_BATCHED_METHOD_TEMPLATE
+    or the PYTHON_ASYNC_BATCHED_METHOD_TEMPLATE. The param_names are those
+    of the underlying method.
+    """
+    if is_async:
+        template = PYTHON_ASYNC_BATCHED_METHOD_TEMPLATE
+        indent = 22 + len(method.name)
+    else:
+        template = PYTHON_BATCHED_METHOD_TEMPLATE
+        indent = 16 + len(method.name)
+        param_names = param_names + ["max_workers=4"]
+    method_params = aligned_output([param_names], indent)
+
+    call_args = []
+    for param in method.all_params:
+        if param is method.batch_param: call_args.append("chunk")
+        else: call_args.append(param.name)
+
+    return template % { "method_name": method.name,
+                        "method_params": method_params,
+                        "batch_param": method.batch_param.name,
+                        "call_args": ", ".join(call_args),
+                        "return_type": get_python_return_type(method) }
+
+def generate_python_paged_method(cls, method, param_names, is_async):
+    """
+    Generate the Python code for the paged version of a method (see
+    Method.find_paging()), using the PYTHON_PAGED_METHOD_TEMPLATE or the
+    PYTHON_ASYNC_PAGED_METHOD_TEMPLATE. The param_names are those of the
+    underlying method. If the class has a matching count method, it is
+    used to find the number of results up front, avoiding a final call
+    that returns no results.
+    """
+    if is_async:
+        template = PYTHON_ASYNC_PAGED_METHOD_TEMPLATE
+        await_ = "await "
+    else:
+        template = PYTHON_PAGED_METHOD_TEMPLATE
+        await_ = ""
+
+    # Method parameters, without the offset and limit
+    param_names = [ x for x in param_names
+                    if x.split("=")[0] not in ("offset", "limit") ]
+    param_names = param_names + ["page_size=100", "prefetch=True"]
+    method_params = aligned_output([param_names],
+                                   len(await_) + 13 + len(method.name))
+
+    # Arguments for each call to fetch a page
+    if method.page_style == "offset":
+        state = "offset"
+        first_state = "0"
+        next_state = "offset + page_size"
+    else:
+        state = method.cursor_param.name
+        first_state = state
+        next_state = "_result_cursor(results[-1])"
+
+    call_args = []
+    for param in method.all_params:
+        if param.name == "limit": call_args.append("page_size")
+        else: call_args.append(param.name)
+    call_args = aligned_output([call_args],
+                               len(await_) + 28 + len(method.name))
+
+    # Count of the results, if available
+    last_page = "len(results) < page_size"
+    count_method = method.page_style == "offset" and\
+                   cls.find_count_method(method)
+    if count_method:
+        count_args = aligned_output([[ x.name for x in count_method.all_params ]],
+                                    len(await_) + 22 + len(count_method.name))
+        count = "        count = %sself.%s(%s)\n\n"\
+                % (await_, count_method.name, count_args)
+        last_page += " or\\\n               offset + page_size >= count"
+        count_docs = "\n\n        The total number of results is found "\
+                     "first, using :any:`%s`." % count_method.name
+    else:
+        count = ""
+        count_docs = ""
+
+    result_type = get_python_return_type(method)
+    if result_type.startswith("list of "): result_type = result_type[8:]
+
+    return template % { "method_name": method.name,
+                        "method_params": method_params,
+                        "count_docs": count_docs,
+                        "result_type": result_type,
+                        "count": count,
+                        "state": state,
+                        "call_args": call_args,
+                        "last_page": last_page,
+                        "next_state": next_state,
+                        "first_state": first_state }
 
 PYTHON_CLASS_TEMPLATE = '''class %(class_name)s:
     """
@@ -905,13 +1846,14 @@ PYTHON_CLASS_TEMPLATE = '''class %(class_name)s:
 
 %(methods)s'''
 
-def generate_python_class(cls):
+def generate_python_class(cls, lang="python"):
     """
     Generate the Python code for a single XxxMethods class, using the
-    PYTHON_CLASS_TEMPLATE.
+    PYTHON_CLASS_TEMPLATE. The lang may be "python" (for both Python 2 and
+    Python 3) or "python3-async".
     """
     docs = javadocs_to_pydocs(cls.docs, cls, "    ")
-    methods = "\n".join(generate_python_method(cls, x) for x in cls.methods)
+    methods = "\n".join(method_code(lang, cls, x) for x in cls.methods)
 
     return PYTHON_CLASS_TEMPLATE % { "class_name": cls.name,
                                      "class_docs": docs,
@@ -929,19 +1871,41 @@ the Python equivalent of the `XxxMethods` Java classes for executing all API
 methods.
 """
 
+import threading
+from urllib import quote
+
 from connection import IbisException
 
-%(classes)s'''
+'''
+
+def generate_python_classes(app):
+    """
+    Generate the Python code for all the XxxMethods classes, one class at a
+    time, for inclusion in either the Python 2 or the Python 3 methods module.
+    If app.python_classes is a list, the code for each class is saved in it
+    (or taken from it, if it has already been generated).
+    """
+    shared = app.python_classes
+    for idx, cls in enumerate(app.classes):
+        if idx > 0: yield "\n"
+        if shared == None:
+            yield generate_python_class(cls)
+        else:
+            if idx == len(shared): shared.append(generate_python_class(cls))
+            yield shared[idx]
 
 def generate_python_module(app):
     """
     Generate the Python code for the entire methods module, containing all
-    the XxxMethods classes, using the PYTHON_MODULE_TEMPLATE.
+    the XxxMethods classes, using the PYTHON_MODULE_TEMPLATE. The code is
+    returned in chunks (one per class), so that it can be streamed to the
+    output file.
     """
-    classes = "\n".join(generate_python_class(x) for x in app.classes)
-
-    return PYTHON_MODULE_TEMPLATE % { "licence": comment_out(LICENCE),
-                                      "classes": classes }
+    yield PYTHON_MODULE_TEMPLATE % { "licence": comment_out(LICENCE) }
+    yield PYTHON_HELPERS
+    yield PYTHON_THREAD_HELPERS
+    for chunk in generate_python_classes(app):
+        yield chunk
 
 # ==========================================================================
 # Code to generate the Python 3 methods module.
@@ -963,19 +1927,647 @@ the Python equivalent of the `XxxMethods` Java classes for executing all API
 methods.
 """
 
+import threading
+from urllib.parse import quote
+
 from .connection import IbisException
 
-%(classes)s'''
+'''
 
 def generate_python3_module(app):
     """
     Generate the Python 3 code for the entire methods module, containing all
     the XxxMethods classes, using the PYTHON3_MODULE_TEMPLATE.
     """
-    classes = "\n".join(generate_python_class(x) for x in app.classes)
+    yield PYTHON3_MODULE_TEMPLATE % { "licence": comment_out(LICENCE) }
+    yield PYTHON_HELPERS
+    yield PYTHON_THREAD_HELPERS
+    for chunk in generate_python_classes(app):
+        yield chunk
+
+# ==========================================================================
+# Code to generate the Python pooled connection module.
+# ==========================================================================
+
+# NOTE: This module is the same for all APIs, so it doesn't depend on the
+# WADL file at all. It is generated alongside the methods module for both
+# Python 2 and Python 3, differing only in its imports.
+
+PYTHON_CONNECTION_TEMPLATE = '''# === AUTO-GENERATED - DO NOT EDIT ===
+
+# --------------------------------------------------------------------------
+%(licence)s
+# --------------------------------------------------------------------------
+
+"""
+Pooled, keep-alive connections to the Lookup/Ibis web service API. This
+module is fully auto-generated.
+
+A `PooledIbisClientConnection` may be used in place of an
+`IbisClientConnection` by any of the `XxxMethods` classes. Rather than
+opening a new HTTPS connection for each API method invoked, it keeps a pool
+of open connections to the server, and re-uses TLS sessions when it does
+need to open a new connection, which greatly reduces the latency of each
+request when making many requests. It is safe to use from multiple threads.
+"""
+
+import base64
+import datetime
+import socket
+import ssl
+import threading
+
+%(imports)s
+
+def _no_response(e):
+    """
+    Test whether an exception from getresponse() means that the server
+    closed the connection before sending any of its response, as it may do
+    with an idle connection. A timeout never counts.
+    """
+    if isinstance(e, socket.timeout):
+        return False
+    if isinstance(e, getattr(httplib, "RemoteDisconnected", ())):
+        return True
+    if isinstance(e, httplib.BadStatusLine):
+        # Python 2 reports an empty status line as "''"
+        return e.line in ("", "''")
+    return isinstance(e, socket.error)
+
+class _HTTPSConnection(httplib.HTTPSConnection):
+    """
+    An HTTPS connection that resumes the pool's most recent TLS session, if
+    possible, rather than performing a full TLS handshake.
+    """
+    def __init__(self, pool, host, port, timeout):
+        httplib.HTTPSConnection.__init__(self, host, port, timeout=timeout,
+                                         context=pool.context)
+        self.pool = pool
+
+    def connect(self):
+        httplib.HTTPConnection.connect(self)
+        kwargs = {"server_hostname": self.host}
+        if self.pool.tls_session is not None:
+            kwargs["session"] = self.pool.tls_session
+        try:
+            self.sock = self.pool.context.wrap_socket(self.sock, **kwargs)
+        except TypeError:
+            # TLS session resumption is not supported (Python < 3.6)
+            kwargs.pop("session", None)
+            self.sock = self.pool.context.wrap_socket(self.sock, **kwargs)
+        self.pool.tls_session = getattr(self.sock, "session", None)
+
+class PooledIbisClientConnection:
+    """
+    Class to connect to the Lookup/Ibis server and invoke web service API
+    methods, keeping up to `pool_size` idle connections open for re-use.
+
+    The HTTP headers (including the authorization header) are computed once,
+    when the connection is created or its credentials are changed, rather
+    than for each request.
+    """
+    def __init__(self, host, port, url_base, check_certs=True, pool_size=4,
+                 timeout=60):
+        self.host = host
+        self.port = port
+        self.url_base = url_base
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        if not self.url_base.startswith("/"):
+            self.url_base = "/" + self.url_base
+        if not self.url_base.endswith("/"):
+            self.url_base += "/"
+
+        if check_certs:
+            self.context = ssl.create_default_context()
+        else:
+            self.context = ssl._create_unverified_context()
+        self.tls_session = None
+
+        self.idle = []
+        self.lock = threading.Lock()
+
+        self.username = "anonymous"
+        self.password = ""
+        self._update_headers()
+
+    def _update_headers(self):
+        credentials = "%%s:%%s" %% (self.username, self.password)
+        auth = base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+        self.headers = {"Accept": "application/xml",
+                        "Authorization": "Basic " + auth,
+                        "Connection": "keep-alive"}
+        self.form_headers = dict(self.headers)
+        self.form_headers["Content-type"] = "application/x-www-form-urlencoded"
+
+    def set_username(self, username):
+        """
+        Set the username to use when connecting to the Lookup/Ibis web
+        service. By default connections are anonymous, which gives read-only
+        access.
+        """
+        self.username = username
+        self._update_headers()
+
+    def set_password(self, password):
+        """
+        Set the password to use when connecting to the Lookup/Ibis web
+        service. This is only necessary when connecting as a group.
+        """
+        self.password = password
+        self._update_headers()
+
+    def close(self):
+        """
+        Close all the idle connections in the pool.
+        """
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+    def _value_to_string(self, value):
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            return value.strftime("%%d %%b %%Y")
+        if isinstance(value, IbisAttribute):
+            return value.encoded_string()
+        return str(value)
+
+    def _build_url(self, path, path_params={}, query_params={}):
+        if path_params:
+            path_params = dict((k, quote(self._value_to_string(v), ""))
+                               for (k, v) in path_params.items()
+                               if v is not None)
+            path = path %% path_params
+
+        params = [ (k, self._value_to_string(v))
+                   for (k, v) in query_params.items() if v is not None ]
+        if "flatten" not in query_params:
+            params.append(("flatten", "true"))
+
+        url = self.url_base + path.strip("/")
+        if params:
+            url += "?" + urlencode(params)
+        return url
+
+    def _get_connection(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop(), True
+        return _HTTPSConnection(self, self.host, self.port, self.timeout), False
+
+    def _release_connection(self, conn):
+        with self.lock:
+            if len(self.idle) < self.pool_size:
+                self.idle.append(conn)
+                return
+        conn.close()
+
+    def invoke_method(self, method, path, path_params={},
+                      query_params={}, form_params={}):
+        """
+        Invoke a web service GET, POST, PUT or DELETE method, re-using an
+        idle connection from the pool if there is one.
+        """
+        url = self._build_url(path, path_params, query_params)
+        if form_params:
+            data = urlencode([ (k, self._value_to_string(v))
+                               for (k, v) in form_params.items()
+                               if v is not None ])
+            headers = self.form_headers
+        else:
+            data = None
+            headers = self.headers
+
+        # The server may have closed an idle connection, in which case the
+        # request is retried with a new one, but only if that can't repeat a
+        # request that the server has already acted on: if the request
+        # couldn't be sent, or if it is a GET and none of the response had
+        # been read. Any failure leaves the connection in an unknown state,
+        # so it is never re-used.
+        while True:
+            conn, reused = self._get_connection()
+            try:
+                conn.request(method, url, data, headers)
+            except socket.error as e:
+                conn.close()
+                if reused and not isinstance(e, socket.timeout): continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+
+            try:
+                response = conn.getresponse()
+            except (httplib.BadStatusLine, socket.error) as e:
+                conn.close()
+                if reused and method == "GET" and _no_response(e): continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+
+            try:
+                content = response.read()
+            except BaseException:
+                conn.close()
+                raise
+            break
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._release_connection(conn)
+
+        content_type = response.getheader("Content-type") or ""
+        if not content_type.startswith("application/xml"):
+            error = IbisError({"status": response.status,
+                               "code": response.reason})
+            error.message = "Unexpected result from server"
+            error.details = content
+            result = IbisResult()
+            result.error = error
+            return result
+
+        parser = IbisResultParser()
+        return parser.parse_xml(content)
+
+def createPooledConnection(pool_size=4):
+    """
+    Create a PooledIbisClientConnection to the Lookup/Ibis web service API
+    at https://www.lookup.cam.ac.uk/.
+    """
+    return PooledIbisClientConnection("www.lookup.cam.ac.uk", 443, "",
+                                      True, pool_size)
+
+def createPooledTestConnection(pool_size=4):
+    """
+    Create a PooledIbisClientConnection to the Lookup/Ibis test web service
+    API at https://lookup-test.csx.cam.ac.uk/.
+    """
+    return PooledIbisClientConnection("lookup-test.csx.cam.ac.uk", 443, "",
+                                      True, pool_size)
+
+def createPooledLocalConnection(pool_size=4):
+    """
+    Create a PooledIbisClientConnection to a Lookup/Ibis web service API
+    running locally on https://localhost:8443/ibis/, without checking its
+    (self-signed) certificates.
+    """
+    return PooledIbisClientConnection("localhost", 8443, "ibis",
+                                      False, pool_size)
+'''
+
+PYTHON_CONNECTION_IMPORTS = """import httplib
+from urllib import quote, urlencode
+
+from dto import IbisAttribute, IbisError, IbisResult, IbisResultParser"""
+
+PYTHON3_CONNECTION_IMPORTS = """import http.client as httplib
+from urllib.parse import quote, urlencode
+
+from .dto import IbisAttribute, IbisError, IbisResult, IbisResultParser"""
+
+def generate_python_connection_module(lang):
+    """
+    Generate the Python ("python" or "python3") code for the pooled
+    connection module, using the PYTHON_CONNECTION_TEMPLATE.
+    """
+    if lang == "python3": imports = PYTHON3_CONNECTION_IMPORTS
+    else: imports = PYTHON_CONNECTION_IMPORTS
+
+    return PYTHON_CONNECTION_TEMPLATE % { "licence": comment_out(LICENCE),
+                                          "imports": imports }
+
+# ==========================================================================
+# Code to generate the asyncio Python 3 methods and connection modules.
+# ==========================================================================
+
+# NOTE: The methods are generated by generate_python_method(), using the
+# PYTHON_ASYNC_METHOD_TEMPLATE, so apart from being coroutines, they are
+# exactly the same as the Python 3 methods.
+
+PYTHON3_ASYNC_MODULE_TEMPLATE = '''# === AUTO-GENERATED - DO NOT EDIT ===
+
+# --------------------------------------------------------------------------
+%(licence)s
+# --------------------------------------------------------------------------
+
+"""
+Asynchronous web service API methods. This module is fully auto-generated,
+and contains asyncio equivalents of the `XxxMethods` Java classes for
+executing all API methods. Each method is a coroutine, and the classes
+should be used with an `AsyncIbisClientConnection` from the
+`async_connection` module.
+"""
+
+import asyncio
+from urllib.parse import quote
+
+from .connection import IbisException
+
+'''
+
+def generate_python3_async_module(app):
+    """
+    Generate the Python 3 code for the entire asynchronous methods module,
+    containing all the XxxMethods classes, using the
+    PYTHON3_ASYNC_MODULE_TEMPLATE.
+    """
+    yield PYTHON3_ASYNC_MODULE_TEMPLATE % { "licence": comment_out(LICENCE) }
+    yield PYTHON_HELPERS
+    yield PYTHON_ASYNC_HELPERS
+    for idx, cls in enumerate(app.classes):
+        if idx > 0: yield "\n"
+        yield generate_python_class(cls, "python3-async")
+
+PYTHON3_ASYNC_CONNECTION_TEMPLATE = '''# === AUTO-GENERATED - DO NOT EDIT ===
+
+# --------------------------------------------------------------------------
+%(licence)s
+# --------------------------------------------------------------------------
+
+"""
+Asynchronous connections to the Lookup/Ibis web service API. This module is
+fully auto-generated.
+
+An `AsyncIbisClientConnection` is used by the `XxxMethods` classes in the
+asynchronous methods module, allowing many API methods to be invoked
+concurrently from a single thread, for example::
+
+    conn = createAsyncConnection()
+    pm = PersonMethods(conn)
+    people = await asyncio.gather(*[ pm.getPerson("crsid", crsid)
+                                     for crsid in crsids ])
+
+The number of requests in progress at any time is limited to the size of
+the connection pool, and the connections are kept open for re-use.
+"""
+
+import asyncio
+import base64
+import datetime
+import ssl
+from urllib.parse import quote, urlencode
 
-    return PYTHON3_MODULE_TEMPLATE % { "licence": comment_out(LICENCE),
-                                       "classes": classes }
+from .dto import IbisAttribute, IbisError, IbisResult, IbisResultParser
+
+class _NoResponse(ConnectionResetError):
+    """
+    The server closed the connection before sending any of its response,
+    as it may do with an idle connection. If `sent` is false, the request
+    couldn't be sent at all.
+    """
+    def __init__(self, message, sent=True):
+        ConnectionResetError.__init__(self, message)
+        self.sent = sent
+
+class AsyncIbisClientConnection:
+    """
+    Class to connect to the Lookup/Ibis server and invoke web service API
+    methods asynchronously, using a pool of up to `pool_size` keep-alive
+    HTTPS connections.
+
+    The HTTP headers (including the authorization header) are computed once,
+    when the connection is created or its credentials are changed, rather
+    than for each request.
+    """
+    def __init__(self, host, port, url_base, check_certs=True, pool_size=8,
+                 timeout=60):
+        self.host = host
+        self.port = port
+        self.url_base = url_base
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        if not self.url_base.startswith("/"):
+            self.url_base = "/" + self.url_base
+        if not self.url_base.endswith("/"):
+            self.url_base += "/"
+
+        if check_certs:
+            self.context = ssl.create_default_context()
+        else:
+            self.context = ssl._create_unverified_context()
+
+        self.idle = []
+        self.semaphore = None
+
+        self.username = "anonymous"
+        self.password = ""
+        self._update_headers()
+
+    def _update_headers(self):
+        credentials = "%%s:%%s" %% (self.username, self.password)
+        auth = base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+        self.headers = ("Host: %%s\\r\\n"
+                        "Accept: application/xml\\r\\n"
+                        "Authorization: Basic %%s\\r\\n"
+                        "Connection: keep-alive\\r\\n"
+                        %% (self.host, auth)).encode("ascii")
+
+    def set_username(self, username):
+        """
+        Set the username to use when connecting to the Lookup/Ibis web
+        service. By default connections are anonymous, which gives read-only
+        access.
+        """
+        self.username = username
+        self._update_headers()
+
+    def set_password(self, password):
+        """
+        Set the password to use when connecting to the Lookup/Ibis web
+        service. This is only necessary when connecting as a group.
+        """
+        self.password = password
+        self._update_headers()
+
+    async def close(self):
+        """
+        Close all the idle connections in the pool.
+        """
+        idle, self.idle = self.idle, []
+        for reader, writer in idle:
+            writer.close()
+
+    def _value_to_string(self, value):
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            return value.strftime("%%d %%b %%Y")
+        if isinstance(value, IbisAttribute):
+            return value.encoded_string()
+        return str(value)
+
+    def _build_url(self, path, path_params={}, query_params={}):
+        if path_params:
+            path_params = dict((k, quote(self._value_to_string(v), ""))
+                               for (k, v) in path_params.items()
+                               if v is not None)
+            path = path %% path_params
+
+        params = [ (k, self._value_to_string(v))
+                   for (k, v) in query_params.items() if v is not None ]
+        if "flatten" not in query_params:
+            params.append(("flatten", "true"))
+
+        url = self.url_base + path.strip("/")
+        if params:
+            url += "?" + urlencode(params)
+        return url
+
+    async def _send_request(self, reader, writer, request):
+        """
+        Send a request and read the response, returning its status, reason,
+        headers (with lower-case names) and body.
+        """
+        try:
+            writer.write(request)
+            await writer.drain()
+        except ConnectionError as e:
+            raise _NoResponse(str(e), sent=False)
+
+        try:
+            status_line = await reader.readline()
+        except ConnectionError:
+            status_line = b""
+        if not status_line:
+            raise _NoResponse("Connection closed by server")
+        version, status, reason = (status_line.decode("latin-1").rstrip()
+                                   .split(" ", 2) + [""])[:3]
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\\r\\n", b"\\n", b""): break
+            name, sep, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0: break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            while (await reader.readline()) not in (b"\\r\\n", b"\\n", b""):
+                pass
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await reader.read()
+            headers["connection"] = "close"
+
+        return int(status), reason, headers, body
+
+    async def _invoke(self, request, idempotent):
+        while True:
+            if self.idle:
+                reader, writer = self.idle.pop()
+                reused = True
+            else:
+                reader, writer = await asyncio.open_connection(
+                    self.host, self.port, ssl=self.context,
+                    server_hostname=self.host)
+                reused = False
+            try:
+                response = await asyncio.wait_for(
+                    self._send_request(reader, writer, request), self.timeout)
+            except _NoResponse as e:
+                # The server may have closed an idle connection, in which
+                # case retry with a new one, unless that could repeat a
+                # request that the server has already acted on
+                writer.close()
+                if reused and (idempotent or not e.sent): continue
+                raise
+            except BaseException:
+                # Any other failure (a timeout, cancellation, an incomplete
+                # read or a malformed response) leaves the connection in an
+                # unknown state, so it can't be re-used
+                writer.close()
+                raise
+
+            status, reason, headers, body = response
+            if headers.get("connection", "").lower() == "close" or\\
+               len(self.idle) >= self.pool_size:
+                writer.close()
+            else:
+                self.idle.append((reader, writer))
+            return response
+
+    async def invoke_method(self, method, path, path_params={},
+                            query_params={}, form_params={}):
+        """
+        Invoke a web service GET, POST, PUT or DELETE method, waiting for a
+        free connection from the pool first if necessary.
+        """
+        url = self._build_url(path, path_params, query_params)
+        request = ("%%s %%s HTTP/1.1\\r\\n" %% (method, url)).encode("ascii")
+        request += self.headers
+        if form_params:
+            data = urlencode([ (k, self._value_to_string(v))
+                               for (k, v) in form_params.items()
+                               if v is not None ]).encode("utf-8")
+            request += b"Content-type: application/x-www-form-urlencoded\\r\\n"
+        else:
+            data = b""
+        request += b"Content-Length: %%d\\r\\n\\r\\n" %% len(data) + data
+
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.pool_size)
+        async with self.semaphore:
+            status, reason, headers, body = await self._invoke(
+                request, method == "GET")
+
+        if not headers.get("content-type", "").startswith("application/xml"):
+            error = IbisError({"status": status, "code": reason})
+            error.message = "Unexpected result from server"
+            error.details = body
+            result = IbisResult()
+            result.error = error
+            return result
+
+        parser = IbisResultParser()
+        return parser.parse_xml(body)
+
+def createAsyncConnection(pool_size=8):
+    """
+    Create an AsyncIbisClientConnection to the Lookup/Ibis web service API
+    at https://www.lookup.cam.ac.uk/.
+    """
+    return AsyncIbisClientConnection("www.lookup.cam.ac.uk", 443, "",
+                                     True, pool_size)
+
+def createAsyncTestConnection(pool_size=8):
+    """
+    Create an AsyncIbisClientConnection to the Lookup/Ibis test web service
+    API at https://lookup-test.csx.cam.ac.uk/.
+    """
+    return AsyncIbisClientConnection("lookup-test.csx.cam.ac.uk", 443, "",
+                                     True, pool_size)
+
+def createAsyncLocalConnection(pool_size=8):
+    """
+    Create an AsyncIbisClientConnection to a Lookup/Ibis web service API
+    running locally on https://localhost:8443/ibis/, without checking its
+    (self-signed) certificates.
+    """
+    return AsyncIbisClientConnection("localhost", 8443, "ibis",
+                                     False, pool_size)
+'''
+
+def generate_python3_async_connection_module():
+    """
+    Generate the Python 3 code for the asynchronous connection module,
+    using the PYTHON3_ASYNC_CONNECTION_TEMPLATE.
+    """
+    licence = comment_out(LICENCE)
+    return PYTHON3_ASYNC_CONNECTION_TEMPLATE % { "licence": licence }
 
 # ==========================================================================
 # Code to generate the PHP client methods classes.
@@ -999,6 +2591,110 @@ PHP_METHOD_TEMPLATE = """
     }
 """
 
+PHP_BATCHED_METHOD_TEMPLATE = """
+    /**
+     * Batched version of {@link %(method_name)s}, accepting any number of
+     * identifiers.
+     *
+     * The identifiers are split into chunks that fit within the server's
+     * URL length limit, and each chunk is fetched using the same call as
+     * {@link %(method_name)s}, with all the calls sent to the server
+     * concurrently if the connection supports it (see
+     * {@link IbisBatch::invokeAll}). Any other parameters are passed on
+     * unchanged.
+     *
+     * @param string[] $%(batch_param)s [required] The identifiers (an array or
+     * any other Traversable).
+     *
+     * @return %(return_type)s The results, in the order of the identifiers
+     * requested. Any identifiers not found are omitted.
+     */
+    public function %(method_name)sBatched(%(method_params)s)
+    {
+        $ids = IbisBatch::uniqueIds($%(batch_param)s);
+        $requests = array();
+        foreach (IbisBatch::batchIds($ids) as $chunk)
+        {
+%(request)s
+            $requests[] = %(request_args)s;
+        }
+        $results = array();
+        foreach (IbisBatch::invokeAll($this->conn, $requests) as $result)
+        {
+            if (isset($result->error))
+                throw new IbisException($result->error);
+            $results[] = %(result)s;
+        }
+        return IbisBatch::orderResults($ids, $results);
+    }
+"""
+
+PHP_MULTI_METHOD_TEMPLATE = """
+    /**
+     * Multi version of {@link %(method_name)s}, fetching the results for
+     * any number of values of ``%(multi_param)s``.
+     *
+     * Each value is fetched using the same call as {@link %(method_name)s},
+     * with all the calls sent to the server concurrently if the connection
+     * supports it (see {@link IbisBatch::invokeAll}). Any other parameters
+     * are passed on unchanged.
+     *
+     * @param string[] $%(multi_param)ss [required] The values of
+     * ``%(multi_param)s`` (an array or any other Traversable).
+     *
+     * @return array The results (%(return_type)s), keyed by the values
+     * requested, in the same order. If a call fails, its value is the
+     * IbisError instead, and the other results are still returned.
+     */
+    public function %(method_name)sMulti(%(method_params)s)
+    {
+        $requests = array();
+        foreach (IbisBatch::uniqueIds($%(multi_param)ss) as $%(multi_param)s)
+        {
+%(request)s
+            $requests[$%(multi_param)s] = %(request_args)s;
+        }
+        $results = IbisBatch::invokeAll($this->conn, $requests);
+        foreach ($results as $%(multi_param)s => $result)
+        {
+            if (isset($result->error))
+                $results[$%(multi_param)s] = $result->error;
+            else
+                $results[$%(multi_param)s] = %(result)s;
+        }
+        return $results;
+    }
+"""
+
+PHP_PAGED_METHOD_TEMPLATE = """
+    /**
+     * Iterate over all the results of {@link %(method_name)s}, fetching
+     * them from the server one page at a time, so that only one page of
+     * results need be held in memory at once.%(count_docs)s
+     *
+     * The other parameters are the same as for {@link %(method_name)s}.
+     *
+     * @param int $pageSize [optional] The number of results to fetch in each
+     * call. Defaults to 100.
+     *
+     * @return Generator The results (%(result_type)s), in the same order as
+     * {@link %(method_name)s}.
+     */
+    public function %(method_name)sIter(%(method_params)s)
+    {
+%(count)s        %(loop)s
+        {
+            $results = $this->%(method_name)s(%(call_args)s);
+            if (empty($results))
+                break;
+            foreach ($results as $result)
+                yield $result;
+            if (count($results) < $pageSize)
+                break;%(next_state)s
+        }
+    }
+"""
+
 def php_type(java_type):
     """
     Returns the PHP corresponding to the specified Java type. This is
@@ -1011,11 +2707,31 @@ def php_type(java_type):
     if java_type.startswith("uk.ac.cam.ucs.ibis.dto."): return java_type[23:]
     return java_type
 
+# Compiled regular expressions used only by javadocs_to_phpdocs()
+HTML_NON_CODE_TAG_RE = re.compile("<(?!a|/a|code|/code|pre|/pre)[^>]+>")
+LINK_WITH_ARGS_RE = re.compile("[{]@link\\s+([^(}]+)[(][^)}]*[)][^}]*[}]")
+LINK_TEXT_RE = re.compile("[{]@link\\s+([^}\\s]+)\\s+[^}]*[}]")
+LINK_QUALIFIED_METHOD_RE = re.compile("[{]@link\\s+[^}\\s#]+#([^}]+)[}]")
+
+# Cache of converted docs, keyed on the docs and line prefix
+phpdocs_cache = {}
+
 def javadocs_to_phpdocs(docs, line_prefix=""):
     """
     Convert some javadocs to PHP docs. This is more-or-less plain text, but
     can contain some javadoc tags and reST (reStructuredText) markup.
     """
+    key = (docs, line_prefix)
+    result = phpdocs_cache.get(key)
+    if result == None:
+        result = convert_javadocs_to_phpdocs(docs, line_prefix)
+        phpdocs_cache[key] = result
+    return result
+
+def convert_javadocs_to_phpdocs(docs, line_prefix):
+    """
+    Convert some javadocs to PHP docs (uncached).
+    """
     docs = docs.strip()
 
     # Remove start and end javadoc comments
@@ -1023,24 +2739,24 @@ def javadocs_to_phpdocs(docs, line_prefix=""):
     if docs.endswith("*/"): docs = docs[:-2].strip()
 
     # Remove any comment line prefixes
-    docs = re.sub("(?m)^\\s*[*][ ]?", "", docs)
+    docs = DOC_LINE_PREFIX_RE.sub("", docs)
 
     # == HTML tag processing ==
 
     # Replace HTML headings with reST headings
-    docs = re.sub("(?s)<h[1-5][^>]*>(.+?)</h[1-5]>", "**\\1**", docs)
+    docs = HTML_HEADING_RE.sub("**\\1**", docs)
 
     # Replace <b>XXX</b> with **XXX**
-    docs = re.sub("(?s)<b>(.+?)</b>", "**\\1**", docs)
+    docs = HTML_BOLD_RE.sub("**\\1**", docs)
 
     # Replace single-line <code>XXX</code> blocks with ``XXX``
-    docs = re.sub("<code[^>]*>(.+?)</code>", "``\\1``", docs)
+    docs = HTML_CODE_LINE_RE.sub("``\\1``", docs)
 
     # Replace <li> with plain text "*" bullet points (reST format)
     docs = list_items_to_text(docs)
 
     # Remove any other HTML tags, except for <a>, <code> and <pre> blocks
-    docs = re.sub("<(?!a|/a|code|/code|pre|/pre)[^>]+>", "", docs)
+    docs = HTML_NON_CODE_TAG_RE.sub("", docs)
 
     # == End of HTML tag processing ==
 
@@ -1050,37 +2766,36 @@ def javadocs_to_phpdocs(docs, line_prefix=""):
     # I.e., replace {@link xxx(yyy)} with {@link xxx()}. While we're at it,
     # remove any link text from such links, since ApiGen doesn't support that
     # either. I.e., replace {@link xxx(yyy) zzz} with {@link xxx()} too.
-    docs = re.sub("[{]@link\\s+([^(}]+)[(][^)}]*[)][^}]*[}]",
-                  "{@link \\1()}", docs)
+    docs = LINK_WITH_ARGS_RE.sub("{@link \\1()}", docs)
 
     # Remove any link text from links. I.e., replace {@link xxx yyy} with
     # {@link xxx}.
-    docs = re.sub("[{]@link\\s+([^}\\s]+)\\s+[^}]*[}]", "{@link \\1}", docs)
+    docs = LINK_TEXT_RE.sub("{@link \\1}", docs)
 
     # Remove any qualified methods from links, since ApiGen doesn't support
     # them. This risks breaking the link entirely, but there isn't any other
     # good solution. I.e., replace {@link xxx#yyy} with {@link yyy}.
-    docs = re.sub("[{]@link\\s+[^}\\s#]+#([^}]+)[}]", "{@link \\1}", docs)
+    docs = LINK_QUALIFIED_METHOD_RE.sub("{@link \\1}", docs)
 
     # Finally, strip off any # prefixes from unqualified method links. I.e.,
     # replace {@link #xxx} with {@link xxx}
-    docs = re.sub("[{]@link\\s+#([^}]+)[}]", "{@link \\1}", docs)
+    docs = LINK_METHOD_RE.sub("{@link \\1}", docs)
 
     # Replace {@code XXX} tags with ``XXX``
-    docs = re.sub("[{]@code\\s+([^}]+)[}]", "``\\1``", docs)
+    docs = CODE_RE.sub("``\\1``", docs)
 
     # Replace {@literal XXX} with XXX (no special handling)
-    docs = re.sub("[{]@literal\\s+([^}]+)[}]", "\\1", docs)
+    docs = LITERAL_RE.sub("\\1", docs)
 
     # Add the specified line prefix to each line
-    if line_prefix: docs = re.sub("(?m)^", line_prefix, docs)
+    if line_prefix: docs = LINE_START_RE.sub(line_prefix, docs)
 
     # Strip off end-of-line whitespace
-    docs = re.sub("(?m)\\s+$", "\n", docs)
+    docs = LINE_END_SPACE_RE.sub("\n", docs)
 
     return docs
 
-def generate_php_method(method):
+def generate_php_method(cls, method):
     """
     Generate the PHP code for a single web service API method, using the
     PHP_METHOD_TEMPLATE.
@@ -1092,13 +2807,12 @@ def generate_php_method(method):
 
     # Add the parameter types to the PHP docs
     for param in method.all_params:
-        docs = re.sub("[*] @param "+param.name,
-                      "* @param "+php_type(param.java_type)+" $"+param.name,
-                      docs)
+        docs = docs.replace("* @param "+param.name,
+                            "* @param "+php_type(param.java_type)+" $"+param.name)
 
     # Add the return type to the PHP docs
-    docs = re.sub("[*] @return ",
-                  "* @return %s " % php_type(method.result_type), docs)
+    docs = docs.replace("* @return ",
+                        "* @return %s " % php_type(method.result_type))
 
     # Method parameters
     last_required_param = 0
@@ -1113,57 +2827,191 @@ def generate_php_method(method):
         else:
             param_names.append("$"+param.name)
     method_params = aligned_output([param_names], 21 + len(method.name))
+    method_param_names = param_names
 
-    # Path parameters
-    param_names = [ '"'+x.name+'"' for x in method.path_params ]
-    param_vars = [ "=> $"+x.name for x in method.path_params ]
-    path_params = aligned_output([param_names, param_vars], 28, 1)
-
-    # Query parameters
-    param_names = [ '"'+x.name+'"' for x in method.query_params ]
-    param_vars = [ "=> $"+x.name for x in method.query_params ]
-    query_params = aligned_output([param_names, param_vars], 29, 1)
+    # Path, query and form parameters
+    path_params = php_params(method.path_params, 28)
+    query_params = php_params(method.query_params, 29)
+    form_params = php_params(method.form_params, 28)
 
-    # Form parameters
-    param_names = [ '"'+x.name+'"' for x in method.form_params ]
-    param_vars = [ "=> $"+x.name for x in method.form_params ]
-    form_params = aligned_output([param_names, param_vars], 28, 1)
+    code = PHP_METHOD_TEMPLATE % { "method_docs": docs,
+                                   "method_name": method.name,
+                                   "method_params": method_params,
+                                   "path_params": path_params,
+                                   "query_params": query_params,
+                                   "form_params": form_params,
+                                   "method_kind": method.kind,
+                                   "method_path": php_path(method),
+                                   "result": php_result(method) }
+
+    if method.batch_param:
+        code += generate_php_batched_method(method, method_param_names)
+    if method.multi_param:
+        code += generate_php_multi_method(method, method_param_names)
+    if method.page_style:
+        code += generate_php_paged_method(cls, method, method_param_names)
+    return code
+
+def php_params(params, indent, values={}):
+    """
+    Returns the contents of a PHP array of path, query or form parameters,
+    each set to the method parameter of the same name, unless another value
+    is given for it in values.
+    """
+    param_names = [ '"'+x.name+'"' for x in params ]
+    param_vars = [ "=> "+values.get(x.name, "$"+x.name) for x in params ]
+    return aligned_output([param_names, param_vars], indent, 1)
 
-    # Method path - replace any placeholders with PHP/Java-style format
-    # specifiers
+def php_path(method):
+    """
+    Returns the method path, with any placeholders replaced with PHP/Java-
+    style format specifiers.
+    """
     path = method.path
     param_number = 1
     while re.search("[{][^}]+[}]", path):
         path = re.sub("[{][^}]+[}]", "%%%d$s" % param_number, path, 1)
         param_number += 1
+    return path
 
-    # Final method result
+def php_result(method):
+    """
+    Returns the PHP expression for the final result of a method, from the
+    IbisResult ``$result``.
+    """
     if method.result_type == "boolean":
-        result = 'strcasecmp($result->value, "true") == 0'
-    elif method.result_type == "int":
-        result = "intval($result->value)"
-    elif method.result_type == "long":
-        result = "intval($result->value)" # PHP doesn't have longval()
+        return 'strcasecmp($result->value, "true") == 0'
+    if method.result_type == "int":
+        return "intval($result->value)"
+    if method.result_type == "long":
+        return "intval($result->value)" # PHP doesn't have longval()
+    return "$result->%s" % method.result_field.replace(".", "->")
+
+def php_request(method, target, values):
+    """
+    Returns the PHP code, for the body of a loop in a batched or multi
+    method, that adds the request made by a method to the array passed to
+    IbisBatch::invokeAll(), as ``target``. The values override the
+    parameters of the method (see php_params()).
+    """
+    path_params = php_params(method.path_params, 32, values)
+    query_params = php_params(method.query_params, 33, values)
+    request = "            $pathParams = array(%s);\n"\
+              "            $queryParams = array(%s);"\
+              % (path_params, query_params)
+
+    request_args = aligned_output([[ '"%s"' % method.kind,
+                                     "'%s'" % php_path(method),
+                                     "$pathParams",
+                                     "$queryParams" ]],
+                                  len(target) + 21)
+    return request, "array(%s)" % request_args
+
+def generate_php_batched_method(method, param_names):
+    """
+    Generate the PHP code for the batched version of a list-style method
+    (see Method.find_batch_param()), using the PHP_BATCHED_METHOD_TEMPLATE.
+    The param_names are those of the underlying method.
+    """
+    method_params = aligned_output([param_names], 28 + len(method.name))
+    request, request_args = php_request(method, "$requests[]",
+                                        { method.batch_param.name: "$chunk" })
+
+    return PHP_BATCHED_METHOD_TEMPLATE % {
+        "method_name": method.name,
+        "method_params": method_params,
+        "batch_param": method.batch_param.name,
+        "request": request,
+        "request_args": request_args,
+        "result": php_result(method),
+        "return_type": php_type(method.result_type) }
+
+def generate_php_multi_method(method, param_names):
+    """
+    Generate the PHP code for the multi version of a get-style method (see
+    Method.find_multi_param()), using the PHP_MULTI_METHOD_TEMPLATE. The
+    param_names are those of the underlying method, except that the
+    identifier parameter takes an array of identifiers, and is named in the
+    plural.
+    """
+    name = method.multi_param.name
+    param_names = [ "$"+name+"s" if x == "$"+name else x
+                    for x in param_names ]
+    method_params = aligned_output([param_names], 26 + len(method.name))
+    request, request_args = php_request(method, "$requests[$%s]" % name, {})
+
+    return PHP_MULTI_METHOD_TEMPLATE % {
+        "method_name": method.name,
+        "method_params": method_params,
+        "multi_param": name,
+        "request": request,
+        "request_args": request_args,
+        "result": php_result(method),
+        "return_type": php_type(method.result_type) }
+
+def generate_php_paged_method(cls, method, param_names):
+    """
+    Generate the PHP code for the paged version of a method (see
+    Method.find_paging()), using the PHP_PAGED_METHOD_TEMPLATE. The
+    param_names are those of the underlying method. If the class has a
+    matching count method, it is used to find the number of results up
+    front, avoiding a final call that returns no results.
+    """
+    # Method parameters, without the offset and limit
+    param_names = [ x for x in param_names
+                    if x.split("=")[0] not in ("$offset", "$limit") ]
+    param_names = param_names + ["$pageSize=100"]
+    method_params = aligned_output([param_names], 25 + len(method.name))
+
+    # Arguments for each call to fetch a page
+    call_args = []
+    for param in method.all_params:
+        if param.name == "limit": call_args.append("$pageSize")
+        else: call_args.append("$"+param.name)
+    call_args = aligned_output([call_args], 31 + len(method.name))
+
+    # Count of the results, if available, and the paging loop
+    count_method = method.page_style == "offset" and\
+                   cls.find_count_method(method)
+    if count_method:
+        count_args = aligned_output([[ "$"+x.name
+                                       for x in count_method.all_params ]],
+                                    25 + len(count_method.name))
+        count = "        $count = $this->%s(%s);\n"\
+                % (count_method.name, count_args)
+        count_docs = "\n     *\n     * The total number of results is "\
+                     "found first, using {@link %s}." % count_method.name
     else:
-        result = "$result->%s" % method.result_field.replace(".", "->")
+        count = ""
+        count_docs = ""
 
-    return PHP_METHOD_TEMPLATE % { "method_docs": docs,
-                                   "method_name": method.name,
-                                   "method_params": method_params,
-                                   "path_params": path_params,
-                                   "query_params": query_params,
-                                   "form_params": form_params,
-                                   "method_kind": method.kind,
-                                   "method_path": path,
-                                   "result": result }
+    if method.page_style == "offset":
+        if count_method:
+            loop = "for ($offset = 0; $offset < $count; $offset += $pageSize)"
+        else:
+            loop = "for ($offset = 0; ; $offset += $pageSize)"
+        next_state = ""
+    else:
+        loop = "while (true)"
+        next_state = "\n            $%s = IbisBatch::resultCursor("\
+                     "$results[count($results)-1]);" % method.cursor_param.name
+
+    return PHP_PAGED_METHOD_TEMPLATE % {
+        "method_name": method.name,
+        "method_params": method_params,
+        "count_docs": count_docs,
+        "result_type": php_type(method.result_type),
+        "count": count,
+        "loop": loop,
+        "call_args": call_args,
+        "next_state": next_state }
 
 PHP_CLASS_TEMPLATE = """<?php
 /* === AUTO-GENERATED - DO NOT EDIT === */
 
 /*%(licence)s*/
 
-require_once dirname(__FILE__) . "/../client/IbisException.php";
-
+%(requires)s
 %(class_docs)s
 class %(class_name)s
 {
@@ -1190,13 +3038,281 @@ def generate_php_class(cls):
     """
     docs = javadocs_to_phpdocs(cls.docs)
     docs = "/**\n %s\n */" % comment_out(docs, " *")
-    methods = "".join(generate_php_method(x) for x in cls.methods)
+    methods = "".join(method_code("php", cls, x) for x in cls.methods)
+
+    requires = ["IbisException.php"]
+    if any(x.batch_param or x.multi_param or x.page_style == "cursor"
+           for x in cls.methods):
+        requires.append("IbisBatch.php")
+    requires = "".join('require_once dirname(__FILE__) . "/../client/%s";\n'
+                       % x for x in requires)
 
     return PHP_CLASS_TEMPLATE % { "licence": LICENCE,
+                                  "requires": requires,
                                   "class_docs": docs,
                                   "class_name": cls.name,
                                   "methods": methods }
 
+# ==========================================================================
+# Parallel code generation.
+# ==========================================================================
+
+# The number of methods generated by each worker process task
+METHOD_BATCH_SIZE = 8
+
+def generate_method(lang, cls, method):
+    """
+    Generate the code for a single method of a class in the specified
+    language. The Python 2 and Python 3 code for a method is the same, so
+    both use the language "python" here.
+    """
+    if lang == "java": return generate_java_method(method)
+    if lang == "php": return generate_php_method(cls, method)
+    if lang == "python": return generate_python_method(cls, method)
+    if lang == "python3-async": return generate_python_method(cls, method, True)
+    error("Unsupported language: '%s'" % lang)
+
+def method_code(lang, cls, method):
+    """
+    Returns the code for a single method, using the code generated by a
+    worker process if there is any.
+    """
+    code = method.generated.get(lang)
+    if code == None:
+        code = generate_method(lang, cls, method)
+    return code
+
+# The Application in each worker process
+worker_app = None
+
+def init_worker(app):
+    """
+    Initialise a worker process. The Application is handed to each worker
+    just once, so that tasks need only refer to methods by index.
+    """
+    global worker_app
+    worker_app = app
+
+def generate_method_batch(task):
+    """
+    Worker process task to generate the code for a batch of methods from a
+    single class. Returns None if there was an error (which will already
+    have been reported).
+    """
+    lang, cls_idx, start, end = task
+    cls = worker_app.classes[cls_idx]
+    try:
+        return [ generate_method(lang, cls, method)
+                 for method in cls.methods[start:end] ]
+    except SystemExit:
+        return None
+
+def generate_methods_in_parallel(app, lang_classes, jobs):
+    """
+    Generate the code for all the methods of the specified classes using a
+    pool of worker processes, storing the results on each Method object for
+    the class generators to pick up. lang_classes is a list of (lang, cls)
+    pairs. The output is identical to that produced serially, since each
+    method's code depends only on the method and its class.
+    """
+    cls_indexes = dict((id(cls), idx) for idx, cls in enumerate(app.classes))
+    tasks = []
+    done = set()
+    for lang, cls in lang_classes:
+        if lang == "python3": lang = "python"
+        if (lang, id(cls)) in done: continue
+        done.add((lang, id(cls)))
+        for start in range(0, len(cls.methods), METHOD_BATCH_SIZE):
+            tasks.append((lang, cls_indexes[id(cls)], start,
+                          min(start+METHOD_BATCH_SIZE, len(cls.methods))))
+
+    pool = multiprocessing.Pool(jobs, init_worker, (app,))
+    try:
+        results = pool.map(generate_method_batch, tasks, 1)
+    finally:
+        pool.close()
+        pool.join()
+
+    for (lang, cls_idx, start, end), codes in zip(tasks, results):
+        if codes == None: sys.exit(1)
+        methods = app.classes[cls_idx].methods[start:end]
+        for method, code in zip(methods, codes):
+            method.generated[lang] = code
+
+# ==========================================================================
+# Output files for each language.
+# ==========================================================================
+
+def get_outputs(app, lang, out_dir):
+    """
+    Returns a list of (filename, classes, generate) tuples describing the
+    output files for the specified language, where classes is the list of
+    MethodClass objects that the file is generated from, and generate is a
+    function returning the file's contents.
+    """
+    if lang == "java":
+        return [ (os.path.join(out_dir, cls.name+".java"), [cls],
+                  functools.partial(generate_java_class, cls))
+                 for cls in app.classes ]
+    if lang == "python":
+        return [ (os.path.join(out_dir, "methods.py"), app.classes,
+                  functools.partial(generate_python_module, app)),
+                 (os.path.join(out_dir, "pooled_connection.py"), [],
+                  functools.partial(generate_python_connection_module, lang)) ]
+    if lang == "python3":
+        return [ (os.path.join(out_dir, "methods.py"), app.classes,
+                  functools.partial(generate_python3_module, app)),
+                 (os.path.join(out_dir, "pooled_connection.py"), [],
+                  functools.partial(generate_python_connection_module, lang)) ]
+    if lang == "python3-async":
+        return [ (os.path.join(out_dir, "methods.py"), app.classes,
+                  functools.partial(generate_python3_async_module, app)),
+                 (os.path.join(out_dir, "async_connection.py"), [],
+                  generate_python3_async_connection_module) ]
+    if lang == "php":
+        return [ (os.path.join(out_dir, cls.name+".php"), [cls],
+                  functools.partial(generate_php_class, cls))
+                 for cls in app.classes ]
+    error("Unsupported language: '%s'" % lang)
+
+# ==========================================================================
+# Incremental generation cache.
+# ==========================================================================
+
+def class_digest(cls):
+    """
+    Returns a SHA-1 hex digest of everything read from a top-level <resource>
+    node in the WADL file (the class, and all its methods and parameters).
+    This is computed from the parsed model, so it is the same whichever WADL
+    reader was used, and is unaffected by changes to insignificant whitespace
+    or unused elements in the WADL file.
+    """
+    h = hashlib.sha1()
+    def add(*values):
+        for value in values:
+            h.update(value.encode("utf-8"))
+            h.update(b"\0")
+
+    add(cls.name, cls.path, cls.docs)
+    for method in cls.methods:
+        add("method", method.name, method.kind, method.path,
+            method.result_field, method.result_type, method.docs)
+        for kind, params in (("path", method.path_params),
+                             ("query", method.query_params),
+                             ("form", method.form_params)):
+            for param in params:
+                add(kind, param.kind, param.name, param.java_type)
+    return h.hexdigest()
+
+class GenerationCache:
+    """
+    A persistent on-disk record of the files previously generated, allowing
+    unchanged output files to be skipped without being rendered or read.
+
+    Each output file is recorded with a key made from the target language
+    and the digests of the WADL resources it was generated from, together
+    with the file's size and modification time when it was written. The
+    cache as a whole is tied to a digest of this generator script (which
+    includes all the templates), so any change to the generator invalidates
+    it. The digest of the whole WADL file is also recorded, so that if it
+    hasn't changed at all, parsing it can be skipped too.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.generator = file_digest(os.path.abspath(__file__))
+        self.targets = {}
+
+        try:
+            f = open(filename)
+            try:
+                data = json.load(f)
+            finally:
+                f.close()
+            if data.get("generator") == self.generator:
+                self.targets = data.get("targets", {})
+        except (IOError, ValueError):
+            pass
+
+    @staticmethod
+    def target_name(lang, out_dir):
+        return "%s:%s" % (lang, os.path.abspath(out_dir))
+
+    @staticmethod
+    def output_key(lang, classes):
+        """
+        Returns the cache key for an output file generated from the specified
+        classes in the specified language.
+        """
+        h = hashlib.sha1(lang.encode("utf-8"))
+        for cls in classes:
+            h.update(class_digest(cls).encode("ascii"))
+        return h.hexdigest()
+
+    @staticmethod
+    def file_matches(filename, entry):
+        """
+        Test if a file still has the size and modification time recorded when
+        it was last generated.
+        """
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return False
+        return st.st_size == entry["size"] and st.st_mtime == entry["mtime"]
+
+    def unchanged_outputs(self, lang, out_dir, wadl_digest):
+        """
+        If the WADL file is identical to the one last used for this language
+        and output directory, and none of the output files have been touched
+        since, returns the list of (filename, entry) pairs for the output
+        files. Otherwise returns None.
+        """
+        target = self.targets.get(self.target_name(lang, out_dir))
+        if not target or target["wadl"] != wadl_digest:
+            return None
+        for filename, entry in target["files"].items():
+            if not self.file_matches(filename, entry):
+                return None
+        return sorted(target["files"].items())
+
+    def output_unchanged(self, lang, out_dir, filename, key):
+        """
+        If an output file was last generated from WADL resources with the same
+        key, and hasn't been touched since, returns its cache entry.
+        Otherwise returns None.
+        """
+        target = self.targets.get(self.target_name(lang, out_dir))
+        if not target: return None
+        entry = target["files"].get(filename)
+        if entry != None and entry["key"] == key and\
+           self.file_matches(filename, entry):
+            return entry
+        return None
+
+    def record_target(self, lang, out_dir, wadl_digest, files, writer):
+        """
+        Record the output files generated for this language and output
+        directory. files is a list of (filename, key) pairs, and the SHA-1
+        hash of each file is taken from the OutputWriter.
+        """
+        entries = {}
+        for filename, key in files:
+            st = os.stat(filename)
+            entries[filename] = { "key": key,
+                                  "sha1": writer.files[filename][0],
+                                  "size": st.st_size,
+                                  "mtime": st.st_mtime }
+        self.targets[self.target_name(lang, out_dir)] = { "wadl": wadl_digest,
+                                                          "files": entries }
+
+    def save(self, fsync=True):
+        """
+        Save the cache, replacing the old cache file atomically.
+        """
+        data = json.dumps({ "generator": self.generator,
+                            "targets": self.targets }, indent=1, sort_keys=True)
+        write_file_atomically(self.filename, data.encode("utf-8"), fsync)
+
 # ==========================================================================
 # Main entry point.
 # ==========================================================================
@@ -1215,7 +3331,9 @@ if __name__ == "__main__":
             arg += 1
             if arg >= num_args:
                 error("No language specified")
-            lang = sys.argv[arg].lower()
+            for spec in sys.argv[arg].split(","):
+                lang, sep, lang_dir = spec.partition("=")
+                targets.append((lang.lower(), lang_dir or None))
             arg += 1
         elif sys.argv[arg] == "-d":
             arg += 1
@@ -1223,6 +3341,41 @@ if __name__ == "__main__":
                 error("No output directory specified")
             out_dir = sys.argv[arg]
             arg += 1
+        elif sys.argv[arg] == "-parser":
+            arg += 1
+            if arg >= num_args:
+                error("No parser specified")
+            parser = sys.argv[arg].lower()
+            arg += 1
+        elif sys.argv[arg] == "-cache":
+            arg += 1
+            if arg >= num_args:
+                error("No cache file specified")
+            cache_file = sys.argv[arg]
+            arg += 1
+        elif sys.argv[arg] == "-manifest":
+            arg += 1
+            if arg >= num_args:
+                error("No manifest file specified")
+            manifest_file = sys.argv[arg]
+            arg += 1
+        elif sys.argv[arg] == "-no-fsync":
+            fsync = False
+            arg += 1
+        elif sys.argv[arg] == "-v":
+            verbose = True
+            arg += 1
+        elif sys.argv[arg] == "-j":
+            arg += 1
+            if arg >= num_args:
+                error("No number of jobs specified")
+            try:
+                jobs = int(sys.argv[arg])
+            except ValueError:
+                jobs = 0
+            if jobs < 1:
+                error("Invalid number of jobs: '%s'" % sys.argv[arg])
+            arg += 1
         elif arg == num_args-1:
             wadl_file = sys.argv[arg]
             arg += 1
@@ -1232,28 +3385,90 @@ if __name__ == "__main__":
     if wadl_file == None:
         error("No WADL file specified")
 
-    # Read and parse the WADL file
-    doc = xml.dom.minidom.parse(wadl_file)
-    app = Application(doc.documentElement)
-
-    # Create/update the output file(s) as necessary
-    if lang == "java":
-        for cls in app.classes:
-            filename = os.path.join(out_dir, cls.name+".java")
-            content = generate_java_class(cls)
-            update_file_if_changed(filename, content)
-    elif lang == "python":
-        filename = os.path.join(out_dir, "methods.py")
-        content = generate_python_module(app)
-        update_file_if_changed(filename, content)
-    elif lang == "python3":
-        filename = os.path.join(out_dir, "methods.py")
-        content = generate_python3_module(app)
-        update_file_if_changed(filename, content)
-    elif lang == "php":
-        for cls in app.classes:
-            filename = os.path.join(out_dir, cls.name+".php")
-            content = generate_php_class(cls)
-            update_file_if_changed(filename, content)
-    else:
-        error("Unsupported language: '%s'" % lang)
+    # Work out the language and output directory of each target
+    if not targets:
+        targets.append(("java", None))
+    targets = [ (lang, lang_dir or out_dir) for lang, lang_dir in targets ]
+
+    langs_seen = set()
+    python_dirs = {}
+    for lang, lang_dir in targets:
+        if lang not in LANGUAGES:
+            error("Unsupported language: '%s'" % lang)
+        if lang in langs_seen:
+            error("Language '%s' specified more than once" % lang)
+        langs_seen.add(lang)
+        if lang.startswith("python"):
+            other = python_dirs.get(os.path.abspath(lang_dir))
+            if other:
+                error("Languages '%s' and '%s' can't share the output "\
+                      "directory '%s'" % (other, lang, lang_dir))
+            python_dirs[os.path.abspath(lang_dir)] = lang
+
+    # If nothing at all has changed since the last cached run, there's no
+    # need to even parse the WADL file
+    writer = OutputWriter(fsync)
+    cache = None
+    if cache_file != None:
+        cache = GenerationCache(cache_file)
+        wadl_digest = file_digest(wadl_file)
+        unchanged = [ cache.unchanged_outputs(lang, lang_dir, wadl_digest)
+                      for lang, lang_dir in targets ]
+        if None not in unchanged:
+            for entries in unchanged:
+                for filename, entry in entries:
+                    writer.record_cached(filename, entry["sha1"], entry["size"])
+            writer.summary(verbose)
+            if manifest_file != None: writer.write_manifest(manifest_file)
+            sys.exit(0)
+
+    # Read and parse the WADL file (once, for all languages)
+    app = read_wadl(wadl_file, parser)
+
+    # Work out which output files need to be generated, skipping any that
+    # are unchanged according to the cache
+    pending = []
+    cache_records = []
+    for lang, lang_dir in targets:
+        generated = []
+        for filename, classes, generate in get_outputs(app, lang, lang_dir):
+            if cache != None:
+                key = GenerationCache.output_key(lang, classes)
+                generated.append((filename, key))
+                entry = cache.output_unchanged(lang, lang_dir, filename, key)
+                if entry != None:
+                    writer.record_cached(filename, entry["sha1"], entry["size"])
+                    continue
+            pending.append((lang, filename, classes, generate))
+
+        cache_records.append((lang, lang_dir, generated))
+
+    # If both Python modules are being generated, share the code for their
+    # classes
+    pending_langs = [ lang for lang, filename, classes, generate in pending ]
+    if "python" in pending_langs and "python3" in pending_langs:
+        app.python_classes = []
+
+    # Generate the code for all the methods in parallel, if requested
+    if jobs > 1:
+        lang_classes = [ (lang, cls) for lang, filename, classes, generate
+                         in pending for cls in classes ]
+        generate_methods_in_parallel(app, lang_classes, jobs)
+
+    # Create/update the output file(s) as necessary. If any of them fails
+    # (including by calling error()), the others are discarded.
+    try:
+        for lang, filename, classes, generate in pending:
+            writer.write(filename, generate())
+        writer.commit()
+    finally:
+        writer.discard()
+    writer.summary(verbose)
+
+    if cache != None:
+        for lang, lang_dir, generated in cache_records:
+            cache.record_target(lang, lang_dir, wadl_digest, generated, writer)
+        cache.save(fsync)
+
+    if manifest_file != None:
+        writer.write_manifest(manifest_file)
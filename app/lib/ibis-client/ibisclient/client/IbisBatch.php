@@ -0,0 +1,230 @@
+<?php
+/*
+Copyright (c) 2012, University of Cambridge Computing Service
+
+This file is part of the Lookup/Ibis client library.
+
+This library is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This library is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this library.  If not, see <http://www.gnu.org/licenses/>.
+*/
+
+require_once dirname(__FILE__) . "/../dto/IbisResult.php";
+
+/**
+ * Helper functions used by the batched versions of the list-style methods
+ * (such as {@link PersonMethods::listPeopleBatched}), which accept any
+ * number of identifiers, and split them into multiple calls to the
+ * underlying method, each of which fits within the server's URL length
+ * limit, by the multi versions of the get-style methods (such as
+ * {@link PersonMethods::getPersonMulti}), which fetch any number of
+ * objects concurrently, and by the paged methods (such as
+ * {@link PersonMethods::allPeopleIter}).
+ *
+ * @author Dean Rasheed (dev-group@ucs.cam.ac.uk)
+ */
+class IbisBatch
+{
+    /**
+     * The maximum URL-encoded length of the identifiers passed to a single
+     * call of a list-style method. The server limits the URL path to around
+     * 8000 characters, and this leaves room for the rest of the URL.
+     */
+    const MAX_BATCH_IDS_LENGTH = 6000;
+
+    /**
+     * Get the identifiers from an array or other Traversable, without
+     * duplicates.
+     *
+     * @param mixed $ids The identifiers.
+     * @return string[] The unique identifiers, in their original order.
+     */
+    public static function uniqueIds($ids)
+    {
+        $seen = array();
+        $uniqueIds = array();
+        foreach ($ids as $id)
+        {
+            $id = (string )$id;
+            $key = strtolower($id);
+            if (!isset($seen[$key]))
+            {
+                $seen[$key] = true;
+                $uniqueIds[] = $id;
+            }
+        }
+        return $uniqueIds;
+    }
+
+    /**
+     * Split a list of identifiers into comma-separated chunks, each of which
+     * has a URL-encoded length of at most $maxLength (unless it contains
+     * just one very long identifier).
+     *
+     * @param string[] $ids The identifiers.
+     * @param int $maxLength The maximum URL-encoded length of each chunk.
+     * @return string[] The comma-separated chunks of identifiers.
+     */
+    public static function batchIds($ids,
+                                    $maxLength=self::MAX_BATCH_IDS_LENGTH)
+    {
+        $chunks = array();
+        $chunk = array();
+        $length = 0;
+        foreach ($ids as $id)
+        {
+            $idLength = strlen(urlencode($id)) + 3; // Including a comma
+            if (!empty($chunk) && $length + $idLength > $maxLength)
+            {
+                $chunks[] = implode(",", $chunk);
+                $chunk = array();
+                $length = 0;
+            }
+            $chunk[] = $id;
+            $length += $idLength;
+        }
+        if (!empty($chunk))
+            $chunks[] = implode(",", $chunk);
+        return $chunks;
+    }
+
+    /**
+     * Invoke many web service methods, using the connection's
+     * ``invokeMethods()`` method to send them concurrently, if it has one
+     * (see {@link IbisClientConnection::invokeMethods}), and otherwise
+     * invoking them one at a time.
+     *
+     * @param ClientConnection $conn The connection to use.
+     * @param array $requests The requests, each an array of the arguments
+     * to {@link ClientConnection::invokeMethod}.
+     * @return IbisResult[] The result of each request, with the same key
+     * as the request, and in the same order. A request that fails without
+     * a response from the server has a result containing an IbisError, so
+     * one failure doesn't lose the other results.
+     */
+    public static function invokeAll($conn, $requests)
+    {
+        if (method_exists($conn, "invokeMethods"))
+            return $conn->invokeMethods($requests);
+
+        $results = array();
+        foreach ($requests as $key => $request)
+        {
+            $formParams = isset($request[4]) ? $request[4] : null;
+            try
+            {
+                $results[$key] = $conn->invokeMethod($request[0], $request[1],
+                                                     $request[2], $request[3],
+                                                     $formParams);
+            }
+            catch (Exception $e)
+            {
+                $results[$key] = IbisBatch::errorResult($e->getMessage());
+            }
+        }
+        return $results;
+    }
+
+    /**
+     * Create the result of a request that failed without a response from
+     * the server (for example, if the server couldn't be reached).
+     *
+     * @param string $message A description of the failure.
+     * @param string $details Any further details of the failure.
+     * @return IbisResult A result containing a suitable IbisError.
+     */
+    public static function errorResult($message, $details=null)
+    {
+        $error = new IbisError(array("status" => "0"));
+        $error->code = "Request failed";
+        $error->message = $message;
+        $error->details = $details;
+
+        $result = new IbisResult();
+        $result->error = $error;
+        return $result;
+    }
+
+    /*
+     * Get the identifiers (in lowercase) that might have been used to
+     * request a person, institution or group.
+     */
+    private static function resultKeys($result)
+    {
+        $keys = array();
+        if (isset($result->identifier))
+        {
+            $keys[] = $result->identifier->value;
+            $keys[] = $result->identifier->scheme . "/" .
+                      $result->identifier->value;
+        }
+        foreach (array("instid", "groupid", "name") as $name)
+            if (isset($result->$name))
+                $keys[] = $result->$name;
+        return array_map("strtolower", $keys);
+    }
+
+    /**
+     * Get the identifier of a person, institution or group, for use as the
+     * starting point of the next page of results of a paged method.
+     *
+     * @param mixed $result The person, institution or group.
+     * @return string The identifier.
+     */
+    public static function resultCursor($result)
+    {
+        if (isset($result->identifier))
+            return $result->identifier->value;
+        if (isset($result->instid))
+            return $result->instid;
+        return $result->groupid;
+    }
+
+    /**
+     * Combine the arrays of results from each chunk of a batched call,
+     * sorting them into the order of the identifiers requested. Any results
+     * that can't be matched to an identifier are put at the end.
+     *
+     * @param string[] $ids The identifiers requested.
+     * @param array $results The array of results from each chunk.
+     * @return array The combined results.
+     */
+    public static function orderResults($ids, $results)
+    {
+        $positions = array();
+        foreach ($ids as $idx => $id)
+            $positions[strtolower($id)] = $idx;
+
+        // Group the results by position (keeping the order within each
+        // position, since PHP's sort functions are not stable)
+        $byPosition = array();
+        foreach ($results as $chunkResults)
+        {
+            if (empty($chunkResults)) continue;
+            foreach ($chunkResults as $result)
+            {
+                $position = count($ids);
+                foreach (IbisBatch::resultKeys($result) as $key)
+                    if (isset($positions[$key]) && $positions[$key] < $position)
+                        $position = $positions[$key];
+                $byPosition[$position][] = $result;
+            }
+        }
+        ksort($byPosition);
+
+        $combined = array();
+        foreach ($byPosition as $positionResults)
+            foreach ($positionResults as $result)
+                $combined[] = $result;
+        return $combined;
+    }
+}
@@ -19,6 +19,10 @@ along with this library.  If not, see <http://www.gnu.org/licenses/>.
 */
 
 require_once "ClientConnection.php";
+require_once "IbisBatch.php";
+require_once "IbisCurlTransport.php";
+require_once "IbisException.php";
+require_once "IbisStreamTransport.php";
 require_once dirname(__FILE__) . "/../dto/IbisResult.php";
 
 /**
@@ -29,6 +33,12 @@ require_once dirname(__FILE__) . "/../dto/IbisResult.php";
  */
 class IbisClientConnection implements ClientConnection
 {
+    /** Ask the server for results in XML. */
+    const FORMAT_XML = "xml";
+
+    /** Ask the server for results in JSON. */
+    const FORMAT_JSON = "json";
+
     /** The base URL to the Lookup/Ibis web service API. */
     protected $urlBase = "";
 
@@ -47,6 +57,18 @@ class IbisClientConnection implements ClientConnection
     /** Whether to ask for flattened XML (recommended for efficiency). */
     protected $flatXML = true;
 
+    /** The transport used to send requests, created on first use. */
+    protected $transport = null;
+
+    /** Whether to unflatten results lazily. */
+    protected $lazyUnflatten = false;
+
+    /** The intern table shared by results unflattened lazily, if any. */
+    protected $internTable = null;
+
+    /** The format to ask the server for results in. */
+    protected $format = self::FORMAT_XML;
+
     /**
      * Create an IbisClientConnection to the Lookup/Ibis web service API at
      * {@link https://www.lookup.cam.ac.uk/}.
@@ -149,6 +171,93 @@ class IbisClientConnection implements ClientConnection
         $this->updateAuthorization();
     }
 
+    /**
+     * Set the transport used to send requests to the server.
+     *
+     * By default, an {@link IbisCurlTransport} is used if the curl extension
+     * is available, since it keeps the connection to the server alive
+     * between requests, and otherwise an {@link IbisStreamTransport}.
+     * Both ask the server to compress its responses, unless created with
+     * ``$compress`` set to ``false``.
+     *
+     * @param IbisTransport $transport The transport to use.
+     * @return void
+     */
+    public function setTransport($transport)
+    {
+        $this->transport = $transport;
+    }
+
+    /**
+     * Get the transport used to send requests to the server.
+     *
+     * @return IbisTransport The transport.
+     */
+    public function getTransport()
+    {
+        if (is_null($this->transport))
+            $this->transport = IbisCurlTransport::isAvailable() ?
+                               new IbisCurlTransport() :
+                               new IbisStreamTransport();
+        return $this->transport;
+    }
+
+    /**
+     * Set whether results are unflattened lazily, resolving the references
+     * between the people, institutions and groups in a result only as they
+     * are used, rather than all at once as the result is parsed (see
+     * {@link IbisResult::unflatten()}). This saves time and memory for
+     * large results of which only a part is used, for example the members
+     * of an institution fetched with their institutions.
+     *
+     * An {@link IbisInternTable} may also be given, which is then shared
+     * by all the results, so that a person, institution or group returned
+     * by many calls is hydrated only once. Only results fetched with the
+     * same ``fetch`` parameter share entities, since it determines which
+     * of their properties are set (see {@link IbisInternTable::forFetch()}).
+     *
+     * @param boolean $lazy Whether to unflatten results lazily.
+     * @param IbisInternTable $internTable The intern table to share, if
+     * any.
+     * @return void
+     */
+    public function setLazyUnflatten($lazy, $internTable=null)
+    {
+        $this->lazyUnflatten = $lazy;
+        $this->internTable = $lazy ? $internTable : null;
+    }
+
+    /**
+     * Set the format in which results are sent by the server:
+     * {@link FORMAT_XML} (the default) or {@link FORMAT_JSON}. Either way,
+     * they are parsed into the same {@link IbisResult} objects, but JSON
+     * is smaller, and quicker to parse, particularly for large results.
+     * However, a JSON response is read into memory in full before it is
+     * parsed, whereas XML is parsed as it is read.
+     *
+     * Note that {@link invokeMethodIter()} always uses XML, since it
+     * parses the response as it is read.
+     *
+     * @param string $format The format to use.
+     * @return void
+     */
+    public function setFormat($format)
+    {
+        if ($format !== self::FORMAT_XML && $format !== self::FORMAT_JSON)
+            throw new Exception("Unsupported format: '" . $format . "'");
+        $this->format = $format;
+    }
+
+    /**
+     * Get the format in which results are sent by the server.
+     *
+     * @return string {@link FORMAT_XML} or {@link FORMAT_JSON}.
+     */
+    public function getFormat()
+    {
+        return $this->format;
+    }
+
     /*
      * Convert an arbitrary value to a string for use as a parameter to be
      * sent to the server.
@@ -257,12 +366,20 @@ class IbisClientConnection implements ClientConnection
         return $this->invokeMethod("GET", $path, $pathParams, $queryParams);
     }
 
-    /* @see ClientConnection::invokeMethod(string, string, string[], array, array) */
-    public function invokeMethod($method, $path, $pathParams,
-                                 $queryParams, $formParams=null)
+    /*
+     * Build the URL, headers and content of the HTTP request needed to
+     * invoke a method in the web service API, asking for the result in the
+     * specified format (by default, the connection's format).
+     */
+    private function buildRequest($path, $pathParams, $queryParams,
+                                  $formParams, $format=null)
     {
+        if (is_null($format))
+            $format = $this->format;
+
         // Build the URL
-        $headers = array($this->authorization, "Accept: application/xml");
+        $headers = array($this->authorization,
+                         "Accept: application/" . $format);
         $url = $this->buildURL($path, $pathParams, $queryParams);
         $content = "";
 
@@ -280,58 +397,341 @@ class IbisClientConnection implements ClientConnection
             $headers[] = "Content-type: application/x-www-form-urlencoded";
         }
 
-        // Set up the HTTPS request headers
-        $http_options = array("method" => $method,
-                              "header" => $headers,
-                              "content" => $content,
-                              "ignore_errors" => true);
+        return array($url, $headers, $content);
+    }
 
-        $ssl_options = array("verify_peer" => true,
-                             "allow_self_signed" => $this->allowSelfSigned);
+    /*
+     * Get the format of the body of the response to a request
+     * (FORMAT_XML or FORMAT_JSON), or null if it is neither.
+     */
+    private function responseFormat($responseHeaders)
+    {
+        foreach ($responseHeaders as $header)
+        {
+            if (stripos($header, "content-type: application/xml") !== false)
+                return self::FORMAT_XML;
+            if (stripos($header, "content-type: application/json") !== false)
+                return self::FORMAT_JSON;
+        }
+        return null;
+    }
 
-        $ctx_params = array("http" => $http_options,
-                            "ssl" => $ssl_options);
+    /*
+     * Check the response to a request, returning a suitable IbisError
+     * (having read the response body and closed the stream) if it isn't
+     * XML or JSON, or null if it is.
+     */
+    private function responseError($responseHeaders, $file)
+    {
+        // Check if we got XML or JSON back
+        if (!is_null($this->responseFormat($responseHeaders)))
+            return null;
 
-        // Send the request and check if we got XML back
-        $ctx = stream_context_create($ctx_params);
-        $file = fopen($url, "r", false, $ctx);
         $status = "200";
         $code = "OK";
-        $gotXml = false;
-
-        foreach ($http_response_header as $header)
+        foreach ($responseHeaders as $header)
         {
             if (stripos($header, "http") === 0)
             {
                 $a = explode(" ", $header);
                 $status = $a[1];
-                $code = $a[2];
+                $code = isset($a[2]) ? $a[2] : "";
             }
-            if (stripos($header, "content-type: application/xml") !== false)
-                $gotXml = true;
         }
 
-        if (!$gotXml)
-        {
-            // We didn't get XML back so create an IbisResult containing a
-            // suitable IbisError
-            $error = new IbisError(array("status" => $status,
-                                         "code" => $code));
-            $error->message = "Unexpected result from server";
-            $error->details = fread($file, 1000000);
-            fclose($file);
+        $error = new IbisError(array("status" => $status,
+                                     "code" => $code));
+        $error->message = "Unexpected result from server";
+        $error->details = stream_get_contents($file, 1000000);
+        fclose($file);
 
+        return $error;
+    }
+
+    /*
+     * Create a parser for the response to a request with the specified
+     * query parameters, interning its entities with those of the other
+     * results fetched with the same fetch parameter.
+     */
+    private function createParser($queryParams)
+    {
+        $internTable = null;
+        if (isset($this->internTable))
+            $internTable = $this->internTable->forFetch(
+                isset($queryParams["fetch"]) ? $queryParams["fetch"] : null);
+        return new IbisResultParser($this->lazyUnflatten, $internTable);
+    }
+
+    /*
+     * Parse the response to a request with the specified query parameters
+     * into an IbisResult, closing the stream holding the response body.
+     */
+    private function parseResponse($responseHeaders, $file, $queryParams)
+    {
+        $error = $this->responseError($responseHeaders, $file);
+        if (isset($error))
+        {
+            // We didn't get XML or JSON back so create an IbisResult
+            // containing a suitable IbisError
             $result = new IbisResult();
             $result->error = $error;
 
             return $result;
         }
 
-        // Parse the XML result into an IbisResult object
-        $parser = new IbisResultParser();
-        $result = $parser->parseXmlFile($file);
+        // Parse the XML or JSON result into an IbisResult object
+        $parser = $this->createParser($queryParams);
+        if ($this->responseFormat($responseHeaders) === self::FORMAT_JSON)
+            $result = $parser->parseJsonFile($file);
+        else
+            $result = $parser->parseXmlFile($file);
         fclose($file);
 
         return $result;
     }
+
+    /* @see ClientConnection::invokeMethod(string, string, string[], array, array) */
+    public function invokeMethod($method, $path, $pathParams,
+                                 $queryParams, $formParams=null)
+    {
+        list($url, $headers, $content) =
+            $this->buildRequest($path, $pathParams, $queryParams, $formParams);
+
+        list($responseHeaders, $file) =
+            $this->getTransport()->request($method, $url, $headers, $content,
+                                           $this->allowSelfSigned);
+
+        return $this->parseResponse($responseHeaders, $file, $queryParams);
+    }
+
+    /**
+     * Invoke a web service method that returns a list of people,
+     * institutions, groups, attributes or attribute schemes, returning each
+     * one as soon as it has been read from the server.
+     *
+     * The arguments are the same as for {@link invokeMethod()}. For
+     * example, to process all the members of an institution, and their
+     * institutions, without holding them all in memory at once:
+     *
+     * <pre>
+     * $members = $conn->invokeMethodIter("GET", 'api/v1/inst/%1$s/members',
+     *                                    array("UIS"),
+     *                                    array("fetch" => "all_insts"));
+     * foreach ($members as $person)
+     *     ...
+     * </pre>
+     *
+     * This asks for the hierarchical XML representation (unless the
+     * "flatten" query parameter is set), which the response is parsed from
+     * as it is read (see {@link IbisResultParser::parseXmlFileIter()}). The
+     * request is sent when the iteration starts. Both
+     * {@link IbisCurlTransport} and {@link IbisStreamTransport} return the
+     * response body as it is received, so each entity is yielded while the
+     * rest of the response is still being read from the server.
+     *
+     * @param string $method The method type (``"GET"``, ``"POST"``,
+     * ``"PUT"`` or ``"DELETE"``).
+     * @param string $path The path to the method to invoke.
+     * @param string[] $pathParams Any path parameters that should be inserted
+     * into the path in place of any format specifiers.
+     * @param array $queryParams Any query parameters to add as part of the
+     * URL's query string.
+     * @param array $formParams Any form parameters to submit.
+     * @return Generator The entities returned by the method, in order.
+     * @throws IbisException If the method fails.
+     */
+    public function invokeMethodIter($method, $path, $pathParams,
+                                     $queryParams, $formParams=null)
+    {
+        // Ask for the hierarchical representation, in which each top-level
+        // entity is complete as soon as its closing tag has been read
+        if (!isset($queryParams["flatten"]))
+            $queryParams["flatten"] = false;
+
+        list($url, $headers, $content) =
+            $this->buildRequest($path, $pathParams, $queryParams, $formParams,
+                                self::FORMAT_XML);
+
+        list($responseHeaders, $file) =
+            $this->getTransport()->request($method, $url, $headers, $content,
+                                           $this->allowSelfSigned);
+
+        $error = $this->responseError($responseHeaders, $file);
+        if (isset($error))
+            throw new IbisException($error);
+
+        try
+        {
+            $parser = $this->createParser($queryParams);
+            foreach ($parser->parseXmlFileIter($file) as $entity)
+                yield $entity;
+
+            $result = $parser->getResult();
+            if (isset($result->error))
+                throw new IbisException($result->error);
+        }
+        finally
+        {
+            fclose($file);
+        }
+    }
+
+    /**
+     * Invoke many web service methods at once.
+     *
+     * Each request is an array of the arguments to
+     * {@link invokeMethod()}: the method type, the path, the path
+     * parameters, the query parameters and (optionally) the form
+     * parameters. For example:
+     *
+     * <pre>
+     * $results = $conn->invokeMethods(array(
+     *     "abc123" => array("GET", 'api/v1/person/%1$s/%2$s',
+     *                       array("crsid", "abc123"), array()),
+     *     "UIS"    => array("GET", 'api/v1/inst/%1$s',
+     *                       array("UIS"), array("fetch" => "all_members"))));
+     * </pre>
+     *
+     * If the connection is using an {@link IbisCurlTransport} (the
+     * default, when the curl extension is available), up to
+     * ``$maxConcurrent`` of the requests are sent at a time, over separate
+     * connections, using curl's multi interface, and each response is
+     * parsed as soon as it is complete, so that the whole set takes little
+     * more than the time of the slowest request. Otherwise, the requests
+     * are sent one at a time.
+     *
+     * A request that fails without a response from the server (for
+     * example, if the connection fails) doesn't stop the others: its result
+     * contains an {@link IbisError} (see {@link IbisBatch::errorResult}),
+     * just as the result of a request that the server rejects does.
+     *
+     * @param array $requests The requests to send, each keyed by any
+     * string or integer.
+     * @param int $maxConcurrent The maximum number of requests to have in
+     * progress at once. Defaults to 16.
+     * @return IbisResult[] The result of each request, with the same key
+     * as the request, and in the same order.
+     */
+    public function invokeMethods($requests, $maxConcurrent=16)
+    {
+        if (!($this->getTransport() instanceof IbisCurlTransport))
+        {
+            $results = array();
+            foreach ($requests as $key => $request)
+            {
+                $formParams = isset($request[4]) ? $request[4] : null;
+                list($url, $headers, $content) =
+                    $this->buildRequest($request[1], $request[2],
+                                        $request[3], $formParams);
+                try
+                {
+                    list($responseHeaders, $file) =
+                        $this->getTransport()->request($request[0], $url,
+                                                       $headers, $content,
+                                                       $this->allowSelfSigned);
+                }
+                catch (Exception $e)
+                {
+                    $results[$key] = IbisBatch::errorResult($e->getMessage());
+                    continue;
+                }
+                $results[$key] = $this->parseResponse($responseHeaders, $file,
+                                                      $request[3]);
+            }
+            return $results;
+        }
+
+        $compress = $this->getTransport()->getCompress();
+        $multi = curl_multi_init();
+        $queue = array_keys($requests);
+        $next = 0;
+        $handles = array();
+        $urls = array();
+        $bodies = array();
+        $responseHeaders = array();
+        $results = array();
+
+        try
+        {
+            while ($next < count($queue) || !empty($handles))
+            {
+                // Start more requests, up to the limit
+                while ($next < count($queue) &&
+                       count($handles) < $maxConcurrent)
+                {
+                    $key = $queue[$next++];
+                    $request = $requests[$key];
+                    $formParams = isset($request[4]) ? $request[4] : null;
+                    list($url, $headers, $content) =
+                        $this->buildRequest($request[1], $request[2],
+                                            $request[3], $formParams);
+
+                    $handles[$key] = curl_init();
+                    $urls[$key] = $url;
+                    $bodies[$key] = fopen("php://temp", "w+");
+                    $responseHeaders[$key] = array();
+                    IbisCurlTransport::setOptions($handles[$key], $request[0],
+                                                  $url, $headers, $content,
+                                                  $this->allowSelfSigned,
+                                                  $bodies[$key],
+                                                  $responseHeaders[$key],
+                                                  $compress);
+                    curl_multi_add_handle($multi, $handles[$key]);
+                }
+
+                // Make progress on the requests in progress, and wait for
+                // more to be possible
+                do
+                    $status = curl_multi_exec($multi, $stillRunning);
+                while ($status == CURLM_CALL_MULTI_PERFORM);
+
+                // Parse the responses to any requests that have completed
+                while (($info = curl_multi_info_read($multi)) !== false)
+                {
+                    $key = array_search($info["handle"], $handles, true);
+                    curl_multi_remove_handle($multi, $handles[$key]);
+                    $error = curl_error($handles[$key]);
+                    curl_close($handles[$key]);
+                    unset($handles[$key]);
+
+                    if ($info["result"] !== CURLE_OK)
+                    {
+                        $results[$key] = IbisBatch::errorResult(
+                            "Unable to connect to " . $urls[$key], $error);
+                        fclose($bodies[$key]);
+                    }
+                    else
+                    {
+                        rewind($bodies[$key]);
+                        $results[$key] =
+                            $this->parseResponse($responseHeaders[$key],
+                                                 $bodies[$key],
+                                                 $requests[$key][3]);
+                    }
+                    unset($bodies[$key]);
+                    unset($responseHeaders[$key]);
+                }
+
+                if ($stillRunning && curl_multi_select($multi, 1.0) == -1)
+                    usleep(1000);
+            }
+        }
+        finally
+        {
+            foreach ($handles as $key => $ch)
+            {
+                curl_multi_remove_handle($multi, $ch);
+                curl_close($ch);
+            }
+            foreach ($bodies as $body)
+                fclose($body);
+            curl_multi_close($multi);
+        }
+
+        // Return the results in the order of the requests
+        $ordered = array();
+        foreach ($queue as $key)
+            $ordered[$key] = $results[$key];
+        return $ordered;
+    }
 }
@@ -0,0 +1,421 @@
+<?php
+/*
+Copyright (c) 2012, University of Cambridge Computing Service
+
+This file is part of the Lookup/Ibis client library.
+
+This library is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This library is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this library.  If not, see <http://www.gnu.org/licenses/>.
+*/
+
+require_once "IbisTransport.php";
+
+/**
+ * {@link IbisTransport} using the curl extension. Each transport keeps a
+ * single curl handle, so successive requests to the server reuse the same
+ * kept-alive connection, rather than each paying for a new TCP connection
+ * and TLS handshake. All the curl transports in a process also share their
+ * DNS, TLS session and (where supported) connection caches.
+ *
+ * By default, the server is asked to compress its responses (with any of
+ * the encodings that curl supports, such as gzip and deflate), and curl
+ * decompresses each response as it is received.
+ *
+ * The body of each response is read from the server as it is read from
+ * the returned stream, rather than all being read first, so it may be
+ * parsed while the rest of it is still being received. A response that
+ * isn't read to the end is abandoned by the next request.
+ *
+ * @author Dean Rasheed (dev-group@ucs.cam.ac.uk)
+ */
+class IbisCurlTransport implements IbisTransport
+{
+    /** The curl handle, created on first use. */
+    private $handle = null;
+
+    /** The curl multi handle used to run the curl handle. */
+    private $multi = null;
+
+    /** The response to the last request, which may not have been read. */
+    private $response = null;
+
+    /** The curl share handle shared by all curl transports. */
+    private static $share = null;
+
+    /** Whether to ask the server to compress its responses. */
+    private $compress;
+
+    /**
+     * Create a curl transport.
+     *
+     * @param boolean $compress Whether to ask the server to compress its
+     * responses. Defaults to ``true``.
+     */
+    public function __construct($compress=true)
+    {
+        $this->compress = $compress;
+    }
+
+    /**
+     * Test whether this transport asks the server to compress its
+     * responses.
+     *
+     * @return boolean ``true`` if responses may be compressed.
+     */
+    public function getCompress()
+    {
+        return $this->compress;
+    }
+
+    /**
+     * Test whether this transport can be used (whether the curl extension is
+     * loaded).
+     *
+     * @return boolean ``true`` if curl is available.
+     */
+    public static function isAvailable()
+    {
+        return function_exists("curl_init");
+    }
+
+    /*
+     * Get the share handle, creating it if necessary.
+     */
+    private static function getShare()
+    {
+        if (is_null(IbisCurlTransport::$share) &&
+            function_exists("curl_share_init"))
+        {
+            $share = curl_share_init();
+            curl_share_setopt($share, CURLSHOPT_SHARE, CURL_LOCK_DATA_DNS);
+            curl_share_setopt($share, CURLSHOPT_SHARE, CURL_LOCK_DATA_SSL_SESSION);
+            if (defined("CURL_LOCK_DATA_CONNECT"))
+                curl_share_setopt($share, CURLSHOPT_SHARE, CURL_LOCK_DATA_CONNECT);
+            IbisCurlTransport::$share = $share;
+        }
+        return IbisCurlTransport::$share;
+    }
+
+    /**
+     * Set the options of a curl handle for a request.
+     *
+     * The response body is written to ``$body``, which is either a stream
+     * or a function called with each chunk of the body as it is received,
+     * and the response headers are appended to the array
+     * ``$responseHeaders``.
+     *
+     * @param resource $ch The curl handle.
+     * @param string $method The HTTP method.
+     * @param string $url The full URL of the request.
+     * @param string[] $headers The request headers.
+     * @param string $content The body of the request.
+     * @param boolean $allowSelfSigned Whether to allow self-signed
+     * certificates.
+     * @param resource|callable $body The stream to write the response body
+     * to, or a function taking the curl handle and a chunk of the body, and
+     * returning the length of the chunk.
+     * @param string[] $responseHeaders The array to add the response headers
+     * to.
+     * @param boolean $compress Whether to ask the server to compress the
+     * response (which is decompressed before it is written to ``$body``).
+     * @return void
+     */
+    public static function setOptions($ch, $method, $url, $headers, $content,
+                                      $allowSelfSigned, $body,
+                                      &$responseHeaders, $compress=true)
+    {
+        $share = IbisCurlTransport::getShare();
+        if (!is_null($share))
+            curl_setopt($ch, CURLOPT_SHARE, $share);
+
+        // Disable "Expect: 100-continue", which would cost a round trip for
+        // larger form posts
+        $headers[] = "Expect:";
+
+        $options = array(CURLOPT_URL => $url,
+                         CURLOPT_CUSTOMREQUEST => $method,
+                         CURLOPT_HTTPHEADER => $headers,
+                         CURLOPT_HTTP_VERSION => CURL_HTTP_VERSION_1_1,
+                         CURLOPT_FOLLOWLOCATION => true,
+                         CURLOPT_HEADERFUNCTION =>
+                             function ($ch, $header) use (&$responseHeaders)
+                             {
+                                 $line = rtrim($header, "\r\n");
+                                 if ($line !== "")
+                                     $responseHeaders[] = $line;
+                                 return strlen($header);
+                             });
+
+        if (is_callable($body))
+            $options[CURLOPT_WRITEFUNCTION] = $body;
+        else
+            $options[CURLOPT_FILE] = $body;
+
+        // curl can't allow just self-signed certificates, so allowing them
+        // disables peer verification (but the host name is still checked)
+        if ($allowSelfSigned)
+            $options[CURLOPT_SSL_VERIFYPEER] = false;
+
+        if ($method !== "GET")
+            $options[CURLOPT_POSTFIELDS] = $content;
+
+        // An empty string sends an Accept-Encoding header listing every
+        // encoding that curl supports, and decodes the response as it is
+        // received
+        if ($compress)
+            $options[CURLOPT_ENCODING] = "";
+
+        curl_setopt_array($ch, $options);
+    }
+
+    /*
+     * The response body is not read in advance. Instead, the returned
+     * stream reads it from the server as it is read (see
+     * IbisCurlResponse), so that a response can be parsed while the rest of
+     * it is still being received.
+     *
+     * @see IbisTransport::request(string, string, string[], string, boolean)
+     */
+    public function request($method, $url, $headers, $content,
+                            $allowSelfSigned)
+    {
+        // Abandon any response from the last request that hasn't been read
+        if (!is_null($this->response))
+            $this->response->close();
+
+        // Reuse the handles, resetting the options left by the last request
+        // (which keeps its connection alive)
+        if (is_null($this->handle))
+        {
+            $this->handle = curl_init();
+            $this->multi = curl_multi_init();
+        }
+        else
+            curl_reset($this->handle);
+
+        $response = new IbisCurlResponse($this->multi, $this->handle, $url);
+        $responseHeaders = array();
+        IbisCurlTransport::setOptions($this->handle, $method, $url, $headers,
+                                      $content, $allowSelfSigned,
+                                      array($response, "write"),
+                                      $responseHeaders, $this->compress);
+        $response->start();
+        $this->response = $response;
+
+        return array($responseHeaders, $response->open());
+    }
+
+    /**
+     * Close the connection to the server.
+     */
+    public function __destruct()
+    {
+        if (!is_null($this->response))
+            $this->response->close();
+        if (!is_null($this->handle))
+        {
+            curl_close($this->handle);
+            curl_multi_close($this->multi);
+        }
+    }
+}
+
+/**
+ * @ignore
+ * The body of a response to a request made with {@link IbisCurlTransport},
+ * read from the server as it is needed. Each read runs the transfer until
+ * some more of the body has been received (decompressed, if the server
+ * compressed it), so parsing an XML response overlaps with reading it.
+ * A JSON response is read in full before it is parsed.
+ */
+class IbisCurlResponse
+{
+    /* The curl multi handle running the transfer. */
+    private $multi;
+
+    /* The curl handle of the transfer. */
+    private $handle;
+
+    /* The URL requested, for error messages. */
+    private $url;
+
+    /* The part of the body received, but not yet all read. */
+    private $buffer = "";
+
+    /* The offset in $buffer of the data not yet read. */
+    private $offset = 0;
+
+    /* Whether the transfer has finished. */
+    private $done = false;
+
+    /* Whether the transfer is still attached to the multi handle. */
+    private $running = false;
+
+    public function __construct($multi, $handle, $url)
+    {
+        $this->multi = $multi;
+        $this->handle = $handle;
+        $this->url = $url;
+    }
+
+    /*
+     * The curl write function, called with each chunk of the body.
+     */
+    public function write($ch, $data)
+    {
+        $this->buffer .= $data;
+        return strlen($data);
+    }
+
+    /*
+     * Start the transfer, and run it until all the headers of the final
+     * response have been received (which they have once any of the body
+     * has arrived, or the transfer has finished).
+     */
+    public function start()
+    {
+        curl_multi_add_handle($this->multi, $this->handle);
+        $this->running = true;
+
+        while ($this->buffer === "" && !$this->done)
+            $this->perform();
+    }
+
+    /*
+     * Run the transfer until more data is received or it finishes.
+     */
+    private function perform()
+    {
+        do
+        {
+            $status = curl_multi_exec($this->multi, $active);
+        } while ($status == CURLM_CALL_MULTI_PERFORM);
+
+        while (($info = curl_multi_info_read($this->multi)) !== false)
+        {
+            if ($info["handle"] !== $this->handle)
+                continue;
+
+            $this->done = true;
+            if ($info["result"] !== CURLE_OK)
+            {
+                $error = curl_error($this->handle);
+                $this->close();
+                throw new Exception("Unable to connect to " . $this->url .
+                                    ": " . $error);
+            }
+        }
+
+        if (!$this->done && $this->buffer === "" &&
+            curl_multi_select($this->multi) == -1)
+            usleep(1000);
+    }
+
+    /*
+     * Read up to $count bytes of the body, waiting for more to be received
+     * if none is available. Returns "" at the end of the body.
+     */
+    public function read($count)
+    {
+        while ($this->buffer === "" && !$this->done)
+            $this->perform();
+
+        // Rather than copying the rest of the buffer on every read, only
+        // discard it once it has all been read
+        $data = (string)substr($this->buffer, $this->offset, $count);
+        $this->offset += strlen($data);
+        if ($this->offset >= strlen($this->buffer))
+        {
+            $this->buffer = "";
+            $this->offset = 0;
+        }
+        return $data;
+    }
+
+    /*
+     * Test whether all of the body has been read.
+     */
+    public function eof()
+    {
+        return $this->done && $this->buffer === "";
+    }
+
+    /*
+     * Finish with the transfer, abandoning it if it is still in progress.
+     */
+    public function close()
+    {
+        if ($this->running)
+        {
+            curl_multi_remove_handle($this->multi, $this->handle);
+            $this->running = false;
+        }
+        $this->done = true;
+        $this->buffer = "";
+        $this->offset = 0;
+    }
+
+    /*
+     * Open a stream reading the body.
+     */
+    public function open()
+    {
+        if (!in_array("ibiscurl", stream_get_wrappers()))
+            stream_wrapper_register("ibiscurl", "IbisCurlStream");
+
+        $context = stream_context_create(
+            array("ibiscurl" => array("response" => $this)));
+        return fopen("ibiscurl://response", "r", false, $context);
+    }
+}
+
+/**
+ * @ignore
+ * The stream wrapper for the streams returned by
+ * {@link IbisCurlResponse::open()}.
+ */
+class IbisCurlStream
+{
+    /* The stream context, set by PHP. */
+    public $context;
+
+    /* The response being read. */
+    private $response;
+
+    public function stream_open($path, $mode, $options, &$openedPath)
+    {
+        $options = stream_context_get_options($this->context);
+        $this->response = $options["ibiscurl"]["response"];
+        return true;
+    }
+
+    public function stream_read($count)
+    {
+        return $this->response->read($count);
+    }
+
+    public function stream_eof()
+    {
+        return $this->response->eof();
+    }
+
+    public function stream_close()
+    {
+        $this->response->close();
+    }
+
+    public function stream_stat()
+    {
+        return array();
+    }
+}
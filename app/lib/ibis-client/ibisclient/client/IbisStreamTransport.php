@@ -0,0 +1,126 @@
+<?php
+/*
+Copyright (c) 2012, University of Cambridge Computing Service
+
+This file is part of the Lookup/Ibis client library.
+
+This library is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This library is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this library.  If not, see <http://www.gnu.org/licenses/>.
+*/
+
+require_once "IbisTransport.php";
+
+/**
+ * {@link IbisTransport} using PHP's HTTPS stream wrapper. This needs no
+ * extensions, but opens a new connection (with a new TLS handshake) for
+ * every request.
+ *
+ * If the zlib extension is available, the server is asked to compress its
+ * responses with gzip, and a zlib.inflate filter is added to
+ * the response stream, so that the response is decompressed as it is
+ * read, rather than all at once. An XML response is then parsed as it is
+ * decompressed, but a JSON response is read in full before it is parsed.
+ *
+ * @author Dean Rasheed (dev-group@ucs.cam.ac.uk)
+ */
+class IbisStreamTransport implements IbisTransport
+{
+    /** Whether to ask the server to compress its responses. */
+    private $compress;
+
+    /**
+     * Create a stream transport.
+     *
+     * @param boolean $compress Whether to ask the server to compress its
+     * responses, if the zlib extension is available. Defaults to ``true``.
+     */
+    public function __construct($compress=true)
+    {
+        $this->compress = $compress && extension_loaded("zlib");
+    }
+
+    /**
+     * Test whether this transport asks the server to compress its
+     * responses.
+     *
+     * @return boolean ``true`` if responses may be compressed.
+     */
+    public function getCompress()
+    {
+        return $this->compress;
+    }
+
+    /*
+     * Get the Content-Encoding of the last response in a set of response
+     * headers (which include those of any redirects followed).
+     */
+    private static function contentEncoding($responseHeaders)
+    {
+        $encoding = null;
+        foreach ($responseHeaders as $header)
+        {
+            if (stripos($header, "http") === 0)
+                $encoding = null;
+            elseif (stripos($header, "content-encoding:") === 0)
+                $encoding = strtolower(trim(substr($header, 17)));
+        }
+        return $encoding;
+    }
+
+    /* @see IbisTransport::request(string, string, string[], string, boolean) */
+    public function request($method, $url, $headers, $content,
+                            $allowSelfSigned)
+    {
+        // Only gzip is asked for. Some servers send "deflate" as a raw
+        // deflate stream, without the zlib header that the encoding
+        // requires, and the filter can't tell which it has been sent.
+        if ($this->compress)
+            $headers[] = "Accept-Encoding: gzip";
+
+        // Set up the HTTPS request headers
+        $http_options = array("method" => $method,
+                              "header" => $headers,
+                              "content" => $content,
+                              "ignore_errors" => true);
+
+        $ssl_options = array("verify_peer" => true,
+                             "allow_self_signed" => $allowSelfSigned);
+
+        $ctx_params = array("http" => $http_options,
+                            "ssl" => $ssl_options);
+
+        // Send the request
+        $ctx = stream_context_create($ctx_params);
+        $file = fopen($url, "r", false, $ctx);
+        if ($file === false)
+            throw new Exception("Unable to connect to " . $url);
+
+        // Decompress the response as it is read. A window of 15 (the
+        // maximum), plus 32, detects either a gzip or a zlib header, so a
+        // "deflate" response with a zlib header is also handled, in case the
+        // server sends one anyway.
+        $encoding = IbisStreamTransport::contentEncoding($http_response_header);
+        if ($encoding === "gzip" || $encoding === "deflate")
+        {
+            if (stream_filter_append($file, "zlib.inflate", STREAM_FILTER_READ,
+                                     array("window" => 47)) === false)
+            {
+                fclose($file);
+                throw new Exception("Unable to decompress the response from " .
+                                    $url);
+            }
+        }
+
+        return array($http_response_header, $file);
+    }
+}
@@ -0,0 +1,47 @@
+<?php
+/*
+Copyright (c) 2012, University of Cambridge Computing Service
+
+This file is part of the Lookup/Ibis client library.
+
+This library is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This library is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this library.  If not, see <http://www.gnu.org/licenses/>.
+*/
+
+/**
+ * Interface representing the means by which an {@link IbisClientConnection}
+ * sends HTTP requests to the Lookup/Ibis server.
+ *
+ * @author Dean Rasheed (dev-group@ucs.cam.ac.uk)
+ */
+interface IbisTransport
+{
+    /**
+     * Send an HTTP request to the server.
+     *
+     * @param string $method The HTTP method to use (``"GET"``, ``"POST"``,
+     * etc.).
+     * @param string $url The full URL of the request.
+     * @param string[] $headers The request headers, each of the form
+     * ``"Name: value"``.
+     * @param string $content The body of the request, which may be empty.
+     * @param boolean $allowSelfSigned Whether or not to allow self-signed
+     * certificates.
+     * @return array An array containing the response headers (including the
+     * status line of each response received, if redirects were followed)
+     * and a stream from which the response body may be read, which the
+     * caller should close.
+     */
+    public function request($method, $url, $headers, $content,
+                            $allowSelfSigned);
+}
@@ -39,6 +39,9 @@ class IbisContactRow extends IbisDto
     protected static $xmlArrays = array("addresses", "emails", "people",
                                         "phoneNumbers", "webPages");
 
+    /* Properties that may hold references in the flattened representation */
+    protected static $xmlRefs = array("people");
+
     /** @var string The contact row's text. */
     public $description;
 
@@ -35,6 +35,12 @@ abstract class IbisDto
     /* Properties marked as @XmlElementWrapper in the JAXB class */
     protected static $xmlArrays = array(); // Set in sub-classes
 
+    /*
+     * Properties that may refer to people, institutions or groups by ID in
+     * the flattened XML/JSON representation
+     */
+    protected static $xmlRefs = array(); // Set in sub-classes
+
     /**
      * @ignore
      * Create an IbisDto from the attributes of an XML node. This just sets
@@ -88,4 +94,25 @@ abstract class IbisDto
         if (in_array($tagname, static::$xmlElems, true))
             $this->$tagname = $data;
     }
+
+    /**
+     * @ignore
+     * Set a property from the JSON representation. This sets the value of
+     * any properties marked as @XmlElement or @XmlElementWrapper in the
+     * JAXB class (the properties marked as @XmlAttribute having been set by
+     * the constructor). Elements are passed to {@link endChildElement()},
+     * exactly as they would be from XML.
+     *
+     * @param string $name The name of the JSON property.
+     * @param mixed $value The property's value, already converted to
+     * DTOs.
+     * @return void.
+     */
+    public function setJsonProperty($name, $value)
+    {
+        if (in_array($name, static::$xmlArrays, true))
+            $this->$name = $value;
+        else
+            $this->endChildElement($name, $value);
+    }
 }
@@ -43,6 +43,14 @@ class IbisGroup extends IbisDto
                                         "readsGroups", "readByGroups",
                                         "includesGroups", "includedByGroups");
 
+    /* Properties that may hold references in the flattened representation */
+    protected static $xmlRefs = array("membersOfInst", "members",
+                                      "directMembers", "owningInsts",
+                                      "managesInsts", "managesGroups",
+                                      "managedByGroups", "readsGroups",
+                                      "readByGroups", "includesGroups",
+                                      "includedByGroups");
+
     /** @var boolean Flag indicating if the group is cancelled. */
     public $cancelled;
 
@@ -38,4 +38,19 @@ class IbisIdentifier extends IbisDto
      * CRSid value).
      */
     public $value;
+
+    /**
+     * @ignore
+     * Set a property from the JSON representation. The value, which is the
+     * text of the XML element, is a property in JSON.
+     *
+     * @param string $name The name of the JSON property.
+     * @param mixed $value The property's value.
+     * @return void.
+     */
+    public function setJsonProperty($name, $value)
+    {
+        if ($name === "value")
+            $this->value = $value;
+    }
 }
@@ -41,6 +41,12 @@ class IbisInstitution extends IbisDto
                                         "parentInsts", "childInsts", "groups",
                                         "membersGroups", "managedByGroups");
 
+    /* Properties that may hold references in the flattened representation */
+    protected static $xmlRefs = array("contactRows", "members",
+                                      "parentInsts", "childInsts",
+                                      "groups", "membersGroups",
+                                      "managedByGroups");
+
     /** @var boolean Flag indicating if the institution is cancelled. */
     public $cancelled;
 
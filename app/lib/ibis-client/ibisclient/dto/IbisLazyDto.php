@@ -0,0 +1,152 @@
+<?php
+/*
+Copyright (c) 2012, University of Cambridge Computing Service
+
+This file is part of the Lookup/Ibis client library.
+
+This library is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This library is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this library.  If not, see <http://www.gnu.org/licenses/>.
+*/
+
+require_once "IbisContactRow.php";
+require_once "IbisGroup.php";
+require_once "IbisInstitution.php";
+require_once "IbisPerson.php";
+
+/**
+ * @ignore
+ * The lazy unflattening of a DTO. The references in the properties listed
+ * in its class's $xmlRefs are not resolved when the result is unflattened.
+ * Instead, the properties are unset, so that the first access to each one
+ * resolves it (see __get()).
+ *
+ * This is only used by the classes below, which {@link IbisResultParser}
+ * creates in place of the ordinary DTO classes when it unflattens results
+ * lazily. Every other DTO has no magic properties.
+ */
+trait IbisLazyDto
+{
+    /* The entity map used to resolve references lazily */
+    private $lazyEm = null;
+
+    /* The properties whose references have not yet been resolved */
+    private $lazyRefs = null;
+
+    /**
+     * @ignore
+     * Unflatten this object lazily.
+     *
+     * @param IbisResultEntityMap $em The mapping from IDs to entities.
+     * @return void.
+     */
+    public function unflattenLazily($em)
+    {
+        if (isset($this->lazyRefs))
+            return;
+
+        $this->lazyEm = $em;
+        $this->lazyRefs = array();
+        foreach (static::$xmlRefs as $name)
+        {
+            if (isset($this->$name))
+            {
+                $this->lazyRefs[$name] = $this->$name;
+                unset($this->$name);
+            }
+        }
+    }
+
+    /**
+     * @ignore
+     * Resolve the references in a property of a lazily unflattened object
+     * on first access, setting the property. The reference returned is to
+     * the property itself (which is set from then on, so this is only
+     * called once for it), so that it may be modified as usual.
+     *
+     * @param string $name The name of the property.
+     * @return mixed A reference to the property's value.
+     */
+    public function &__get($name)
+    {
+        if (isset($this->lazyRefs) && array_key_exists($name, $this->lazyRefs))
+        {
+            $value = $this->lazyRefs[$name];
+            unset($this->lazyRefs[$name]);
+
+            if (is_array($value))
+                foreach ($value as $idx => $entity)
+                    $value[$idx] = $this->lazyEm->resolve($entity);
+            else
+                $value = $this->lazyEm->resolve($value);
+
+            $this->$name = $value;
+            if (empty($this->lazyRefs))
+                $this->lazyEm = null;
+            return $this->$name;
+        }
+
+        trigger_error("Undefined property: " . get_class($this) . "::$" .
+                      $name, E_USER_NOTICE);
+        $dummy = null;
+        return $dummy;
+    }
+
+    /**
+     * @ignore
+     * Test whether a property of a lazily unflattened object that has not
+     * been resolved yet is set.
+     *
+     * @param string $name The name of the property.
+     * @return boolean ``true`` if the property is set.
+     */
+    public function __isset($name)
+    {
+        return isset($this->lazyRefs) && isset($this->lazyRefs[$name]);
+    }
+}
+
+/**
+ * @ignore
+ * An {@link IbisPerson} that may be unflattened lazily.
+ */
+class IbisLazyPerson extends IbisPerson
+{
+    use IbisLazyDto;
+}
+
+/**
+ * @ignore
+ * An {@link IbisInstitution} that may be unflattened lazily.
+ */
+class IbisLazyInstitution extends IbisInstitution
+{
+    use IbisLazyDto;
+}
+
+/**
+ * @ignore
+ * An {@link IbisGroup} that may be unflattened lazily.
+ */
+class IbisLazyGroup extends IbisGroup
+{
+    use IbisLazyDto;
+}
+
+/**
+ * @ignore
+ * An {@link IbisContactRow} that may be unflattened lazily.
+ */
+class IbisLazyContactRow extends IbisContactRow
+{
+    use IbisLazyDto;
+}
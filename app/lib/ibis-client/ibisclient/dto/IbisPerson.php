@@ -44,6 +44,10 @@ class IbisPerson extends IbisDto
                                         "institutions", "groups",
                                         "directGroups");
 
+    /* Properties that may hold references in the flattened representation */
+    protected static $xmlRefs = array("institutions", "groups",
+                                      "directGroups");
+
     /** @var boolean Flag indicating if the person is cancelled. */
     public $cancelled;
 
@@ -28,6 +28,7 @@ require_once "IbisError.php";
 require_once "IbisGroup.php";
 require_once "IbisIdentifier.php";
 require_once "IbisInstitution.php";
+require_once "IbisLazyDto.php";
 require_once "IbisPerson.php";
 
 /**
@@ -161,12 +162,34 @@ class IbisResult extends IbisDto
      * been replaced by actual object references, giving an object tree that
      * can be traversed normally.
      *
+     * If ``$lazy`` is ``true``, only the top-level references are replaced
+     * now. The references held by each entity are replaced when that
+     * property of the entity is first used, so the cost of unflattening
+     * entities that are never looked at is never paid. Each entity holds
+     * on to the entity map until all its references have been resolved.
+     *
+     * @param boolean $lazy Whether to unflatten lazily.
+     * @param IbisInternTable $internTable When unflattening lazily, an
+     * optional table of the entities already returned by other results,
+     * which are used in place of any equivalent entities in this one.
      * @return IbisResult This IbisResult object, with its internals
      * unflattened.
      */
-    public function unflatten()
+    public function unflatten($lazy=false, $internTable=null)
     {
-        if (isset($this->entities))
+        if (isset($this->entities) && $lazy)
+        {
+            $em = new IbisResultEntityMap($this, $internTable);
+
+            foreach (array("person", "institution", "group") as $name)
+                if (isset($this->$name))
+                    $this->$name = $em->resolve($this->$name);
+            foreach (array("people", "institutions", "groups") as $name)
+                if (isset($this->$name))
+                    foreach ($this->$name as $idx => $entity)
+                        $this->{$name}[$idx] = $em->resolve($entity);
+        }
+        elseif (isset($this->entities))
         {
             $em = new IbisResultEntityMap($this);
 
@@ -238,10 +261,15 @@ class IbisResultEntityMap
     private $peopleById;
     private $instsById;
     private $groupsById;
+    private $internTable;
 
-    /** Construct an entity map from a flattened IbisResult. */
-    public function __construct($result)
+    /**
+     * Construct an entity map from a flattened IbisResult, optionally using
+     * a table of interned entities when resolving references.
+     */
+    public function __construct($result, $internTable=null)
     {
+        $this->internTable = $internTable;
         $this->peopleById = array();
         $this->instsById = array();
         $this->groupsById = array();
@@ -265,6 +293,124 @@ class IbisResultEntityMap
 
     /** Get a group from the entity map, given its ID */
     public function getGroup($id) { return $this->groupsById[$id]; }
+
+    /**
+     * Resolve a reference to a person, institution or group (or any other
+     * object holding such references, such as a contact row) when
+     * unflattening lazily, returning the object to use in its place.
+     */
+    public function resolve($entity)
+    {
+        if (isset($entity->ref))
+        {
+            if ($entity instanceof IbisPerson)
+                $entity = $this->peopleById[$entity->ref];
+            elseif ($entity instanceof IbisInstitution)
+                $entity = $this->instsById[$entity->ref];
+            else
+                $entity = $this->groupsById[$entity->ref];
+
+            if (isset($this->internTable))
+                $entity = $this->internTable->intern($entity);
+        }
+        $entity->unflattenLazily($this);
+        return $entity;
+    }
+}
+
+/**
+ * A table of people, institutions and groups, used when unflattening
+ * results lazily, so that each person, institution or group returned by a
+ * number of results (for example, the institutions of the people on each
+ * page of a paged method) is only hydrated once, and only held in memory
+ * once.
+ *
+ * The entities are identified by their CRSid (or other identifier),
+ * instid or groupid. Since the ``fetch`` parameter of a result determines
+ * which properties of its entities are set, entities are only shared by
+ * results fetched with the same ``fetch`` parameter: each result should
+ * be parsed using the view of the table returned by {@link forFetch()}.
+ * (An {@link IbisClientConnection} does this itself.)
+ *
+ * @author Dean Rasheed (dev-group@ucs.cam.ac.uk)
+ */
+class IbisInternTable
+{
+    /** The entities, by fetch parameter, type and identifier. */
+    private $entities = array();
+
+    /** The fetch parameter of the results interned by this view. */
+    private $fetch = "";
+
+    /**
+     * Get a view of this table for the results fetched with the specified
+     * ``fetch`` parameter. The view shares this table's entities, but
+     * only interns entities from results with the same ``fetch``
+     * parameter (ignoring the order of its comma-separated values).
+     *
+     * @param string $fetch The ``fetch`` parameter, if any.
+     * @return IbisInternTable The view of this table.
+     */
+    public function forFetch($fetch)
+    {
+        $values = is_null($fetch) ? array() :
+                  array_filter(array_map("trim", explode(",", $fetch)),
+                               "strlen");
+        sort($values);
+
+        $view = new IbisInternTable();
+        $view->entities = &$this->entities;
+        $view->fetch = implode(",", $values);
+        return $view;
+    }
+
+    /*
+     * Get the key of a person, institution or group, or null if it can't
+     * be identified.
+     */
+    private static function key($entity)
+    {
+        if ($entity instanceof IbisPerson && isset($entity->identifier))
+            return "person/" . $entity->identifier->scheme . "/" .
+                   strtolower($entity->identifier->value);
+        if ($entity instanceof IbisInstitution && isset($entity->instid))
+            return "inst/" . $entity->instid;
+        if ($entity instanceof IbisGroup && isset($entity->groupid))
+            return "group/" . $entity->groupid;
+        return null;
+    }
+
+    /**
+     * Get the entity to use in place of a person, institution or group:
+     * the first equivalent entity added to the table with the same
+     * ``fetch`` parameter, or the entity itself if it is the first.
+     *
+     * @param mixed $entity The person, institution or group.
+     * @return mixed The interned person, institution or group.
+     */
+    public function intern($entity)
+    {
+        $key = IbisInternTable::key($entity);
+        if (is_null($key))
+            return $entity;
+        if (!isset($this->entities[$this->fetch][$key]))
+            $this->entities[$this->fetch][$key] = $entity;
+        return $this->entities[$this->fetch][$key];
+    }
+
+    /**
+     * Get the number of entities in the table, for all ``fetch``
+     * parameters.
+     *
+     * @return int The number of entities.
+     */
+    public function size()
+    {
+        $size = 0;
+        foreach ($this->entities as $entities)
+            $size += count($entities);
+        return $size;
+    }
 }
 
 /**
@@ -278,16 +424,103 @@ class XmlTextNode
 }
 
 /**
- * Class to parse the XML from the server and produce an IbisResult.
+ * Class to parse the XML or JSON from the server and produce an IbisResult.
  */
 class IbisResultParser
 {
+    /**
+     * The DTO class of each JSON property holding an object or a list of
+     * objects (in XML, these are known by the names of their elements).
+     */
+    private static $jsonClasses = array(
+        "person"           => "IbisPerson",
+        "people"           => "IbisPerson",
+        "members"          => "IbisPerson",
+        "directMembers"    => "IbisPerson",
+        "institution"      => "IbisInstitution",
+        "institutions"     => "IbisInstitution",
+        "membersOfInst"    => "IbisInstitution",
+        "parentInsts"      => "IbisInstitution",
+        "childInsts"       => "IbisInstitution",
+        "owningInsts"      => "IbisInstitution",
+        "managesInsts"     => "IbisInstitution",
+        "group"            => "IbisGroup",
+        "groups"           => "IbisGroup",
+        "directGroups"     => "IbisGroup",
+        "membersGroups"    => "IbisGroup",
+        "managedByGroups"  => "IbisGroup",
+        "managesGroups"    => "IbisGroup",
+        "readsGroups"      => "IbisGroup",
+        "readByGroups"     => "IbisGroup",
+        "includesGroups"   => "IbisGroup",
+        "includedByGroups" => "IbisGroup",
+        "identifier"       => "IbisIdentifier",
+        "identifiers"      => "IbisIdentifier",
+        "attribute"        => "IbisAttribute",
+        "attributes"       => "IbisAttribute",
+        "attributeSchemes" => "IbisAttributeScheme",
+        "contactRows"      => "IbisContactRow",
+        "phoneNumbers"     => "IbisContactPhoneNumber",
+        "webPages"         => "IbisContactWebPage",
+        "error"            => "IbisError",
+        "entities"         => "IbisResultEntities");
+
+    /**
+     * The DTO classes created in place of the ordinary ones when
+     * unflattening lazily.
+     */
+    private static $lazyClasses = array(
+        "IbisPerson"      => "IbisLazyPerson",
+        "IbisInstitution" => "IbisLazyInstitution",
+        "IbisGroup"       => "IbisLazyGroup",
+        "IbisContactRow"  => "IbisLazyContactRow");
+
     /** The IbisResult produced from the XML */
     private $result;
 
     /** Stack of nodes during XML parsing */
     private $nodeStack;
 
+    /**
+     * Whether the top-level entities are being returned as they are parsed
+     * (see {@link parseXmlFileIter()}).
+     */
+    private $streaming = false;
+
+    /** Top-level entities parsed, but not yet returned, when streaming */
+    private $parsed;
+
+    /** Whether to unflatten results lazily */
+    private $lazy;
+
+    /** The intern table to use when unflattening lazily, if any */
+    private $internTable;
+
+    /**
+     * Create a parser.
+     *
+     * @param boolean $lazy Whether to unflatten flattened results lazily
+     * (see {@link IbisResult::unflatten()}).
+     * @param IbisInternTable $internTable When unflattening lazily, an
+     * optional table of entities shared with other results.
+     */
+    public function __construct($lazy=false, $internTable=null)
+    {
+        $this->lazy = $lazy;
+        $this->internTable = $internTable;
+    }
+
+    /*
+     * Create a DTO of the specified class, or its lazy equivalent if
+     * results are being unflattened lazily.
+     */
+    private function newDto($class, $attrs)
+    {
+        if ($this->lazy && isset(IbisResultParser::$lazyClasses[$class]))
+            $class = IbisResultParser::$lazyClasses[$class];
+        return new $class($attrs);
+    }
+
     /** @ignore Start element callback function for XML parsing */
     public function startElement($parser, $tagname, $attrs)
     {
@@ -295,13 +528,13 @@ class IbisResultParser
         if (!empty($this->nodeStack))
         {
             if ($tagname === "person")
-                $element = new IbisPerson($attrs);
+                $element = $this->newDto("IbisPerson", $attrs);
             elseif ($tagname === "institution")
-                $element = new IbisInstitution($attrs);
+                $element = $this->newDto("IbisInstitution", $attrs);
             elseif ($tagname === "membersOfInst")
-                $element = new IbisInstitution($attrs);
+                $element = $this->newDto("IbisInstitution", $attrs);
             elseif ($tagname === "group")
-                $element = new IbisGroup($attrs);
+                $element = $this->newDto("IbisGroup", $attrs);
             elseif ($tagname === "identifier")
                 $element = new IbisIdentifier($attrs);
             elseif ($tagname === "attribute")
@@ -311,7 +544,7 @@ class IbisResultParser
             elseif ($tagname === "attributeScheme")
                 $element = new IbisAttributeScheme($attrs);
             elseif ($tagname === "contactRow")
-                $element = new IbisContactRow($attrs);
+                $element = $this->newDto("IbisContactRow", $attrs);
             elseif ($tagname === "phoneNumber")
                 $element = new IbisContactPhoneNumber($attrs);
             elseif ($tagname === "webPage")
@@ -356,6 +589,22 @@ class IbisResultParser
             {
                 if (is_array(end($this->nodeStack)))
                 {
+                    // When streaming, each complete top-level entity is
+                    // returned instead. A reference to an entity in a
+                    // flattened result can't be, since the entity itself
+                    // comes later.
+                    if ($this->streaming && sizeof($this->nodeStack) == 2 &&
+                        $element instanceof IbisDto)
+                    {
+                        if (isset($element->ref))
+                            $this->streaming = false;
+                        else
+                        {
+                            $this->parsed[] = $element;
+                            return;
+                        }
+                    }
+
                     // Add the child to the parent's child array, which
                     // means that we must use an array reference
                     $parent = &$this->nodeStack[sizeof($this->nodeStack)-1];
@@ -394,6 +643,26 @@ class IbisResultParser
         }
     }
 
+    /*
+     * Create an XML parser calling this object's callback functions, and
+     * reset the state of any previous parse.
+     */
+    private function createParser()
+    {
+        $parser = xml_parser_create();
+        xml_set_object($parser, $this);
+        xml_set_element_handler($parser, "startElement", "endElement");
+        xml_set_character_data_handler($parser, "charData");
+        xml_parser_set_option ($parser, XML_OPTION_CASE_FOLDING, false);
+
+        $this->result = null;
+        $this->nodeStack = array();
+        $this->streaming = false;
+        $this->parsed = array();
+
+        return $parser;
+    }
+
     /**
      * Parse XML data from the specified string and return an IbisResult.
      *
@@ -405,19 +674,12 @@ class IbisResultParser
      */
     public function parseXml($data)
     {
-        $parser = xml_parser_create();
-        xml_set_object($parser, $this);
-        xml_set_element_handler($parser, "startElement", "endElement");
-        xml_set_character_data_handler($parser, "charData");
-        xml_parser_set_option ($parser, XML_OPTION_CASE_FOLDING, false);
-
-        $this->result = null;
-        $this->nodeStack = array();
+        $parser = $this->createParser();
 
         xml_parse($parser, $data);
         xml_parser_free($parser);
 
-        return $this->result->unflatten();
+        return $this->result->unflatten($this->lazy, $this->internTable);
     }
 
     /**
@@ -432,19 +694,186 @@ class IbisResultParser
      */
     public function parseXmlFile($file)
     {
-        $parser = xml_parser_create();
-        xml_set_object($parser, $this);
-        xml_set_element_handler($parser, "startElement", "endElement");
-        xml_set_character_data_handler($parser, "charData");
-        xml_parser_set_option ($parser, XML_OPTION_CASE_FOLDING, false);
-
-        $this->result = null;
-        $this->nodeStack = array();
+        $parser = $this->createParser();
 
         while ($data = fread($file, 4096))
             xml_parse($parser, $data, feof($file));
         xml_parser_free($parser);
 
-        return $this->result->unflatten();
+        return $this->result->unflatten($this->lazy, $this->internTable);
+    }
+
+    /**
+     * Parse XML data from the specified stream, returning each of the
+     * top-level people, institutions, groups, attributes or attribute
+     * schemes in the result as soon as it has been parsed.
+     *
+     * Unlike {@link parseXmlFile()}, the complete result is never held in
+     * memory, so this is suitable for very large results, such as all the
+     * members of a large institution. Each entity returned is complete,
+     * including anything fetched with it (for example, a person's
+     * institutions).
+     *
+     * This requires the hierarchical XML representation (the "flatten"
+     * parameter set to ``false``). A flattened result can only be unflattened
+     * once it has been read completely, so its entities are all returned at
+     * the end.
+     *
+     * Once all the entities have been returned, the rest of the result
+     * (for example, any error) is available from {@link getResult()}.
+     *
+     * @param resource $file A file pointer to a stream containing XML
+     * returned from the server.
+     *
+     * @return Generator The top-level entities in the result, in order.
+     */
+    public function parseXmlFileIter($file)
+    {
+        $parser = $this->createParser();
+        $this->streaming = true;
+
+        try
+        {
+            while ($data = fread($file, 4096))
+            {
+                xml_parse($parser, $data, feof($file));
+
+                $parsed = $this->parsed;
+                $this->parsed = array();
+                foreach ($parsed as $entity)
+                    yield $entity;
+            }
+        }
+        finally
+        {
+            xml_parser_free($parser);
+        }
+
+        // Anything not already returned (a flattened result)
+        if (isset($this->result))
+        {
+            $this->result->unflatten($this->lazy, $this->internTable);
+            foreach (array("people", "institutions", "groups", "attributes",
+                           "attributeSchemes") as $name)
+            {
+                $entities = $this->result->$name;
+                $this->result->$name = null;
+                if (isset($entities))
+                    foreach ($entities as $entity)
+                        yield $entity;
+            }
+        }
+    }
+
+    /*
+     * Convert a scalar JSON value to the string it would be in XML.
+     */
+    private static function jsonString($value)
+    {
+        if (is_bool($value))
+            return $value ? "true" : "false";
+        return is_null($value) ? null : (string )$value;
+    }
+
+    /*
+     * Build a DTO of the specified class from a decoded JSON object. Its
+     * scalar properties are the XML attributes passed to the constructor,
+     * and are also set as XML elements, so the DTO picks out whichever it
+     * has.
+     */
+    private function hydrate($class, $data)
+    {
+        $attrs = array();
+        foreach ($data as $name => $value)
+            if (!is_array($value))
+                $attrs[$name] = IbisResultParser::jsonString($value);
+
+        $dto = $this->newDto($class, $attrs);
+        foreach ($data as $name => $value)
+        {
+            if (!is_array($value))
+                $value = $attrs[$name];
+            elseif (empty($value) || isset($value[0]))
+            {
+                // A list of objects or strings
+                foreach ($value as $idx => $item)
+                {
+                    if (!is_array($item))
+                        $value[$idx] = IbisResultParser::jsonString($item);
+                    elseif (isset(IbisResultParser::$jsonClasses[$name]))
+                        $value[$idx] = $this->hydrate(
+                            IbisResultParser::$jsonClasses[$name], $item);
+                    else
+                        unset($value[$idx]);
+                }
+            }
+            elseif (isset(IbisResultParser::$jsonClasses[$name]))
+                $value = $this->hydrate(
+                    IbisResultParser::$jsonClasses[$name], $value);
+            else
+                continue;
+
+            $dto->setJsonProperty($name, $value);
+        }
+        return $dto;
+    }
+
+    /**
+     * Parse JSON data from the specified string and return an IbisResult.
+     *
+     * The JSON is decoded into arrays with ``json_decode()``, and then
+     * converted into the same DTO objects as {@link parseXml()} would
+     * produce from the equivalent XML.
+     *
+     * @param string $data The JSON string returned from the server.
+     *
+     * @return IbisResult The parsed results. This may contain lists or trees
+     * of objects representing people, institutions and groups returned from
+     * the server.
+     */
+    public function parseJson($data)
+    {
+        $this->result = null;
+
+        $json = json_decode($data, true);
+        if (!is_array($json))
+            throw new Exception("Invalid JSON result");
+        if (isset($json["result"]) && is_array($json["result"]))
+            $json = $json["result"];
+
+        $this->result = $this->hydrate("IbisResult", $json);
+        return $this->result->unflatten($this->lazy, $this->internTable);
+    }
+
+    /**
+     * Parse JSON data from the specified stream and return an IbisResult.
+     *
+     * Unlike XML, JSON is not parsed incrementally: the whole of the
+     * (decompressed) response is read into memory and then decoded, so its
+     * size is not limited by the transport reading it as a stream.
+     *
+     * @param resource $file A file pointer to a stream containing JSON
+     * returned from the server.
+     *
+     * @return IbisResult The parsed results. This may contain lists or trees
+     * of objects representing people, institutions and groups returned from
+     * the server.
+     */
+    public function parseJsonFile($file)
+    {
+        return $this->parseJson(stream_get_contents($file));
+    }
+
+    /**
+     * Get the IbisResult produced by the last parse. After
+     * {@link parseXmlFileIter()}, this holds anything in the result other
+     * than the top-level entities that were returned, such as any error.
+     *
+     * @return IbisResult The result, or ``null`` if there was no valid
+     * result.
+     */
+    public function getResult()
+    {
+        return $this->result;
     }
 }
@@ -21,6 +21,7 @@ along with this library.  If not, see <http://www.gnu.org/licenses/>.
 */
 
 require_once dirname(__FILE__) . "/../client/IbisException.php";
+require_once dirname(__FILE__) . "/../client/IbisBatch.php";
 
 /**
  * Methods for querying and manipulating groups.
@@ -178,6 +179,48 @@ class GroupMethods
         return $result->groups;
     }
 
+    /**
+     * Batched version of {@link listGroups}, accepting any number of
+     * identifiers.
+     *
+     * The identifiers are split into chunks that fit within the server's
+     * URL length limit, and each chunk is fetched using the same call as
+     * {@link listGroups}, with all the calls sent to the server
+     * concurrently if the connection supports it (see
+     * {@link IbisBatch::invokeAll}). Any other parameters are passed on
+     * unchanged.
+     *
+     * @param string[] $groupids [required] The identifiers (an array or
+     * any other Traversable).
+     *
+     * @return IbisGroup[] The results, in the order of the identifiers
+     * requested. Any identifiers not found are omitted.
+     */
+    public function listGroupsBatched($groupids,
+                                      $fetch=null)
+    {
+        $ids = IbisBatch::uniqueIds($groupids);
+        $requests = array();
+        foreach (IbisBatch::batchIds($ids) as $chunk)
+        {
+            $pathParams = array();
+            $queryParams = array("groupids" => $chunk,
+                                 "fetch"    => $fetch);
+            $requests[] = array("GET",
+                                'api/v1/group/list',
+                                $pathParams,
+                                $queryParams);
+        }
+        $results = array();
+        foreach (IbisBatch::invokeAll($this->conn, $requests) as $result)
+        {
+            if (isset($result->error))
+                throw new IbisException($result->error);
+            $results[] = $result->groups;
+        }
+        return IbisBatch::orderResults($ids, $results);
+    }
+
     /**
      * Find all groups modified between the specified pair of transactions.
      *
@@ -302,6 +345,49 @@ class GroupMethods
         return $result->groups;
     }
 
+    /**
+     * Iterate over all the results of {@link search}, fetching
+     * them from the server one page at a time, so that only one page of
+     * results need be held in memory at once.
+     *
+     * The total number of results is found first, using {@link searchCount}.
+     *
+     * The other parameters are the same as for {@link search}.
+     *
+     * @param int $pageSize [optional] The number of results to fetch in each
+     * call. Defaults to 100.
+     *
+     * @return Generator The results (IbisGroup[]), in the same order as
+     * {@link search}.
+     */
+    public function searchIter($query,
+                               $approxMatches=null,
+                               $includeCancelled=null,
+                               $orderBy=null,
+                               $fetch=null,
+                               $pageSize=100)
+    {
+        $count = $this->searchCount($query,
+                                    $approxMatches,
+                                    $includeCancelled);
+        for ($offset = 0; $offset < $count; $offset += $pageSize)
+        {
+            $results = $this->search($query,
+                                     $approxMatches,
+                                     $includeCancelled,
+                                     $offset,
+                                     $pageSize,
+                                     $orderBy,
+                                     $fetch);
+            if (empty($results))
+                break;
+            foreach ($results as $result)
+                yield $result;
+            if (count($results) < $pageSize)
+                break;
+        }
+    }
+
     /**
      * Count the number of groups that would be returned by a search using
      * a free text query string.
@@ -378,6 +464,46 @@ class GroupMethods
         return $result->group;
     }
 
+    /**
+     * Multi version of {@link getGroup}, fetching the results for
+     * any number of values of ``groupid``.
+     *
+     * Each value is fetched using the same call as {@link getGroup},
+     * with all the calls sent to the server concurrently if the connection
+     * supports it (see {@link IbisBatch::invokeAll}). Any other parameters
+     * are passed on unchanged.
+     *
+     * @param string[] $groupids [required] The values of
+     * ``groupid`` (an array or any other Traversable).
+     *
+     * @return array The results (IbisGroup), keyed by the values
+     * requested, in the same order. If a call fails, its value is the
+     * IbisError instead, and the other results are still returned.
+     */
+    public function getGroupMulti($groupids,
+                                  $fetch=null)
+    {
+        $requests = array();
+        foreach (IbisBatch::uniqueIds($groupids) as $groupid)
+        {
+            $pathParams = array("groupid" => $groupid);
+            $queryParams = array("fetch" => $fetch);
+            $requests[$groupid] = array("GET",
+                                        'api/v1/group/%1$s',
+                                        $pathParams,
+                                        $queryParams);
+        }
+        $results = IbisBatch::invokeAll($this->conn, $requests);
+        foreach ($results as $groupid => $result)
+        {
+            if (isset($result->error))
+                $results[$groupid] = $result->error;
+            else
+                $results[$groupid] = $result->group;
+        }
+        return $results;
+    }
+
     /**
      * Get all the cancelled members of the specified group, including
      * cancelled members of groups included by the group, and groups included
@@ -21,6 +21,7 @@ along with this library.  If not, see <http://www.gnu.org/licenses/>.
 */
 
 require_once dirname(__FILE__) . "/../client/IbisException.php";
+require_once dirname(__FILE__) . "/../client/IbisBatch.php";
 
 /**
  * Methods for querying and manipulating institutions.
@@ -203,6 +204,48 @@ class InstitutionMethods
         return $result->institutions;
     }
 
+    /**
+     * Batched version of {@link listInsts}, accepting any number of
+     * identifiers.
+     *
+     * The identifiers are split into chunks that fit within the server's
+     * URL length limit, and each chunk is fetched using the same call as
+     * {@link listInsts}, with all the calls sent to the server
+     * concurrently if the connection supports it (see
+     * {@link IbisBatch::invokeAll}). Any other parameters are passed on
+     * unchanged.
+     *
+     * @param string[] $instids [required] The identifiers (an array or
+     * any other Traversable).
+     *
+     * @return IbisInstitution[] The results, in the order of the identifiers
+     * requested. Any identifiers not found are omitted.
+     */
+    public function listInstsBatched($instids,
+                                     $fetch=null)
+    {
+        $ids = IbisBatch::uniqueIds($instids);
+        $requests = array();
+        foreach (IbisBatch::batchIds($ids) as $chunk)
+        {
+            $pathParams = array();
+            $queryParams = array("instids" => $chunk,
+                                 "fetch"   => $fetch);
+            $requests[] = array("GET",
+                                'api/v1/inst/list',
+                                $pathParams,
+                                $queryParams);
+        }
+        $results = array();
+        foreach (IbisBatch::invokeAll($this->conn, $requests) as $result)
+        {
+            if (isset($result->error))
+                throw new IbisException($result->error);
+            $results[] = $result->institutions;
+        }
+        return IbisBatch::orderResults($ids, $results);
+    }
+
     /**
      * Find all institutions modified between the specified pair of
      * transactions.
@@ -339,6 +382,52 @@ class InstitutionMethods
         return $result->institutions;
     }
 
+    /**
+     * Iterate over all the results of {@link search}, fetching
+     * them from the server one page at a time, so that only one page of
+     * results need be held in memory at once.
+     *
+     * The total number of results is found first, using {@link searchCount}.
+     *
+     * The other parameters are the same as for {@link search}.
+     *
+     * @param int $pageSize [optional] The number of results to fetch in each
+     * call. Defaults to 100.
+     *
+     * @return Generator The results (IbisInstitution[]), in the same order as
+     * {@link search}.
+     */
+    public function searchIter($query,
+                               $approxMatches=null,
+                               $includeCancelled=null,
+                               $attributes=null,
+                               $orderBy=null,
+                               $fetch=null,
+                               $pageSize=100)
+    {
+        $count = $this->searchCount($query,
+                                    $approxMatches,
+                                    $includeCancelled,
+                                    $attributes);
+        for ($offset = 0; $offset < $count; $offset += $pageSize)
+        {
+            $results = $this->search($query,
+                                     $approxMatches,
+                                     $includeCancelled,
+                                     $attributes,
+                                     $offset,
+                                     $pageSize,
+                                     $orderBy,
+                                     $fetch);
+            if (empty($results))
+                break;
+            foreach ($results as $result)
+                yield $result;
+            if (count($results) < $pageSize)
+                break;
+        }
+    }
+
     /**
      * Count the number of institutions that would be returned by a search
      * using a free text query string.
@@ -419,6 +508,46 @@ class InstitutionMethods
         return $result->institution;
     }
 
+    /**
+     * Multi version of {@link getInst}, fetching the results for
+     * any number of values of ``instid``.
+     *
+     * Each value is fetched using the same call as {@link getInst},
+     * with all the calls sent to the server concurrently if the connection
+     * supports it (see {@link IbisBatch::invokeAll}). Any other parameters
+     * are passed on unchanged.
+     *
+     * @param string[] $instids [required] The values of
+     * ``instid`` (an array or any other Traversable).
+     *
+     * @return array The results (IbisInstitution), keyed by the values
+     * requested, in the same order. If a call fails, its value is the
+     * IbisError instead, and the other results are still returned.
+     */
+    public function getInstMulti($instids,
+                                 $fetch=null)
+    {
+        $requests = array();
+        foreach (IbisBatch::uniqueIds($instids) as $instid)
+        {
+            $pathParams = array("instid" => $instid);
+            $queryParams = array("fetch" => $fetch);
+            $requests[$instid] = array("GET",
+                                       'api/v1/inst/%1$s',
+                                       $pathParams,
+                                       $queryParams);
+        }
+        $results = IbisBatch::invokeAll($this->conn, $requests);
+        foreach ($results as $instid => $result)
+        {
+            if (isset($result->error))
+                $results[$instid] = $result->error;
+            else
+                $results[$instid] = $result->institution;
+        }
+        return $results;
+    }
+
     /**
      * Add an attribute to an institution. By default, this will not add the
      * attribute again if it already exists.
@@ -673,6 +802,47 @@ class InstitutionMethods
         return $result->attribute;
     }
 
+    /**
+     * Multi version of {@link getAttribute}, fetching the results for
+     * any number of values of ``attrid``.
+     *
+     * Each value is fetched using the same call as {@link getAttribute},
+     * with all the calls sent to the server concurrently if the connection
+     * supports it (see {@link IbisBatch::invokeAll}). Any other parameters
+     * are passed on unchanged.
+     *
+     * @param string[] $attrids [required] The values of
+     * ``attrid`` (an array or any other Traversable).
+     *
+     * @return array The results (IbisAttribute), keyed by the values
+     * requested, in the same order. If a call fails, its value is the
+     * IbisError instead, and the other results are still returned.
+     */
+    public function getAttributeMulti($instid,
+                                      $attrids)
+    {
+        $requests = array();
+        foreach (IbisBatch::uniqueIds($attrids) as $attrid)
+        {
+            $pathParams = array("instid" => $instid,
+                                "attrid" => $attrid);
+            $queryParams = array();
+            $requests[$attrid] = array("GET",
+                                       'api/v1/inst/%1$s/%2$s',
+                                       $pathParams,
+                                       $queryParams);
+        }
+        $results = IbisBatch::invokeAll($this->conn, $requests);
+        foreach ($results as $attrid => $result)
+        {
+            if (isset($result->error))
+                $results[$attrid] = $result->error;
+            else
+                $results[$attrid] = $result->attribute;
+        }
+        return $results;
+    }
+
     /**
      * Update an attribute of an institution.
      *
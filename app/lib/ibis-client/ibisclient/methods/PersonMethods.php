@@ -21,6 +21,7 @@ along with this library.  If not, see <http://www.gnu.org/licenses/>.
 */
 
 require_once dirname(__FILE__) . "/../client/IbisException.php";
+require_once dirname(__FILE__) . "/../client/IbisBatch.php";
 
 /**
  * Methods for querying and manipulating people.
@@ -203,6 +204,40 @@ class PersonMethods
         return $result->people;
     }
 
+    /**
+     * Iterate over all the results of {@link allPeople}, fetching
+     * them from the server one page at a time, so that only one page of
+     * results need be held in memory at once.
+     *
+     * The other parameters are the same as for {@link allPeople}.
+     *
+     * @param int $pageSize [optional] The number of results to fetch in each
+     * call. Defaults to 100.
+     *
+     * @return Generator The results (IbisPerson[]), in the same order as
+     * {@link allPeople}.
+     */
+    public function allPeopleIter($includeCancelled,
+                                  $identifier=null,
+                                  $fetch=null,
+                                  $pageSize=100)
+    {
+        while (true)
+        {
+            $results = $this->allPeople($includeCancelled,
+                                        $identifier,
+                                        $pageSize,
+                                        $fetch);
+            if (empty($results))
+                break;
+            foreach ($results as $result)
+                yield $result;
+            if (count($results) < $pageSize)
+                break;
+            $identifier = IbisBatch::resultCursor($results[count($results)-1]);
+        }
+    }
+
     /**
      * Get the people with the specified identifiers (typically CRSids).
      *
@@ -251,6 +286,48 @@ class PersonMethods
         return $result->people;
     }
 
+    /**
+     * Batched version of {@link listPeople}, accepting any number of
+     * identifiers.
+     *
+     * The identifiers are split into chunks that fit within the server's
+     * URL length limit, and each chunk is fetched using the same call as
+     * {@link listPeople}, with all the calls sent to the server
+     * concurrently if the connection supports it (see
+     * {@link IbisBatch::invokeAll}). Any other parameters are passed on
+     * unchanged.
+     *
+     * @param string[] $crsids [required] The identifiers (an array or
+     * any other Traversable).
+     *
+     * @return IbisPerson[] The results, in the order of the identifiers
+     * requested. Any identifiers not found are omitted.
+     */
+    public function listPeopleBatched($crsids,
+                                      $fetch=null)
+    {
+        $ids = IbisBatch::uniqueIds($crsids);
+        $requests = array();
+        foreach (IbisBatch::batchIds($ids) as $chunk)
+        {
+            $pathParams = array();
+            $queryParams = array("crsids" => $chunk,
+                                 "fetch"  => $fetch);
+            $requests[] = array("GET",
+                                'api/v1/person/list',
+                                $pathParams,
+                                $queryParams);
+        }
+        $results = array();
+        foreach (IbisBatch::invokeAll($this->conn, $requests) as $result)
+        {
+            if (isset($result->error))
+                throw new IbisException($result->error);
+            $results[] = $result->people;
+        }
+        return IbisBatch::orderResults($ids, $results);
+    }
+
     /**
      * Find all people modified between the specified pair of transactions.
      *
@@ -405,6 +482,55 @@ class PersonMethods
         return $result->people;
     }
 
+    /**
+     * Iterate over all the results of {@link search}, fetching
+     * them from the server one page at a time, so that only one page of
+     * results need be held in memory at once.
+     *
+     * The total number of results is found first, using {@link searchCount}.
+     *
+     * The other parameters are the same as for {@link search}.
+     *
+     * @param int $pageSize [optional] The number of results to fetch in each
+     * call. Defaults to 100.
+     *
+     * @return Generator The results (IbisPerson[]), in the same order as
+     * {@link search}.
+     */
+    public function searchIter($query,
+                               $approxMatches=null,
+                               $includeCancelled=null,
+                               $misStatus=null,
+                               $attributes=null,
+                               $orderBy=null,
+                               $fetch=null,
+                               $pageSize=100)
+    {
+        $count = $this->searchCount($query,
+                                    $approxMatches,
+                                    $includeCancelled,
+                                    $misStatus,
+                                    $attributes);
+        for ($offset = 0; $offset < $count; $offset += $pageSize)
+        {
+            $results = $this->search($query,
+                                     $approxMatches,
+                                     $includeCancelled,
+                                     $misStatus,
+                                     $attributes,
+                                     $offset,
+                                     $pageSize,
+                                     $orderBy,
+                                     $fetch);
+            if (empty($results))
+                break;
+            foreach ($results as $result)
+                yield $result;
+            if (count($results) < $pageSize)
+                break;
+        }
+    }
+
     /**
      * Count the number of people that would be returned by a search using
      * a free text query string.
@@ -509,6 +635,48 @@ class PersonMethods
         return $result->person;
     }
 
+    /**
+     * Multi version of {@link getPerson}, fetching the results for
+     * any number of values of ``identifier``.
+     *
+     * Each value is fetched using the same call as {@link getPerson},
+     * with all the calls sent to the server concurrently if the connection
+     * supports it (see {@link IbisBatch::invokeAll}). Any other parameters
+     * are passed on unchanged.
+     *
+     * @param string[] $identifiers [required] The values of
+     * ``identifier`` (an array or any other Traversable).
+     *
+     * @return array The results (IbisPerson), keyed by the values
+     * requested, in the same order. If a call fails, its value is the
+     * IbisError instead, and the other results are still returned.
+     */
+    public function getPersonMulti($scheme,
+                                   $identifiers,
+                                   $fetch=null)
+    {
+        $requests = array();
+        foreach (IbisBatch::uniqueIds($identifiers) as $identifier)
+        {
+            $pathParams = array("scheme"     => $scheme,
+                                "identifier" => $identifier);
+            $queryParams = array("fetch" => $fetch);
+            $requests[$identifier] = array("GET",
+                                           'api/v1/person/%1$s/%2$s',
+                                           $pathParams,
+                                           $queryParams);
+        }
+        $results = IbisBatch::invokeAll($this->conn, $requests);
+        foreach ($results as $identifier => $result)
+        {
+            if (isset($result->error))
+                $results[$identifier] = $result->error;
+            else
+                $results[$identifier] = $result->person;
+        }
+        return $results;
+    }
+
     /**
      * Add an attribute to a person. By default, this will not add the
      * attribute again if it already exists.
@@ -934,6 +1102,49 @@ class PersonMethods
         return $result->attribute;
     }
 
+    /**
+     * Multi version of {@link getAttribute}, fetching the results for
+     * any number of values of ``attrid``.
+     *
+     * Each value is fetched using the same call as {@link getAttribute},
+     * with all the calls sent to the server concurrently if the connection
+     * supports it (see {@link IbisBatch::invokeAll}). Any other parameters
+     * are passed on unchanged.
+     *
+     * @param string[] $attrids [required] The values of
+     * ``attrid`` (an array or any other Traversable).
+     *
+     * @return array The results (IbisAttribute), keyed by the values
+     * requested, in the same order. If a call fails, its value is the
+     * IbisError instead, and the other results are still returned.
+     */
+    public function getAttributeMulti($scheme,
+                                      $identifier,
+                                      $attrids)
+    {
+        $requests = array();
+        foreach (IbisBatch::uniqueIds($attrids) as $attrid)
+        {
+            $pathParams = array("scheme"     => $scheme,
+                                "identifier" => $identifier,
+                                "attrid"     => $attrid);
+            $queryParams = array();
+            $requests[$attrid] = array("GET",
+                                       'api/v1/person/%1$s/%2$s/%3$s',
+                                       $pathParams,
+                                       $queryParams);
+        }
+        $results = IbisBatch::invokeAll($this->conn, $requests);
+        foreach ($results as $attrid => $result)
+        {
+            if (isset($result->error))
+                $results[$attrid] = $result->error;
+            else
+                $results[$attrid] = $result->attribute;
+        }
+        return $results;
+    }
+
     /**
      * Update an attribute of a person.
      *
@@ -0,0 +1,175 @@
+<?php
+/*
+Copyright (c) 2012, University of Cambridge Computing Service
+
+This file is part of the Lookup/Ibis client library.
+
+This library is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This library is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this library.  If not, see <http://www.gnu.org/licenses/>.
+*/
+
+require_once dirname(__FILE__) . "/../ibisclient/client/IbisClientConnection.php";
+
+/*
+ * A transport that keeps a copy of the headers and body of the last
+ * response.
+ */
+class RecordingTransport implements IbisTransport
+{
+    public $headers = null;
+    public $body = null;
+
+    public function request($method, $url, $headers, $content,
+                            $allowSelfSigned)
+    {
+        $transport = new IbisStreamTransport(false);
+        list($responseHeaders, $file) =
+            $transport->request($method, $url, $headers, $content,
+                                $allowSelfSigned);
+        $this->headers = $responseHeaders;
+        $this->body = stream_get_contents($file);
+        fclose($file);
+
+        $file = fopen("php://temp", "w+");
+        fwrite($file, $this->body);
+        rewind($file);
+        return array($responseHeaders, $file);
+    }
+}
+
+/**
+ * The XML/JSON fixtures used by UnitTests::testJsonFixtures: one request
+ * for each shape of result (and so each DTO class), whose XML and JSON
+ * responses from the server are recorded in test/fixtures.
+ *
+ * They must be recorded from the test server, which needs network access
+ * to it and PHP's openssl extension, by running:
+ *
+ * <pre>
+ * php test/JsonFixtures.php
+ * </pre>
+ *
+ * Nothing is written unless every response is recorded, in the format
+ * that was asked for, so a failed run can't leave a partial or mismatched
+ * set of fixtures.
+ */
+class JsonFixtures
+{
+    /**
+     * The requests, by fixture name, each an array of the arguments to
+     * {@link IbisClientConnection::invokeMethod}.
+     */
+    public static $requests = array(
+        "value"       => array("GET", "api/v1/version", array(), array()),
+        "person"      => array("GET", 'api/v1/person/%1$s/%2$s',
+                               array("crsid", "dar17"),
+                               array("fetch" => "all_identifiers,all_insts,all_groups,email,title")),
+        "person-tree" => array("GET", 'api/v1/person/%1$s/%2$s',
+                               array("crsid", "dar17"),
+                               array("fetch" => "all_insts,all_groups", "flatten" => false)),
+        "no-person"   => array("GET", 'api/v1/person/%1$s/%2$s',
+                               array("crsid", "dar1734toolong"), array()),
+        "inst"        => array("GET", 'api/v1/inst/%1$s',
+                               array("CS"),
+                               array("fetch" => "contact_rows.jdInstid,parent_insts,child_insts")),
+        "group"       => array("GET", 'api/v1/group/%1$s',
+                               array("cs-editors"),
+                               array("fetch" => "all_members,owning_insts,manages_insts")),
+        "members"     => array("GET", 'api/v1/inst/%1$s/members',
+                               array("CS"), array("fetch" => "all_insts")),
+        "schemes"     => array("GET", "api/v1/person/all-attr-schemes",
+                               array(), array()),
+        "bad-request" => array("GET", "api/v1/person/search",
+                               array(), array("query" => "dar17", "limit" => "x")));
+
+    /**
+     * Get the XML and JSON results of each request, as parsed from the
+     * server's responses.
+     *
+     * @param IbisClientConnection $conn The connection to use.
+     * @return array The XML and JSON results, by fixture name.
+     */
+    public static function fetch($conn)
+    {
+        $results = array();
+        foreach (JsonFixtures::$requests as $name => $request)
+        {
+            foreach (array(IbisClientConnection::FORMAT_XML,
+                           IbisClientConnection::FORMAT_JSON) as $format)
+            {
+                $conn->setFormat($format);
+                $results[$name][$format] =
+                    $conn->invokeMethod($request[0], $request[1],
+                                        $request[2], $request[3]);
+            }
+        }
+        return $results;
+    }
+
+    /**
+     * Record the XML and JSON responses to each request from the test
+     * server in test/fixtures.
+     *
+     * @throws Exception If any response couldn't be recorded, in which
+     * case no fixtures are written.
+     */
+    public static function record()
+    {
+        $transport = new RecordingTransport();
+        $conn = IbisClientConnection::createTestConnection();
+        $conn->setTransport($transport);
+
+        $bodies = array();
+        foreach (JsonFixtures::$requests as $name => $request)
+        {
+            foreach (array(IbisClientConnection::FORMAT_XML,
+                           IbisClientConnection::FORMAT_JSON) as $format)
+            {
+                $conn->setFormat($format);
+                $conn->invokeMethod($request[0], $request[1],
+                                    $request[2], $request[3]);
+                if (!JsonFixtures::hasFormat($transport->headers, $format))
+                    throw new Exception("No " . $format . " response to " .
+                                        $name . ": not recording fixtures");
+                $bodies[$name . "." . $format] = $transport->body;
+            }
+        }
+
+        $dir = dirname(__FILE__) . "/fixtures/";
+        if (!is_dir($dir))
+            mkdir($dir);
+        foreach ($bodies as $file => $body)
+        {
+            file_put_contents($dir . $file, $body);
+            print($file . ": " . strlen($body) . " bytes\n");
+        }
+    }
+
+    /*
+     * Test whether a response's headers say that its body is in the
+     * specified format.
+     */
+    private static function hasFormat($headers, $format)
+    {
+        foreach ($headers as $header)
+        {
+            if (stripos($header, "content-type: application/" . $format)
+                !== false)
+                return true;
+        }
+        return false;
+    }
+}
+
+if (PHP_SAPI === "cli" && isset($argv[0]) && realpath($argv[0]) === __FILE__)
+    JsonFixtures::record();
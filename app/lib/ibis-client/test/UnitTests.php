@@ -24,9 +24,25 @@ require_once dirname(__FILE__) . "/../ibisclient/methods/GroupMethods.php";
 require_once dirname(__FILE__) . "/../ibisclient/methods/IbisMethods.php";
 require_once dirname(__FILE__) . "/../ibisclient/methods/InstitutionMethods.php";
 require_once dirname(__FILE__) . "/../ibisclient/methods/PersonMethods.php";
+require_once dirname(__FILE__) . "/JsonFixtures.php";
 
 use PHPUnit\Framework\TestCase;
 
+/*
+ * A transport that fails to connect for any URL containing "unreachable".
+ */
+class FailingTransport extends IbisStreamTransport
+{
+    public function request($method, $url, $headers, $content,
+                            $allowSelfSigned)
+    {
+        if (strpos($url, "unreachable") !== false)
+            throw new Exception("Unable to connect to " . $url);
+        return parent::request($method, $url, $headers, $content,
+                               $allowSelfSigned);
+    }
+}
+
 class UnitTests extends TestCase
 {
     private static $localConnection = false;
@@ -72,6 +88,144 @@ class UnitTests extends TestCase
         $this->assertTrue($lastTransactionId > 900000);
     }
 
+    public function testTransports()
+    {
+        $conn = UnitTests::$localConnection ?
+                IbisClientConnection::createLocalConnection() :
+                IbisClientConnection::createTestConnection();
+        $pm = new PersonMethods($conn);
+
+        foreach (array(new IbisStreamTransport(), new IbisCurlTransport()) as $transport)
+        {
+            $conn->setTransport($transport);
+            for ($i = 0; $i < 2; $i++)
+            {
+                $person = $pm->getPerson("crsid", "dar17");
+                $this->assertEquals("Rasheed", $person->surname);
+                $this->assertNull($pm->getPerson("crsid", "dar1734toolong"));
+            }
+        }
+    }
+
+    public function testCompression()
+    {
+        $conn = UnitTests::$localConnection ?
+                IbisClientConnection::createLocalConnection() :
+                IbisClientConnection::createTestConnection();
+        $im = new InstitutionMethods($conn);
+
+        $expected = UnitTests::$im->getMembers("UIS", "all_insts");
+        foreach (array(new IbisStreamTransport(false), new IbisStreamTransport(true),
+                       new IbisCurlTransport(false), new IbisCurlTransport(true)) as $transport)
+        {
+            $conn->setTransport($transport);
+            $this->assertEquals($expected, $im->getMembers("UIS", "all_insts"));
+
+            $members = array();
+            foreach ($conn->invokeMethodIter("GET", 'api/v1/inst/%1$s/members',
+                                             array("UIS"), array()) as $person)
+                $members[] = $person->identifier->value;
+            $this->assertEquals(sizeof($expected), sizeof($members));
+        }
+    }
+
+    public function testCurlStreaming()
+    {
+        $conn = UnitTests::$localConnection ?
+                IbisClientConnection::createLocalConnection() :
+                IbisClientConnection::createTestConnection();
+        $conn->setTransport(new IbisCurlTransport());
+        $pm = new PersonMethods($conn);
+
+        // Stop reading the members part way through, and check that the
+        // next request on the same handle isn't affected
+        $members = $conn->invokeMethodIter("GET", 'api/v1/inst/%1$s/members',
+                                           array("UIS"), array());
+        $this->assertNotNull($members->current()->identifier->value);
+        $person = $pm->getPerson("crsid", "dar17");
+        $this->assertEquals("Rasheed", $person->surname);
+    }
+
+    public function testInvokeMethods()
+    {
+        $conn = UnitTests::$localConnection ?
+                IbisClientConnection::createLocalConnection() :
+                IbisClientConnection::createTestConnection();
+
+        $requests = array("version" => array("GET", "api/v1/version", array(), array()),
+                          "dar17"   => array("GET", 'api/v1/person/%1$s/%2$s',
+                                             array("crsid", "dar17"), array()),
+                          "CS"      => array("GET", 'api/v1/inst/%1$s',
+                                             array("CS"), array()),
+                          "none"    => array("GET", 'api/v1/person/%1$s/%2$s',
+                                             array("crs", "dar17"), array()));
+
+        foreach (array(new IbisStreamTransport(), new IbisCurlTransport()) as $transport)
+        {
+            $conn->setTransport($transport);
+            $results = $conn->invokeMethods($requests, 2);
+            $this->assertEquals(array_keys($requests), array_keys($results));
+            $this->assertEquals(1, preg_match("/^[0-9]+[.][0-9]+\$/", $results["version"]->value));
+            $this->assertEquals("Rasheed", $results["dar17"]->person->surname);
+            $this->assertEquals("UCS", $results["CS"]->institution->acronym);
+            $this->assertNull($results["none"]->person);
+        }
+    }
+
+    public function testInvokeMethodsFailure()
+    {
+        $conn = UnitTests::$localConnection ?
+                IbisClientConnection::createLocalConnection() :
+                IbisClientConnection::createTestConnection();
+        $conn->setTransport(new FailingTransport());
+        $pm = new PersonMethods($conn);
+
+        // A request that fails doesn't lose the others' results
+        $people = $pm->getPersonMulti("crsid", array("dar17", "unreachable", "rjd4"));
+        $this->assertEquals(array("dar17", "unreachable", "rjd4"), array_keys($people));
+        $this->assertEquals("Rasheed", $people["dar17"]->surname);
+        $this->assertInstanceOf("IbisError", $people["unreachable"]);
+        $this->assertStringStartsWith("Unable to connect to ", $people["unreachable"]->message);
+        $this->assertStringContainsString("/unreachable", $people["unreachable"]->message);
+        $this->assertEquals("Dowling", $people["rjd4"]->surname);
+    }
+
+    public function testJsonFixtures()
+    {
+        // Each recorded response's XML and JSON must parse to the same
+        // result (see JsonFixtures)
+        $fixtures = glob(dirname(__FILE__) . "/fixtures/*.json");
+        if (empty($fixtures))
+            $this->markTestSkipped("Fixtures not recorded yet: run php test/JsonFixtures.php " .
+                                   "with access to the test server");
+
+        foreach ($fixtures as $jsonFile)
+        {
+            $xmlFile = substr($jsonFile, 0, -5) . ".xml";
+            $parser = new IbisResultParser();
+            $this->assertEquals($parser->parseXml(file_get_contents($xmlFile)),
+                                $parser->parseJson(file_get_contents($jsonFile)),
+                                basename($jsonFile));
+        }
+    }
+
+    public function testJsonFormat()
+    {
+        $conn = UnitTests::$localConnection ?
+                IbisClientConnection::createLocalConnection() :
+                IbisClientConnection::createTestConnection();
+
+        // One result of each shape, fetched as XML and as JSON
+        foreach (JsonFixtures::fetch($conn) as $name => $results)
+            $this->assertEquals($results[IbisClientConnection::FORMAT_XML],
+                                $results[IbisClientConnection::FORMAT_JSON], $name);
+
+        $conn->setFormat(IbisClientConnection::FORMAT_JSON);
+        $pm = new PersonMethods($conn);
+        $this->assertEquals("Rasheed", $pm->getPerson("crsid", "dar17")->surname);
+        $this->assertNull($pm->getPerson("crsid", "dar1734toolong"));
+    }
+
     // --------------------------------------------------------------------
     // Person tests.
     // --------------------------------------------------------------------
@@ -102,6 +256,20 @@ class UnitTests extends TestCase
         $this->assertEquals($id9, $people[0]->identifier->value);
     }
 
+    public function testAllPeopleIter()
+    {
+        $people = UnitTests::$pm->allPeople(false, "dar17", 25, null);
+        $ids = array();
+        foreach (UnitTests::$pm->allPeopleIter(false, "dar17", null, 10) as $person)
+        {
+            $ids[] = $person->identifier->value;
+            if (sizeof($ids) == 25) break;
+        }
+        $this->assertEquals(25, sizeof($ids));
+        for ($i = 0; $i < 25; $i++)
+            $this->assertEquals($people[$i]->identifier->value, $ids[$i]);
+    }
+
     public function testNoSuchPerson()
     {
         $person = UnitTests::$pm->getPerson("crsid", "dar1734toolong");
@@ -156,6 +324,45 @@ class UnitTests extends TestCase
         $this->assertEquals("uistest-members", $person->groups[0]->name);
     }
 
+    public function testLazyUnflatten()
+    {
+        $conn = UnitTests::$localConnection ?
+                IbisClientConnection::createLocalConnection() :
+                IbisClientConnection::createTestConnection();
+        $internTable = new IbisInternTable();
+        $conn->setLazyUnflatten(true, $internTable);
+        $pm = new PersonMethods($conn);
+
+        $person = $pm->getPerson("crsid", "mug99", "all_insts,all_groups");
+        $this->assertTrue(isset($person->institutions));
+        $this->assertEquals("UISTEST", $person->institutions[0]->instid);
+        $this->assertEquals("uistest-members", $person->groups[0]->name);
+        $this->assertFalse(isset($person->directGroups));
+
+        // Later results share the same entities
+        $people = $pm->listPeople("mug99", "all_insts,all_groups");
+        $this->assertSame($person, $people[0]);
+        $this->assertEquals(1 + sizeof($person->institutions) + sizeof($person->groups),
+                            $internTable->size());
+
+        $eager = UnitTests::$pm->getPerson("crsid", "mug99", "all_insts,all_groups");
+        $this->assertEquals($eager->institutions[0]->name, $person->institutions[0]->name);
+        $this->assertEquals(sizeof($eager->groups), sizeof($person->groups));
+
+        // ... but only if they were fetched with the same fetch parameter
+        $this->assertSame($person, $pm->getPerson("crsid", "mug99", "all_groups,all_insts"));
+        $plain = $pm->getPerson("crsid", "mug99");
+        $this->assertFalse($plain === $person);
+        $this->assertFalse(isset($plain->institutions));
+        $this->assertSame($plain, $pm->getPerson("crsid", "mug99"));
+
+        // Only the lazily unflattened DTOs have magic properties
+        $this->assertInstanceOf("IbisPerson", $person);
+        $this->assertTrue(method_exists($person, "__get"));
+        $this->assertFalse(method_exists($eager, "__get"));
+        $this->assertFalse(method_exists($eager->institutions[0], "__isset"));
+    }
+
     public function testGetPersonInstManagers()
     {
         $person = UnitTests::$pm->getPerson("crsid", "mug99", "all_insts.managed_by_groups.all_members");
@@ -180,6 +387,33 @@ class UnitTests extends TestCase
         $this->assertEquals("Dowling", $people[5]->surname);
     }
 
+    public function testListPeopleBatched()
+    {
+        $crsids = array("ijl20", "rjd4", "pms52", "dar17", "prb34", "dcs38", "DAR17");
+        $people = UnitTests::$pm->listPeopleBatched(new ArrayIterator($crsids), "email");
+        $this->assertEquals(6, sizeof($people));
+        $this->assertEquals("ijl20", $people[0]->identifier->value);
+        $this->assertEquals("Dowling", $people[1]->surname);
+        $this->assertEquals("P.M. Shore", $people[2]->registeredName);
+        $this->assertEquals("dar17", $people[3]->identifier->value);
+        $this->assertEquals("prb34", $people[4]->identifier->value);
+        $this->assertEquals("dcs38@cam.ac.uk", $people[5]->attributes[0]->value);
+
+        $chunks = IbisBatch::batchIds($crsids, 24);
+        $this->assertEquals(array("ijl20,rjd4,pms52", "dar17,prb34,dcs38", "DAR17"), $chunks);
+    }
+
+    public function testGetPersonMulti()
+    {
+        $crsids = array("ijl20", "dar17", "dar1734toolong", "rjd4", "DAR17");
+        $people = UnitTests::$pm->getPersonMulti("crsid", new ArrayIterator($crsids), "email");
+        $this->assertEquals(array("ijl20", "dar17", "dar1734toolong", "rjd4"), array_keys($people));
+        $this->assertEquals("ijl20", $people["ijl20"]->identifier->value);
+        $this->assertEquals("Rasheed", $people["dar17"]->surname);
+        $this->assertNull($people["dar1734toolong"]);
+        $this->assertEquals("Dowling", $people["rjd4"]->surname);
+    }
+
     public function testPersonSearch()
     {
         $people = UnitTests::$pm->search("ian lewis");
@@ -198,6 +432,18 @@ class UnitTests extends TestCase
         $this->assertEquals("dar54", $people[0]->identifier->value);
     }
 
+    public function testPersonSearchIter()
+    {
+        $count = UnitTests::$pm->searchCount("smith");
+        $people = UnitTests::$pm->search("smith", false, false, null, null, 0, 20);
+        $ids = array();
+        foreach (UnitTests::$pm->searchIter("smith", false, false, null, null, null, null, 7) as $person)
+            $ids[] = $person->identifier->value;
+        $this->assertEquals($count, sizeof($ids));
+        for ($i = 0; $i < min(20, $count); $i++)
+            $this->assertEquals($people[$i]->identifier->value, $ids[$i]);
+    }
+
     public function testPersonSearchCount()
     {
         $count = UnitTests::$pm->searchCount("j smith");
@@ -645,6 +891,24 @@ class UnitTests extends TestCase
         }
     }
 
+    public function testGetInstMembersIter()
+    {
+        $people = UnitTests::$im->getMembers("UIS", "all_insts");
+        $members = UnitTests::$conn->invokeMethodIter("GET", 'api/v1/inst/%1$s/members',
+                                                      array("instid" => "UIS"),
+                                                      array("fetch" => "all_insts"));
+        $i = 0;
+        foreach ($members as $person)
+        {
+            $this->assertInstanceOf("IbisPerson", $person);
+            $this->assertEquals($people[$i]->identifier->value, $person->identifier->value);
+            $this->assertEquals(sizeof($people[$i]->institutions), sizeof($person->institutions));
+            $this->assertEquals($people[$i]->institutions[0]->instid, $person->institutions[0]->instid);
+            $i++;
+        }
+        $this->assertEquals(sizeof($people), $i);
+    }
+
     public function testGetInstCancelledMembers()
     {
         $people = UnitTests::$im->getCancelledMembers("CS", null);
@@ -36,6 +36,7 @@ class Ucam_Webauth {
   var $DEFAULT_AUTH_SERVICE = 'https://raven.cam.ac.uk/auth/authenticate.html';
   var $DEFAULT_KEY_DIR = '/etc/httpd/conf/webauth_keys';
   var $DEFAULT_COOKIE_NAME = 'Ucam-WebAuth-Session';
+  var $DEFAULT_COOKIE_DIGEST = 'sha256';
   var $DEFAULT_TIMEOUT_MESSAGE = 'your logon to the site has expired';
   var $DEFAULT_HOSTNAME = NULL;		// must be supplied explicitly
   var $COMPLETE = 1;
@@ -72,6 +73,7 @@ class Ucam_Webauth {
   
   var $do_session;
   var $cookie_key;
+  var $cookie_digest;
   var $cookie_path;
   var $session_ticket;
   var $auth_service;
@@ -89,6 +91,19 @@ class Ucam_Webauth {
   //var $headers;
   var $forced_reauth_message;
   var $interact;
+  var $key_cache;
+  var $key_cache_apcu;
+  var $session_cache_apcu;
+  var $session_cache_life;
+
+  // Public keys parsed by check_sig, by key file name, with the
+  // modification time of the file they were read from. Shared by every
+  // instance in this process.
+  static $keys = array();
+
+  // Session cookies that have already been verified, by session_cache_id,
+  // with the parsed ticket and its issue and expiry times.
+  static $sessions = array();
 
   var $error_message = array('200' => 'OK',
 			     '410' => 'Authentication cancelled at user\'s request',
@@ -126,6 +141,9 @@ class Ucam_Webauth {
 
     if (isset($args['cookie_key'])) $this->cookie_key = $args['cookie_key'];
 
+    if (isset($args['cookie_digest'])) $this->cookie_digest = $args['cookie_digest'];
+    else $this->cookie_digest = $this->DEFAULT_COOKIE_DIGEST;
+
     if (isset($args['cookie_name'])) $this->cookie_name = $args['cookie_name'];
     else $this->cookie_name = $this->DEFAULT_COOKIE_NAME;
 
@@ -146,6 +164,18 @@ class Ucam_Webauth {
     if (isset($args['forced_reauth_message'])) $this->forced_reauth_message = $args['forced_reauth_message'];
 
     if (isset($args['interact'])) $this->interact = $args['interact'];
+
+    if (isset($args['key_cache'])) $this->key_cache = $args['key_cache'];
+    else $this->key_cache = TRUE;
+
+    if (isset($args['key_cache_apcu'])) $this->key_cache_apcu = $args['key_cache_apcu'];
+    else $this->key_cache_apcu = function_exists('apcu_fetch');
+
+    if (isset($args['session_cache_apcu'])) $this->session_cache_apcu = $args['session_cache_apcu'];
+    else $this->session_cache_apcu = FALSE;
+
+    if (isset($args['session_cache_life'])) $this->session_cache_life = $args['session_cache_life'];
+    else $this->session_cache_life = 60;
   }
 
   // get/set functions for agent attributes
@@ -195,6 +225,11 @@ class Ucam_Webauth {
     return $this->cookie_key;
   }
 
+  function cookie_digest($arg = NULL) {
+    if (isset($arg)) $this->cookie_digest = $arg;
+    return $this->cookie_digest;
+  }
+
   function cookie_name($arg = NULL) {
     if (isset($arg)) $this->cookie_name = $arg;
     return $this->cookie_name;
@@ -220,6 +255,26 @@ class Ucam_Webauth {
     return $this->hostname;
   }
 
+  function key_cache($arg = NULL) {
+    if (isset($arg)) $this->key_cache = $arg;
+    return $this->key_cache;
+  }
+
+  function key_cache_apcu($arg = NULL) {
+    if (isset($arg)) $this->key_cache_apcu = $arg;
+    return $this->key_cache_apcu;
+  }
+
+  function session_cache_apcu($arg = NULL) {
+    if (isset($arg)) $this->session_cache_apcu = $arg;
+    return $this->session_cache_apcu;
+  }
+
+  function session_cache_life($arg = NULL) {
+    if (isset($arg)) $this->session_cache_life = $arg;
+    return $this->session_cache_life;
+  }
+
   function forced_reauth_message($arg = NULL) {
     if (isset($arg)) $this->forced_reauth_message = $arg;
     return $this->forced_reauth_message;
@@ -308,34 +363,100 @@ class Ucam_Webauth {
       return false;
     }
     $key_filename = $this->key_dir . '/' . $key_id . '.crt';
-    $key_file = fopen($key_filename, 'r');
-    // Band-aid test for the most obvious cause of error - whole
-    // thing needs improvement
-    if (!$key_file) {
+    $key = $this->get_key($key_filename);
+    if (!$key) return false;
+    $result = openssl_verify(rawurldecode($data), $this->wls_decode(rawurldecode($sig)), $key);
+    return $result;
+  }
+
+  // Returns the public key in a key file, parsing it only if it isn't
+  // already cached for the file's current modification time. The PEM text
+  // is also kept in APCu (if enabled), keyed on the file name and
+  // modification time, so other processes can skip reading the file.
+
+  function get_key($key_filename) {
+    if (!$this->key_cache) return $this->read_key($key_filename, FALSE);
+
+    // The stat cache would hide a replaced key file from a long-running
+    // process
+    clearstatcache(TRUE, $key_filename);
+    $mtime = @filemtime($key_filename);
+    if ($mtime === FALSE) {
       error_log('Failed to open key file ' . $key_filename,0);
       return false;
     }
-    $key_str = fread($key_file, filesize($key_filename));
+    if (isset(self::$keys[$key_filename]) &&
+        self::$keys[$key_filename]['mtime'] == $mtime)
+      return self::$keys[$key_filename]['key'];
+
+    $key = $this->read_key($key_filename, $mtime);
+    if ($key) self::$keys[$key_filename] = array('mtime' => $mtime, 'key' => $key);
+    return $key;
+  }
+
+  function read_key($key_filename, $mtime) {
+    $key_str = FALSE;
+    if ($mtime !== FALSE && $this->key_cache_apcu) {
+      $apcu_key = 'Ucam_Webauth_key:' . $key_filename . ':' . $mtime;
+      $key_str = apcu_fetch($apcu_key);
+    }
+    if ($key_str === FALSE) {
+      $key_str = @file_get_contents($key_filename);
+      // Band-aid test for the most obvious cause of error - whole
+      // thing needs improvement
+      if ($key_str === FALSE) {
+        error_log('Failed to open key file ' . $key_filename,0);
+        return false;
+      }
+      if ($mtime !== FALSE && $this->key_cache_apcu)
+        apcu_store($apcu_key, $key_str, 24*60*60);
+    }
     $key = openssl_get_publickey($key_str);
-    fclose($key_file);
-    $result = openssl_verify(rawurldecode($data), $this->wls_decode(rawurldecode($sig)), $key);
-    openssl_free_key($key);
-    return $result;
+    if (!$key) {
+      error_log('Failed to parse key file ' . $key_filename,0);
+      return false;
+    }
+    return $key;
   }
     
+  // The original session cookie signature: the HMAC-SHA1 as hex, then
+  // wls_encode'd.
+
   function hmac_sha1($key, $data) {
-    $blocksize = 64;
-    if (strlen($key) > $blocksize)
-      $key = pack('H*', sha1($key));
-    $key = str_pad($key, $blocksize, chr(0x00));
-    $ipad = str_repeat(chr(0x36), $blocksize);
-    $opad = str_repeat(chr(0x5c), $blocksize);
-    $hmac = pack('H*', sha1(($key^$opad).pack('H*', sha1(($key^$ipad).$data))));
-    return $this->wls_encode(bin2hex($hmac));
+    return $this->wls_encode(hash_hmac('sha1', $data, $key));
   }
 
   function hmac_sha1_verify($key, $data, $sig) {
-    return ($sig == $this->hmac_sha1($key, $data));
+    return $this->equals($this->hmac_sha1($key, $data), (string) $sig);
+  }
+
+  // Session cookies are signed with cookie_digest. Unless that is sha1,
+  // the signature is the digest name, ':' and the raw HMAC wls_encode'd,
+  // so cookies issued before cookie_digest was set (or changed) can still
+  // be verified as HMAC-SHA1.
+
+  function cookie_sig($key, $data) {
+    if ($this->cookie_digest == 'sha1') return $this->hmac_sha1($key, $data);
+    return $this->cookie_digest . ':' .
+      $this->wls_encode(hash_hmac($this->cookie_digest, $data, $key, TRUE));
+  }
+
+  function cookie_sig_verify($key, $data, $sig) {
+    $parts = explode(':', (string) $sig, 2);
+    if (count($parts) == 1) return $this->hmac_sha1_verify($key, $data, $sig);
+    if ($parts[0] != $this->cookie_digest or
+	!in_array($parts[0], hash_algos())) return FALSE;
+    return $this->equals($this->cookie_sig($key, $data), (string) $sig);
+  }
+
+  // Compares two strings in time independent of where they differ.
+
+  function equals($known, $given) {
+    if (function_exists('hash_equals')) return hash_equals($known, $given);
+    if (strlen($known) != strlen($given)) return FALSE;
+    $diff = 0;
+    for ($i = 0; $i < strlen($known); $i++) $diff |= ord($known[$i]) ^ ord($given[$i]);
+    return $diff == 0;
   }
 
   function url() {
@@ -375,6 +496,43 @@ class Ucam_Webauth {
     return $this->cookie_name;
   }
 
+  function now() {
+    return time();
+  }
+
+  // The key under which a verified session cookie is cached. It depends
+  // on the cookie key, so changing the key invalidates every cached
+  // session, as it does the cookies themselves.
+
+  function session_cache_id($cookie) {
+    return hash('sha256', $this->cookie_key . '!' . $cookie);
+  }
+
+  // Returns the cached ticket, issue and expiry times for a verified
+  // session cookie, or NULL if it hasn't been verified recently.
+
+  function cached_session($cookie) {
+    $id = $this->session_cache_id($cookie);
+    if (isset(self::$sessions[$id])) return self::$sessions[$id];
+    if ($this->session_cache_apcu) {
+      $session = apcu_fetch('Ucam_Webauth_session:' . $id);
+      if ($session !== FALSE) {
+	self::$sessions[$id] = $session;
+	return $session;
+      }
+    }
+    return NULL;
+  }
+
+  function cache_session($cookie, $session) {
+    $id = $this->session_cache_id($cookie);
+    self::$sessions[$id] = $session;
+    if ($this->session_cache_apcu) {
+      $life = min($this->session_cache_life, $session['expire'] - $this->now());
+      if ($life > 0) apcu_store('Ucam_Webauth_session:' . $id, $session, $life);
+    }
+  }
+
   function time2iso($t) {
     //return gmstrftime('%Y%m%d', $t).'T'.gmstrftime('%H%M%S', $t).'Z';
     return gmdate('Ymd\THis\Z', $t);
@@ -452,26 +610,48 @@ class Ucam_Webauth {
 	  $_COOKIE[$this->full_cookie_name()] != $this->WLS_LOGOUT) {
 
 	error_log('existing authentication cookie found', 0);
-        error_log('cookie: ' . rawurldecode($_COOKIE[$this->full_cookie_name()]));
 
-	//$old_cookie = explode(' ', rawurldecode($_COOKIE[$this->full_cookie_name()]));
-	//$this->session_ticket = explode('!', $old__cookie[0]);
-	$this->session_ticket = explode('!', rawurldecode($_COOKIE[$this->full_cookie_name()]));
+	// Fast path: a cookie verified earlier in this request (or, with
+	// session_cache_apcu, recently by any request) isn't parsed and
+	// verified again, though its times are still checked below.
 
-	$values_for_verify = $this->session_ticket;
-	$sig = array_pop($values_for_verify);
+	$cookie = $_COOKIE[$this->full_cookie_name()];
+	$session = $this->cached_session($cookie);
+	$verified = isset($session);
 
-	if ($this->hmac_sha1_verify($this->cookie_key,
-				    implode('!', $values_for_verify),
-				    $sig)) {
+	if ($verified) {
+	  error_log('existing authentication cookie previously verified', 0);
+	  $this->session_ticket = $session['ticket'];
+	} else {
+	  error_log('cookie: ' . rawurldecode($cookie));
+
+	  //$old_cookie = explode(' ', rawurldecode($_COOKIE[$this->full_cookie_name()]));
+	  //$this->session_ticket = explode('!', $old__cookie[0]);
+	  $this->session_ticket = explode('!', rawurldecode($cookie));
+
+	  $values_for_verify = $this->session_ticket;
+	  $sig = array_pop($values_for_verify);
+
+	  $verified = $this->cookie_sig_verify($this->cookie_key,
+					       implode('!', $values_for_verify),
+					       $sig);
+	  if ($verified) {
+	    error_log('existing authentication cookie verified', 0);
+	    $session = array('ticket' => $this->session_ticket,
+			     'issue' => $this->iso2time($this->session_ticket[$this->SESSION_TICKET_ISSUE]),
+			     'expire' => $this->iso2time($this->session_ticket[$this->SESSION_TICKET_EXPIRE]));
+	    $this->cache_session($cookie, $session);
+	  }
+	}
 
-	  error_log('existing authentication cookie verified', 0);
+	if ($verified) {
 
-	  $issue = $this->iso2time($this->session_ticket[$this->SESSION_TICKET_ISSUE]);
-	  $expire = $this->iso2time($this->session_ticket[$this->SESSION_TICKET_EXPIRE]);
-	  $now = time();
+	  $issue = $session['issue'];
+	  $expire = $session['expire'];
+	  $now = $this->now();
 
-	  if ($issue <= $now and $now < $expire) {
+	  // Allow for clock_skew between web servers sharing the cookie key
+	  if ($issue <= $now + $this->clock_skew and $now < $expire) {
 	    if (!isset($authassertionid) or $authassertionid != $this->session_ticket[$this->SESSION_TICKET_ID]) {
 	      if ($this->session_ticket[$this->SESSION_TICKET_STATUS] != '200') {
 	        if (!$testauthonly) setcookie($this->full_cookie_name(),
@@ -543,7 +723,7 @@ class Ucam_Webauth {
 	$this->session_ticket[$this->SESSION_TICKET_STATUS] = '600';
 	return TRUE;
       } else {
-	$now = time();
+	$now = $this->now();
 	$issue = $this->iso2time($token[$this->WLS_TOKEN_ISSUE]);
 
 	if (!isset($issue)) {
@@ -574,8 +754,8 @@ class Ucam_Webauth {
       
       // populate session ticket with information collected so far
       
-      $this->session_ticket[$this->SESSION_TICKET_ISSUE] = $this->time2iso(time());
-      $this->session_ticket[$this->SESSION_TICKET_EXPIRE] = $this->time2iso(time() + $expiry);
+      $this->session_ticket[$this->SESSION_TICKET_ISSUE] = $this->time2iso($this->now());
+      $this->session_ticket[$this->SESSION_TICKET_EXPIRE] = $this->time2iso($this->now() + $expiry);
       $this->session_ticket[$this->SESSION_TICKET_ID] = $token[$this->WLS_TOKEN_ID];
       $this->session_ticket[$this->SESSION_TICKET_PRINCIPAL] = $token[$this->WLS_TOKEN_PRINCIPAL];
       $this->session_ticket[$this->SESSION_TICKET_AUTH] = $token[$this->WLS_TOKEN_AUTH];
@@ -614,7 +794,7 @@ class Ucam_Webauth {
       if (isset($this->session_ticket[$this->SESSION_TICKET_PARAMS])) 
 	$cookie .= $this->session_ticket[$this->SESSION_TICKET_PARAMS];
 
-      $sig = $this->hmac_sha1($this->cookie_key, $cookie);
+      $sig = $this->cookie_sig($this->cookie_key, $cookie);
       $cookie .= '!' . $sig;
       error_log('cookie: ' . $cookie); 
 
@@ -679,7 +859,7 @@ class Ucam_Webauth {
     if (isset($this->params)) $dest .= '&params' . rawurlencode($this->params);
     if (isset($current_timeout_message)) $dest .= '&msg=' . rawurlencode($current_timeout_message);
     if (isset($this->clock_skew)) {
-      $dest .= '&date=' . rawurlencode($this->time2iso(time())) .
+      $dest .= '&date=' . rawurlencode($this->time2iso($this->now())) .
 	'&skew=' . rawurlencode($this->clock_skew);
     }
     if ($this->fail == TRUE) $dest .= '&fail=yes';
@@ -0,0 +1,57 @@
+<?php
+/*
+    bench_check_sig
+    ---------------
+
+    Measures WLS response signature verification throughput in
+    Ucam_Webauth::check_sig, reading and parsing the key file on every call
+    (as before the key cache) and with the cached key.
+
+    Usage: php benchmarks/bench_check_sig.php [iterations]
+
+    @file    bench_check_sig.php
+    @license BSD 3-Clause
+    @package WPRavenAuth
+    @author  Gideon Farrell <me@gideonfarrell.co.uk>
+ */
+
+require_once dirname(__FILE__) . '/../app/lib/ucam_webauth.php';
+
+use WPRavenAuth\Ucam_Webauth;
+
+$iterations = isset($argv[1]) ? intval($argv[1]) : 5000;
+
+// A temporary key directory holding a freshly generated key as key 2
+$keyDir = sys_get_temp_dir() . '/bench_check_sig_' . getmypid();
+@mkdir($keyDir);
+$key = openssl_pkey_new(array('private_key_bits' => 2048));
+$csr = openssl_csr_new(array('commonName' => 'Raven benchmark key'), $key);
+openssl_x509_export(openssl_csr_sign($csr, null, $key, 1), $cert);
+file_put_contents($keyDir . '/2.crt', $cert);
+
+$data = '3!200!!20240101T000000Z!1704067200-1234-5!https://example.cam.ac.uk/!abc12!pwd!!36000!';
+openssl_sign($data, $sig, $key);
+
+function bench($label, $webauth, $data, $sig, $iterations) {
+    $sig = $webauth->wls_encode($sig);
+    $start = microtime(true);
+    for ($i = 0; $i < $iterations; $i++) {
+        if ($webauth->check_sig($data, $sig, '2') !== 1)
+            die("Signature check failed\n");
+    }
+    $elapsed = microtime(true) - $start;
+    printf("%-28s %8.3fs  %8.0f verifies/s  %6.1f us/verify\n",
+           $label, $elapsed, $iterations / $elapsed, 1e6 * $elapsed / $iterations);
+}
+
+echo "$iterations verifies of a 2048-bit RSA signature\n";
+bench('uncached (read and parse)',
+      new Ucam_Webauth(array('key_dir' => $keyDir, 'key_cache' => FALSE)),
+      $data, $sig, $iterations);
+bench('cached key',
+      new Ucam_Webauth(array('key_dir' => $keyDir, 'key_cache_apcu' => FALSE)),
+      $data, $sig, $iterations);
+
+unlink($keyDir . '/2.crt');
+rmdir($keyDir);
+?>
@@ -0,0 +1,70 @@
+<?php
+/*
+    bench_cookie_hmac
+    -----------------
+
+    Measures the per-request cost of validating a session cookie signature:
+    the original hand-rolled HMAC-SHA1 compared with ==, and the native
+    hash_hmac paths (HMAC-SHA1 for existing cookies, and the configured
+    digest for new ones) compared in constant time.
+
+    Usage: php benchmarks/bench_cookie_hmac.php [iterations]
+
+    @file    bench_cookie_hmac.php
+    @license BSD 3-Clause
+    @package WPRavenAuth
+    @author  Gideon Farrell <me@gideonfarrell.co.uk>
+ */
+
+require_once dirname(__FILE__) . '/../app/lib/ucam_webauth.php';
+
+use WPRavenAuth\Ucam_Webauth;
+
+$iterations = isset($argv[1]) ? intval($argv[1]) : 200000;
+
+// The signing code as it was before hash_hmac
+class LegacyWebauth extends Ucam_Webauth {
+    function hmac_sha1($key, $data) {
+        $blocksize = 64;
+        if (strlen($key) > $blocksize)
+            $key = pack('H*', sha1($key));
+        $key = str_pad($key, $blocksize, chr(0x00));
+        $ipad = str_repeat(chr(0x36), $blocksize);
+        $opad = str_repeat(chr(0x5c), $blocksize);
+        $hmac = pack('H*', sha1(($key^$opad).pack('H*', sha1(($key^$ipad).$data))));
+        return $this->wls_encode(bin2hex($hmac));
+    }
+
+    function hmac_sha1_verify($key, $data, $sig) {
+        return ($sig == $this->hmac_sha1($key, $data));
+    }
+}
+
+$key = 'rand0m+alphanum3r!icstr!n&-but-longer-and-random';
+$ticket = '1!200!!20240101T000000Z!20240101T020000Z!1704067200-1234-5!abc12!pwd!!';
+
+function bench($label, $verify, $sig, $iterations) {
+    global $key, $ticket;
+    $start = microtime(true);
+    for ($i = 0; $i < $iterations; $i++) {
+        if (!$verify($key, $ticket, $sig))
+            die("Cookie check failed\n");
+    }
+    $elapsed = microtime(true) - $start;
+    printf("%-32s %8.3fs  %6.2f us/cookie\n",
+           $label, $elapsed, 1e6 * $elapsed / $iterations);
+}
+
+$legacy = new LegacyWebauth(array());
+$webauth = new Ucam_Webauth(array());
+$sha1Sig = $webauth->hmac_sha1($key, $ticket);
+
+echo "$iterations session cookie checks\n";
+bench('hand-rolled HMAC-SHA1, ==', array($legacy, 'hmac_sha1_verify'), $sha1Sig, $iterations);
+bench('hash_hmac SHA1, hash_equals', array($webauth, 'cookie_sig_verify'), $sha1Sig, $iterations);
+foreach (array('sha256', 'sha512') as $digest) {
+    $webauth->cookie_digest($digest);
+    bench("hash_hmac $digest, hash_equals", array($webauth, 'cookie_sig_verify'),
+          $webauth->cookie_sig($key, $ticket), $iterations);
+}
+?>
@@ -0,0 +1,170 @@
+<?php
+/*
+    bench_show_post
+    ---------------
+
+    Counts the Lookup calls and post meta queries made, and measures the wall
+    time taken, to decide which posts of an N-post page a logged-in user can
+    see: checking each post separately (as showPost used to, with a
+    get_field and a getPerson per restricted post) and with
+    Visibility::evaluate.
+
+    WordPress isn't loaded: the few functions needed are replaced by
+    in-memory stand-ins that count the meta queries, and Lookup is replaced
+    by FakeLookupConnection with a simulated round trip time.
+
+    Usage: php benchmarks/bench_show_post.php [posts] [lookup_ms]
+
+    @file    bench_show_post.php
+    @license BSD 3-Clause
+    @package WPRavenAuth
+    @author  Gideon Farrell <me@gideonfarrell.co.uk>
+ */
+
+namespace {
+
+require_once dirname(__FILE__) . '/../test/FakeLookupConnection.php';
+require_once dirname(__FILE__) . '/../app/core/ibis.php';
+require_once dirname(__FILE__) . '/../app/core/visibility.php';
+
+// WordPress stand-ins: post meta, with a cache that is filled per post or,
+// by update_meta_cache, for many posts in one query
+$postMeta = array();
+$metaCache = array();
+$metaQueries = 0;
+
+function update_meta_cache($type, $ids) {
+    global $postMeta, $metaCache, $metaQueries;
+    $metaQueries++;
+    foreach ($ids as $id)
+        $metaCache[$id] = isset($postMeta[$id]) ? $postMeta[$id] : array();
+}
+
+function get_post_meta($id, $key, $single) {
+    global $postMeta, $metaCache, $metaQueries;
+    if (!isset($metaCache[$id])) {
+        $metaQueries++;
+        $metaCache[$id] = isset($postMeta[$id]) ? $postMeta[$id] : array();
+    }
+    return isset($metaCache[$id][$key]) ? $metaCache[$id][$key] : '';
+}
+
+function update_post_meta($id, $key, $value) {
+    global $postMeta, $metaCache, $metaQueries;
+    $metaQueries++;
+    $postMeta[$id][$key] = $value;
+    unset($metaCache[$id]);
+}
+
+function get_field($name, $id) {
+    return get_post_meta($id, $name, true);
+}
+
+function is_user_logged_in() {
+    return true;
+}
+
+// Lookup, with a round trip time
+class SlowLookupConnection extends FakeLookupConnection {
+    public $latency = 0;
+
+    public function invokeMethod($method, $path, $pathParams,
+                                 $queryParams, $formParams=null) {
+        usleep($this->latency);
+        return parent::invokeMethod($method, $path, $pathParams,
+                                    $queryParams, $formParams);
+    }
+}
+
+}
+
+namespace WPRavenAuth {
+
+// A person cache for a single request (nothing is kept between requests)
+class RequestPersonCache extends PersonCache {
+    protected function fetch($crsid) { return false; }
+    protected function store($crsid, $entry, $ttl) {}
+    protected function discard($crsid) {}
+    protected function readIndex() { return array(); }
+    protected function saveIndex($index) {}
+}
+
+// The per-post check as it was before Visibility
+function legacyCanAccessPost($postID, $crsid, $pm) {
+    $postVisibility = get_field('custom_visibility', $postID);
+
+    if (!is_array($postVisibility))
+        $postVisibility = array('public');
+
+    if (in_array('public', $postVisibility))
+        return true;
+    elseif (in_array('raven', $postVisibility))
+        return is_user_logged_in();
+    elseif (is_user_logged_in()) {
+        $person = $pm->getPerson("crsid", $crsid, Ibis::PERSON_FETCH);
+        foreach ($postVisibility as $inst) {
+            $inst_split = explode('-', $inst);
+            if (strcmp($inst_split[0], 'COLL') == 0) {
+                if (Ibis::isMemberOfCollege($person, $inst_split[1]))
+                    return true;
+            } elseif (strcmp($inst_split[0], 'INST') == 0) {
+                if (Ibis::isMemberOfInst($person, $inst_split[1]))
+                    return true;
+            }
+        }
+    }
+    return false;
+}
+
+function report($label, $conn, $start, $visible) {
+    global $metaQueries;
+    printf("%-22s %4d Lookup calls  %4d meta queries  %8.1f ms  (%d visible)\n",
+           $label, sizeof($conn->requests), $metaQueries,
+           1000 * (microtime(true) - $start), $visible);
+}
+
+$numPosts = isset($argv[1]) ? intval($argv[1]) : 20;
+$latency = isset($argv[2]) ? floatval($argv[2]) : 20;
+
+$conn = new \SlowLookupConnection();
+$conn->latency = intval(1000 * $latency);
+$conn->setPerson("abc12", "A. Person", false, array("CHRISTS", "CHRSTUG"), "CHRISTS");
+Ibis::setConnection($conn);
+
+// A page of posts restricted to various colleges and institutions
+$rules = array(array('COLL-TRIN', 'INST-TRINUG'),
+               array('COLL-CHRISTS'),
+               array('INST-CHRSTPG', 'INST-CHRSTUG'),
+               array('COLL-KINGS'));
+$postIDs = array();
+for ($i = 1; $i <= $numPosts; $i++) {
+    $postIDs[] = $i;
+    $postMeta[$i] = array('custom_visibility' => $rules[$i % sizeof($rules)]);
+}
+
+echo "$numPosts restricted posts, $latency ms per Lookup call\n";
+
+$metaCache = array();
+$metaQueries = 0;
+$conn->requests = array();
+$pm = new \PersonMethods($conn);
+$start = microtime(true);
+$visible = 0;
+foreach ($postIDs as $postID)
+    $visible += legacyCanAccessPost($postID, 'abc12', $pm) ? 1 : 0;
+report('per post (before):', $conn, $start, $visible);
+
+// Compile every post's visibility, as saving them would have done
+foreach ($postIDs as $postID)
+    Visibility::updateValue($postMeta[$postID]['custom_visibility'], $postID);
+
+$metaCache = array();
+$metaQueries = 0;
+$conn->requests = array();
+Ibis::setPersonCache(new RequestPersonCache());
+$start = microtime(true);
+$visible = sizeof(array_filter(Visibility::evaluate($postIDs, true, 'abc12')));
+report('Visibility::evaluate:', $conn, $start, $visible);
+
+}
+?>
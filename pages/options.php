@@ -124,6 +124,30 @@ class OptionsPage
             'wpravenauth-admin', // Page
             'raven-section' // Section
         );
+        
+        add_settings_field(
+            'ibis-cache-ttl', // ID
+            'Ibis Cache Lifetime (seconds)', // Title
+            array( $this, 'ibis_cache_ttl_callback' ), // Callback
+            'wpravenauth-admin', // Page
+            'raven-section' // Section
+        );
+        
+        add_settings_field(
+            'ibis-cache-size', // ID
+            'Ibis Cache Size (people)', // Title
+            array( $this, 'ibis_cache_size_callback' ), // Callback
+            'wpravenauth-admin', // Page
+            'raven-section' // Section
+        );
+        
+        add_settings_field(
+            'sync-max-age', // ID
+            'Lookup Mirror Maximum Age (seconds)', // Title
+            array( $this, 'sync_max_age_callback' ), // Callback
+            'wpravenauth-admin', // Page
+            'raven-section' // Section
+        );
     }
 
     /** 
@@ -175,6 +199,42 @@ class OptionsPage
                    );
         }
     }
+    
+    /** 
+     * Get the settings option array and print one of its values
+     */
+    public function ibis_cache_ttl_callback()
+    {
+        printf(
+            '<input type="number" min="1" id="ibis_cache_ttl" name="%s[ibis_cache_ttl]" value="%s" />',
+               Config::key(),
+               Config::get('ibis_cache_ttl')
+        );
+    }
+    
+    /** 
+     * Get the settings option array and print one of its values
+     */
+    public function ibis_cache_size_callback()
+    {
+        printf(
+            '<input type="number" min="1" id="ibis_cache_size" name="%s[ibis_cache_size]" value="%s" />',
+               Config::key(),
+               Config::get('ibis_cache_size')
+        );
+    }
+    
+    /** 
+     * Get the settings option array and print one of its values
+     */
+    public function sync_max_age_callback()
+    {
+        printf(
+            '<input type="number" min="1" id="sync_max_age" name="%s[sync_max_age]" value="%s" />',
+               Config::key(),
+               Config::get('sync_max_age')
+        );
+    }
 }
 
 if( is_admin() )
@@ -0,0 +1,222 @@
+<?php
+/*
+    FakeLookupConnection
+    --------------------
+
+    An in-process fake of the Lookup web service, for testing code built on
+    the Ibis client without a network connection. It implements the client's
+    ClientConnection interface, answering the methods used by the sync and
+    by Ibis::getPerson with XML built from its own data, which is then parsed
+    by the real IbisResultParser.
+
+    @file    FakeLookupConnection.php
+    @license BSD 3-Clause
+    @package WPRavenAuth
+    @author  Gideon Farrell <me@gideonfarrell.co.uk>
+ */
+
+require_once dirname(__FILE__) . "/../app/lib/ibis-client/ibisclient/client/ClientConnection.php";
+require_once dirname(__FILE__) . "/../app/lib/ibis-client/ibisclient/dto/IbisResult.php";
+
+class FakeLookupConnection implements ClientConnection
+{
+    /** The id of the last transaction that changed the data. */
+    public $lastTransactionId = 1000;
+
+    /** Each request made, as "path?query". */
+    public $requests = array();
+
+    /** The number of requests to allow before failing, or null. */
+    public $failAfter = null;
+
+    /* Entities by type and lowercase id, each with its history: the
+     * transaction id and XML of every change, oldest first */
+    private $entities = array("person" => array(),
+                              "inst"   => array(),
+                              "group"  => array());
+
+    private static $paths = array(
+        "api/v1/person/list"            => array("person", "crsids", false),
+        "api/v1/person/modified-people" => array("person", "crsids", true),
+        "api/v1/inst/list"              => array("inst", "instids", false),
+        "api/v1/inst/modified-insts"    => array("inst", "instids", true),
+        "api/v1/group/list"             => array("group", "groupids", false),
+        "api/v1/group/modified-groups"  => array("group", "groupids", true),
+    );
+
+    private static $wrappers = array("person" => "people",
+                                     "inst"   => "institutions",
+                                     "group"  => "groups");
+
+    /**
+     * Add or change a person, in a new transaction.
+     *
+     * @param string $crsid The person's CRSid.
+     * @param string $visibleName The person's visible name.
+     * @param boolean $cancelled Whether the person is cancelled.
+     * @param string[] $instids The person's institutions.
+     * @param string $college The person's jdCollege attribute, if any.
+     */
+    public function setPerson($crsid, $visibleName, $cancelled=false,
+                              $instids=array(), $college=null)
+    {
+        $attrs = "";
+        if (isset($college))
+            $attrs = '<attribute attrid="1" scheme="jdCollege"><value>' .
+                     htmlspecialchars($college) . '</value></attribute>';
+        $insts = "";
+        foreach ($instids as $instid)
+            $insts .= '<institution cancelled="false" instid="' .
+                      htmlspecialchars($instid) . '"/>';
+        $this->setEntity("person", $crsid,
+                         '<person cancelled="' . ($cancelled ? "true" : "false") . '">' .
+                         '<identifier scheme="crsid">' . htmlspecialchars($crsid) . '</identifier>' .
+                         '<visibleName>' . htmlspecialchars($visibleName) . '</visibleName>' .
+                         '<attributes>' . $attrs . '</attributes>' .
+                         '<institutions>' . $insts . '</institutions>' .
+                         '</person>');
+    }
+
+    /**
+     * Add or change an institution, in a new transaction.
+     *
+     * @param string $instid The institution's instid.
+     * @param string $name The institution's name.
+     * @param boolean $cancelled Whether the institution is cancelled.
+     */
+    public function setInst($instid, $name, $cancelled=false)
+    {
+        $this->setEntity("inst", $instid,
+                         '<institution cancelled="' . ($cancelled ? "true" : "false") .
+                         '" instid="' . htmlspecialchars($instid) . '">' .
+                         '<name>' . htmlspecialchars($name) . '</name>' .
+                         '</institution>');
+    }
+
+    /**
+     * Add or change a group, in a new transaction.
+     *
+     * @param string $groupid The group's groupid.
+     * @param string $name The group's name.
+     * @param boolean $cancelled Whether the group is cancelled.
+     */
+    public function setGroup($groupid, $name, $cancelled=false)
+    {
+        $this->setEntity("group", $groupid,
+                         '<group cancelled="' . ($cancelled ? "true" : "false") .
+                         '" groupid="' . htmlspecialchars($groupid) . '">' .
+                         '<name>' . htmlspecialchars($name) . '</name>' .
+                         '</group>');
+    }
+
+    private function setEntity($type, $id, $xml)
+    {
+        $this->lastTransactionId++;
+        $this->entities[$type][strtolower($id)][] =
+            array("txId" => $this->lastTransactionId, "xml" => $xml);
+    }
+
+    /* The XML of an entity as of a transaction (by default the latest), or
+     * null if it didn't exist then */
+    private function entityXml($type, $id, $maxTxId=null)
+    {
+        $xml = null;
+        if (isset($this->entities[$type][$id]))
+            foreach ($this->entities[$type][$id] as $version)
+                if (is_null($maxTxId) || $version["txId"] <= $maxTxId)
+                    $xml = $version["xml"];
+        return $xml;
+    }
+
+    /* Whether an entity was changed in a range of transactions */
+    private function modifiedIn($type, $id, $minTxId, $maxTxId)
+    {
+        foreach ($this->entities[$type][$id] as $version)
+            if ($version["txId"] > $minTxId && $version["txId"] <= $maxTxId)
+                return true;
+        return false;
+    }
+
+    /* @see ClientConnection::setUsername(string) */
+    public function setUsername($username)
+    {
+    }
+
+    /* @see ClientConnection::setPassword(string) */
+    public function setPassword($password)
+    {
+    }
+
+    /* @see ClientConnection::invokeGetMethod(string, string[], array) */
+    public function invokeGetMethod($path, $pathParams, $queryParams)
+    {
+        return $this->invokeMethod("GET", $path, $pathParams, $queryParams);
+    }
+
+    /* @see ClientConnection::invokeMethod(string, string, string[], array, array) */
+    public function invokeMethod($method, $path, $pathParams,
+                                 $queryParams, $formParams=null)
+    {
+        if (!is_null($this->failAfter) &&
+            sizeof($this->requests) >= $this->failAfter)
+            throw new Exception("Fake Lookup connection failure");
+
+        $query = array();
+        foreach ($queryParams as $name => $value)
+            if (isset($value))
+                $query[$name] = is_bool($value) ? ($value ? "true" : "false") : $value;
+        $this->requests[] = vsprintf($path, array_values((array)$pathParams)) .
+                            "?" . http_build_query($query);
+
+        if ($path === "api/v1/last-transaction")
+        {
+            $xml = "<value>" . $this->lastTransactionId . "</value>";
+        }
+        elseif ($path === 'api/v1/person/%1$s/%2$s')
+        {
+            $crsid = strtolower($pathParams["identifier"]);
+            $xml = (string )$this->entityXml("person", $crsid);
+        }
+        elseif (isset(FakeLookupConnection::$paths[$path]))
+        {
+            list($type, $idsParam, $modified) = FakeLookupConnection::$paths[$path];
+            $includeCancelled = !$modified ||
+                (isset($query["includeCancelled"]) && $query["includeCancelled"] === "true");
+
+            $ids = isset($query[$idsParam]) ?
+                   explode(",", strtolower($query[$idsParam])) :
+                   array_keys($this->entities[$type]);
+            sort($ids);
+
+            $xml = "<" . FakeLookupConnection::$wrappers[$type] . ">";
+            foreach ($ids as $id)
+            {
+                if (!isset($this->entities[$type][$id])) continue;
+                if ($modified &&
+                    !$this->modifiedIn($type, $id, $query["minTxId"], $query["maxTxId"]))
+                    continue;
+
+                // A modified entity is returned as it was at the end of the
+                // range of transactions
+                $entityXml = $this->entityXml($type, $id,
+                                              $modified ? $query["maxTxId"] : null);
+                if (!$includeCancelled &&
+                    strpos($entityXml, 'cancelled="true"') !== false)
+                    continue;
+                $xml .= $entityXml;
+            }
+            $xml .= "</" . FakeLookupConnection::$wrappers[$type] . ">";
+        }
+        else
+        {
+            $xml = '<error status="404"><code>Not Found</code>' .
+                   '<message>No such method: ' . htmlspecialchars($path) .
+                   '</message></error>';
+        }
+
+        $parser = new IbisResultParser();
+        return $parser->parseXml('<?xml version="1.0" encoding="UTF-8"?>' .
+                                 '<result version="1.0">' . $xml . '</result>');
+    }
+}
+?>
@@ -0,0 +1,298 @@
+<?php
+/*
+    IbisTest
+    --------
+
+    Tests for the Ibis person cache and membership sets, run against
+    FakeLookupConnection.
+
+    @file    IbisTest.php
+    @license BSD 3-Clause
+    @package WPRavenAuth
+    @author  Gideon Farrell <me@gideonfarrell.co.uk>
+ */
+
+require_once dirname(__FILE__) . "/FakeLookupConnection.php";
+require_once dirname(__FILE__) . "/../app/core/ibis.php";
+
+use PHPUnit\Framework\TestCase;
+use WPRavenAuth\Ibis;
+use WPRavenAuth\PersonCache;
+
+/*
+ * A PersonCache holding its transients and index in a shared object rather
+ * than the WordPress database, with a clock that the tests control. Each
+ * instance behaves like the cache in a new request.
+ */
+class ArrayPersonCache extends PersonCache
+{
+    private $db;
+
+    public function __construct($db, $ttl, $size)
+    {
+        parent::__construct($ttl, $size);
+        $this->db = $db;
+    }
+
+    protected function fetch($crsid)
+    {
+        if (!isset($this->db->transients[$crsid]) ||
+            $this->db->transients[$crsid]["expires"] <= $this->db->time)
+            return false;
+        return $this->db->transients[$crsid]["entry"];
+    }
+
+    protected function store($crsid, $entry, $ttl)
+    {
+        $this->db->transients[$crsid] = array("entry"   => $entry,
+                                              "expires" => $this->db->time + $ttl);
+    }
+
+    protected function discard($crsid) { unset($this->db->transients[$crsid]); }
+    protected function readIndex() { return $this->db->index; }
+    protected function saveIndex($index)
+    {
+        $this->db->index = $index;
+        $this->db->indexWrites++;
+    }
+    protected function now() { return $this->db->time; }
+}
+
+/*
+ * A mirror of Lookup holding people in an array.
+ */
+class ArrayMirror
+{
+    public $people = array();
+
+    public function get($type, $id)
+    {
+        return isset($this->people[$id]) ? $this->people[$id] : null;
+    }
+}
+
+class IbisTest extends TestCase
+{
+    private $conn;
+    private $db;
+    private $cache = null;
+
+    public function setUp(): void
+    {
+        $this->conn = new FakeLookupConnection();
+        $this->conn->setPerson("abc12", "A. Person", false, array("CHRISTS"), "CHRISTS");
+        $this->conn->setPerson("def34", "D. Person", false, array("TRIN"), "TRIN");
+        $this->conn->setPerson("ghi56", "G. Person");
+        Ibis::setConnection($this->conn);
+
+        $this->db = new stdClass();
+        $this->db->transients = array();
+        $this->db->index = false;
+        $this->db->indexWrites = 0;
+        $this->db->time = 1000000;
+        $this->newRequest();
+    }
+
+    private function newRequest($ttl = 3600, $size = 1000)
+    {
+        // End the last request, writing its index
+        $this->endRequest();
+        $this->conn->requests = array();
+        $this->cache = new ArrayPersonCache($this->db, $ttl, $size);
+        Ibis::setPersonCache($this->cache);
+    }
+
+    private function endRequest()
+    {
+        if (!is_null($this->cache))
+            $this->cache->flush();
+    }
+
+    private function stats()
+    {
+        return Ibis::personCache()->stats();
+    }
+
+    public function testMemo()
+    {
+        $person = Ibis::getPerson("abc12");
+        $this->assertEquals("A. Person", $person->visibleName);
+        $this->assertEquals("CHRISTS", $person->attributes[0]->value);
+        $this->assertTrue(Ibis::isMemberOfInst($person, "CHRISTS"));
+
+        $this->assertSame($person, Ibis::getPerson("ABC12"));
+        $this->assertEquals(array("api/v1/person/crsid/abc12?fetch=jdCollege%2Call_insts"),
+                            $this->conn->requests);
+        $this->assertEquals(1, $this->stats()["memo_hits"]);
+        $this->assertEquals(0, $this->stats()["hits"]);
+        $this->assertEquals(1, $this->stats()["misses"]);
+    }
+
+    public function testPersistentHit()
+    {
+        Ibis::getPerson("abc12");
+        $this->newRequest();
+
+        $this->assertEquals("A. Person", Ibis::getPerson("abc12")->visibleName);
+        $this->assertEquals(array(), $this->conn->requests);
+        $this->assertEquals(1, $this->stats()["hits"]);
+        $this->assertEquals(0, $this->stats()["misses"]);
+    }
+
+    public function testUnknownPerson()
+    {
+        $this->assertNull(Ibis::getPerson("nobody1"));
+        $this->assertNull(Ibis::getPerson("nobody1"));
+        $this->assertEquals(1, sizeof($this->conn->requests));
+
+        // Unknown people are cached for a shorter time, outside the index
+        $this->newRequest();
+        $this->assertNull(Ibis::getPerson("nobody1"));
+        $this->assertEquals(array(), $this->conn->requests);
+        $this->assertEquals(false, $this->db->index);
+
+        $this->db->time += PersonCache::UNKNOWN_TTL;
+        $this->newRequest();
+        $this->assertNull(Ibis::getPerson("nobody1"));
+        $this->assertEquals(1, sizeof($this->conn->requests));
+    }
+
+    public function testIndexWrittenOnce()
+    {
+        Ibis::getPerson("abc12");
+        Ibis::getPerson("def34");
+        Ibis::getPerson("ghi56");
+        $this->assertEquals(0, $this->db->indexWrites);
+
+        $this->endRequest();
+        $this->assertEquals(1, $this->db->indexWrites);
+        $this->assertEquals(array("abc12", "def34", "ghi56"), array_keys($this->db->index));
+
+        // Recent hits don't change the index
+        $this->newRequest();
+        Ibis::getPerson("abc12");
+        $this->endRequest();
+        $this->assertEquals(1, $this->db->indexWrites);
+    }
+
+    public function testExpiry()
+    {
+        Ibis::getPerson("abc12");
+        $this->conn->setPerson("abc12", "A. Renamed");
+
+        $this->db->time += 3599;
+        $this->newRequest();
+        $this->assertEquals("A. Person", Ibis::getPerson("abc12")->visibleName);
+
+        $this->db->time += 1;
+        $this->newRequest();
+        $this->assertEquals("A. Renamed", Ibis::getPerson("abc12")->visibleName);
+        $this->assertEquals(1, $this->stats()["misses"]);
+    }
+
+    public function testEviction()
+    {
+        $this->newRequest(3600, 2);
+        Ibis::getPerson("abc12");
+        $this->db->time += 1;
+        Ibis::getPerson("def34");
+        $this->db->time += 1;
+        Ibis::getPerson("ghi56");
+        $this->endRequest();
+
+        $this->assertEquals(1, $this->stats()["evictions"]);
+        $this->assertEquals(array("def34", "ghi56"), array_keys($this->db->index));
+        $this->assertEquals(array("def34", "ghi56"), array_keys($this->db->transients));
+    }
+
+    public function testLeastRecentlyUsedEvicted()
+    {
+        $this->newRequest(3600, 2);
+        Ibis::getPerson("abc12");
+        Ibis::getPerson("def34");
+
+        // Using abc12 again makes def34 the least recently used
+        $this->db->time += 600;
+        $this->newRequest(3600, 2);
+        Ibis::getPerson("abc12");
+        Ibis::getPerson("ghi56");
+        $this->endRequest();
+
+        $this->assertEquals(array("abc12", "ghi56"), array_keys($this->db->index));
+        $this->newRequest(3600, 2);
+        Ibis::getPerson("def34");
+        $this->assertEquals(1, $this->stats()["misses"]);
+    }
+
+    public function testExpiredDroppedFromIndex()
+    {
+        Ibis::getPerson("abc12");
+        $this->db->time += 3600;
+        Ibis::getPerson("def34");
+        $this->endRequest();
+
+        $this->assertEquals(array("def34"), array_keys($this->db->index));
+        $this->assertEquals(0, $this->stats()["evictions"]);
+    }
+
+    public function testForget()
+    {
+        Ibis::getPerson("abc12");
+        Ibis::personCache()->forget("ABC12");
+        $this->endRequest();
+        $this->assertEquals(array(), $this->db->index);
+
+        Ibis::getPerson("abc12");
+        $this->assertEquals(2, sizeof($this->conn->requests));
+    }
+
+    public function testMemberships()
+    {
+        $this->conn->setPerson("abc12", "A. Person", false, array("CHRISTS", "CHEM"), "CHRISTS");
+        $memberships = Ibis::getMemberships("abc12");
+
+        $this->assertEquals(array("COLL-CHRISTS" => true, "INST-CHRISTS" => true,
+                                  "INST-CHEM" => true), $memberships);
+        $this->assertTrue(Ibis::matchesAny($memberships, array("COLL-TRIN", "INST-CHEM")));
+        $this->assertFalse(Ibis::matchesAny($memberships, array("COLL-TRIN", "INST-TRIN")));
+        $this->assertFalse(Ibis::matchesAny($memberships, array("raven")));
+        $this->assertTrue(Ibis::isMemberOfCollege(Ibis::getPerson("abc12"), "CHRISTS"));
+        $this->assertFalse(Ibis::isMemberOfCollege(Ibis::getPerson("abc12"), "CHEM"));
+
+        // The set is cached with the person, not rebuilt from them
+        $this->newRequest();
+        $this->assertEquals($memberships, Ibis::getMemberships("abc12"));
+        $this->assertEquals(array(), $this->conn->requests);
+        $this->assertEquals(1, $this->stats()["hits"]);
+    }
+
+    public function testMirror()
+    {
+        $mirror = new ArrayMirror();
+        $mirror->people["abc12"] = $this->conn->invokeMethod(
+            "GET", 'api/v1/person/%1$s/%2$s',
+            array("scheme" => "crsid", "identifier" => "abc12"), array())->person;
+        $this->conn->requests = array();
+        Ibis::setMirror($mirror);
+
+        try
+        {
+            // Mirrored people are read from the mirror, others from Lookup
+            $this->assertEquals("A. Person", Ibis::getPerson("abc12")->visibleName);
+            $this->assertEquals(array(), $this->conn->requests);
+            $this->assertEquals("D. Person", Ibis::getPerson("def34")->visibleName);
+            $this->assertEquals(1, sizeof($this->conn->requests));
+        }
+        finally
+        {
+            Ibis::setMirror(null);
+        }
+    }
+
+    public function testUnknownPersonMemberships()
+    {
+        $this->assertEquals(array(), Ibis::getMemberships("nobody1"));
+        $this->assertFalse(Ibis::matchesAny(array(), array("COLL-TRIN")));
+    }
+}
+?>
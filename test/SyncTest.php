@@ -0,0 +1,188 @@
+<?php
+/*
+    SyncTest
+    --------
+
+    Tests for the incremental Lookup sync, run against FakeLookupConnection.
+
+    @file    SyncTest.php
+    @license BSD 3-Clause
+    @package WPRavenAuth
+    @author  Gideon Farrell <me@gideonfarrell.co.uk>
+ */
+
+require_once dirname(__FILE__) . "/FakeLookupConnection.php";
+require_once dirname(__FILE__) . "/../app/core/sync.php";
+
+use PHPUnit\Framework\TestCase;
+use WPRavenAuth\Sync;
+use WPRavenAuth\SyncStore;
+
+/*
+ * A SyncStore holding everything in arrays.
+ */
+class ArraySyncStore implements SyncStore
+{
+    public $txId = null;
+    public $syncTime = null;
+    public $getIdsCalls = 0;
+    public $ids = array("person" => array(), "inst" => array(), "group" => array());
+    public $entities = array("person" => array(), "inst" => array(), "group" => array());
+
+    public function getLastTransactionId() { return $this->txId; }
+    public function setLastTransactionId($txId) { $this->txId = $txId; }
+    public function setLastSyncTime($time) { $this->syncTime = $time; }
+    public function getIds($type) { $this->getIdsCalls++; return $this->ids[$type]; }
+    public function save($type, $id, $entity) { $this->entities[$type][$id] = $entity; }
+    public function remove($type, $id) { unset($this->entities[$type][$id]); }
+}
+
+class SyncTest extends TestCase
+{
+    private $conn;
+    private $store;
+
+    public function setUp(): void
+    {
+        $this->conn = new FakeLookupConnection();
+        $this->conn->setPerson("abc12", "A. Person", false, array("CHRISTS"));
+        $this->conn->setPerson("def34", "D. Person", false, array("TRIN"));
+        $this->conn->setPerson("ghi56", "G. Person");
+        $this->conn->setPerson("xyz99", "Not Mirrored");
+        $this->conn->setInst("CHRISTS", "Christ's College");
+        $this->conn->setGroup("100001", "test-group");
+
+        $this->store = new ArraySyncStore();
+        $this->store->ids["person"] = array("abc12", "def34", "ghi56", "nobody1");
+        $this->store->ids["inst"] = array("CHRISTS");
+        $this->store->ids["group"] = array("100001");
+    }
+
+    private function sync($options = array())
+    {
+        $sync = new Sync($this->conn, $this->store, $options);
+        return $sync->run();
+    }
+
+    private function requestsFor($prefix)
+    {
+        $requests = array();
+        foreach ($this->conn->requests as $request)
+            if (strpos($request, $prefix) === 0)
+                $requests[] = $request;
+        return $requests;
+    }
+
+    public function testInitialLoad()
+    {
+        $stats = $this->sync();
+
+        $this->assertEquals(1006, $this->store->txId);
+        $this->assertNotNull($this->store->syncTime);
+        $this->assertEquals(array("abc12", "def34", "ghi56"),
+                            array_keys($this->store->entities["person"]));
+        $this->assertEquals("A. Person", $this->store->entities["person"]["abc12"]->visibleName);
+        $this->assertEquals("CHRISTS", $this->store->entities["person"]["abc12"]->institutions[0]->instid);
+        $this->assertEquals("Christ's College", $this->store->entities["inst"]["CHRISTS"]->name);
+        $this->assertEquals("test-group", $this->store->entities["group"]["100001"]->name);
+
+        $this->assertEquals(3, $stats["person"]["saved"]);
+        $this->assertEquals(1, $stats["person"]["removed"]); // nobody1
+        $this->assertEquals(1, sizeof($this->requestsFor("api/v1/person/list")));
+        $this->assertEquals(0, sizeof($this->requestsFor("api/v1/person/modified-people")));
+    }
+
+    public function testNoChanges()
+    {
+        $this->sync();
+        $this->conn->requests = array();
+
+        $stats = $this->sync();
+
+        $this->assertEquals(array("api/v1/last-transaction?"), $this->conn->requests);
+        $this->assertEquals(0, $stats["person"]["saved"]);
+        $this->assertEquals(1006, $this->store->txId);
+    }
+
+    public function testIncrementalSync()
+    {
+        $this->sync();
+        $this->conn->requests = array();
+
+        $this->conn->setPerson("abc12", "A. Renamed", false, array("CHRISTS"));
+        $this->conn->setPerson("def34", "D. Person", true);
+        $this->conn->setPerson("xyz99", "Still Not Mirrored");
+        $this->conn->setInst("CHRISTS", "Christ's");
+
+        $stats = $this->sync();
+
+        $this->assertEquals(1010, $this->store->txId);
+        $this->assertEquals("A. Renamed", $this->store->entities["person"]["abc12"]->visibleName);
+        $this->assertFalse(isset($this->store->entities["person"]["def34"]));
+        $this->assertEquals("G. Person", $this->store->entities["person"]["ghi56"]->visibleName);
+        $this->assertFalse(isset($this->store->entities["person"]["xyz99"]));
+        $this->assertEquals("Christ's", $this->store->entities["inst"]["CHRISTS"]->name);
+
+        $this->assertEquals(1, $stats["person"]["saved"]);
+        $this->assertEquals(1, $stats["person"]["removed"]);
+        $this->assertEquals(1, $stats["inst"]["saved"]);
+        $this->assertEquals(0, $stats["group"]["saved"]);
+        $this->assertEquals(0, sizeof($this->requestsFor("api/v1/person/list")));
+        $this->assertEquals(array("api/v1/person/modified-people?minTxId=1006&maxTxId=1010&" .
+                                  "crsids=abc12%2Cdef34%2Cghi56%2Cnobody1&includeCancelled=true&" .
+                                  "membershipChanges=true&instNameChanges=false&fetch=jdCollege%2Call_insts"),
+                            $this->requestsFor("api/v1/person/modified-people"));
+    }
+
+    public function testTransactionBatches()
+    {
+        $this->sync();
+        $this->conn->requests = array();
+
+        for ($i = 0; $i < 5; $i++)
+            $this->conn->setPerson("abc12", "A. Person " . $i);
+
+        $this->sync(array("txnBatchSize" => 2));
+
+        $this->assertEquals(1011, $this->store->txId);
+        $this->assertEquals("A. Person 4", $this->store->entities["person"]["abc12"]->visibleName);
+        $this->assertEquals(3, sizeof($this->requestsFor("api/v1/person/modified-people")));
+
+        // The ids are read once per sync, not once per batch of transactions
+        $this->assertEquals(6, $this->store->getIdsCalls);
+    }
+
+    public function testResumeAfterFailure()
+    {
+        $this->sync();
+        $this->conn->requests = array();
+
+        for ($i = 0; $i < 5; $i++)
+            $this->conn->setPerson("abc12", "A. Person " . $i);
+
+        // Fail after the first batch of transactions (one request for the
+        // last transaction id, then one request per type)
+        $this->conn->failAfter = 4;
+        $this->store->syncTime = null;
+        $failed = false;
+        try
+        {
+            $this->sync(array("txnBatchSize" => 2));
+        }
+        catch (Exception $e)
+        {
+            $failed = true;
+        }
+        $this->assertTrue($failed);
+        $this->assertNull($this->store->syncTime);
+        $this->assertEquals(1008, $this->store->txId);
+        $this->assertEquals("A. Person 1", $this->store->entities["person"]["abc12"]->visibleName);
+
+        $this->conn->failAfter = null;
+        $this->sync(array("txnBatchSize" => 2));
+        $this->assertNotNull($this->store->syncTime);
+        $this->assertEquals(1011, $this->store->txId);
+        $this->assertEquals("A. Person 4", $this->store->entities["person"]["abc12"]->visibleName);
+    }
+}
+?>
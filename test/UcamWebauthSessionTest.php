@@ -0,0 +1,173 @@
+<?php
+/*
+    UcamWebauthSessionTest
+    ----------------------
+
+    Tests for checking existing session cookies in
+    Ucam_Webauth::authenticate, including the verified-session fast path.
+
+    @file    UcamWebauthSessionTest.php
+    @license BSD 3-Clause
+    @package WPRavenAuth
+    @author  Gideon Farrell <me@gideonfarrell.co.uk>
+ */
+
+require_once dirname(__FILE__) . "/../app/lib/ucam_webauth.php";
+
+use PHPUnit\Framework\TestCase;
+use WPRavenAuth\Ucam_Webauth;
+
+/*
+ * A Ucam_Webauth with a clock that the tests control, counting the session
+ * cookie signatures it verifies.
+ */
+class ClockedWebauth extends Ucam_Webauth
+{
+    public static $time = 1700000000;
+    public static $verified = 0;
+
+    function now() { return self::$time; }
+
+    function cookie_sig_verify($key, $data, $sig)
+    {
+        self::$verified++;
+        return parent::cookie_sig_verify($key, $data, $sig);
+    }
+}
+
+class UcamWebauthSessionTest extends TestCase
+{
+    public function setUp(): void
+    {
+        $_SERVER["REQUEST_METHOD"] = "GET";
+        $_SERVER["HTTP_HOST"] = "www.example.cam.ac.uk";
+        $_SERVER["SERVER_PORT"] = "80";
+        $_SERVER["REQUEST_URI"] = "/protected/";
+        unset($_SERVER["QUERY_STRING"]);
+        $_COOKIE = array();
+
+        Ucam_Webauth::$sessions = array();
+        ClockedWebauth::$time = 1700000000;
+        ClockedWebauth::$verified = 0;
+    }
+
+    private function webauth($cookieKey = "secret")
+    {
+        return new ClockedWebauth(array("hostname"   => "www.example.cam.ac.uk",
+                                        "cookie_key" => $cookieKey));
+    }
+
+    /* Sets a session cookie as authenticate would have issued it */
+    private function setCookie($issue, $expire, $principal = "abc12", $id = "id1")
+    {
+        $webauth = $this->webauth();
+        $ticket = implode("!", array("1", "200", "", $webauth->time2iso($issue),
+                                     $webauth->time2iso($expire), $id, $principal,
+                                     "pwd", "", ""));
+        $_COOKIE[$webauth->full_cookie_name()] =
+            $ticket . "!" . $webauth->cookie_sig("secret", $ticket);
+    }
+
+    private function authenticate($authassertionid = NULL, $cookieKey = "secret")
+    {
+        $webauth = $this->webauth($cookieKey);
+        $complete = @$webauth->authenticate($authassertionid, TRUE);
+        return array($complete, $webauth);
+    }
+
+    public function testFastPath()
+    {
+        $this->setCookie(ClockedWebauth::$time - 60, ClockedWebauth::$time + 3600);
+
+        list($complete, $webauth) = $this->authenticate();
+        $this->assertTrue($complete);
+        $this->assertEquals("200", $webauth->status());
+        $this->assertEquals("abc12", $webauth->principal());
+        $this->assertEquals(1, ClockedWebauth::$verified);
+
+        // Later checks in the request, by any instance, aren't verified again
+        list($complete, $webauth) = $this->authenticate();
+        $this->assertTrue($complete);
+        $this->assertEquals("abc12", $webauth->principal());
+        $this->assertEquals(1, ClockedWebauth::$verified);
+    }
+
+    public function testExpiry()
+    {
+        $this->setCookie(ClockedWebauth::$time - 60, ClockedWebauth::$time + 3600);
+        list($complete, $webauth) = $this->authenticate();
+        $this->assertTrue($complete);
+
+        ClockedWebauth::$time += 3599;
+        list($complete, $webauth) = $this->authenticate();
+        $this->assertTrue($complete);
+
+        // An expired session isn't served from the cache
+        ClockedWebauth::$time += 1;
+        list($complete, $webauth) = $this->authenticate();
+        $this->assertFalse($complete);
+        $this->assertEquals(1, ClockedWebauth::$verified);
+    }
+
+    public function testClockSkew()
+    {
+        // Issued by a web server whose clock is a little ahead
+        $this->setCookie(ClockedWebauth::$time + 5, ClockedWebauth::$time + 3600);
+        list($complete, $webauth) = $this->authenticate();
+        $this->assertTrue($complete);
+
+        // But not too far ahead, whether or not the cookie is cached
+        $this->setCookie(ClockedWebauth::$time + 6, ClockedWebauth::$time + 3600, "def34");
+        list($complete, $webauth) = $this->authenticate();
+        $this->assertFalse($complete);
+        list($complete, $webauth) = $this->authenticate();
+        $this->assertFalse($complete);
+        $this->assertEquals(2, ClockedWebauth::$verified);
+
+        ClockedWebauth::$time += 1;
+        list($complete, $webauth) = $this->authenticate();
+        $this->assertTrue($complete);
+        $this->assertEquals("def34", $webauth->principal());
+        $this->assertEquals(2, ClockedWebauth::$verified);
+    }
+
+    public function testForcedReauth()
+    {
+        $this->setCookie(ClockedWebauth::$time - 60, ClockedWebauth::$time + 3600);
+        list($complete, $webauth) = $this->authenticate();
+        $this->assertTrue($complete);
+
+        list($complete, $webauth) = $this->authenticate("id1");
+        $this->assertFalse($complete);
+
+        list($complete, $webauth) = $this->authenticate("id2");
+        $this->assertTrue($complete);
+    }
+
+    public function testInvalidCookieNotCached()
+    {
+        $this->setCookie(ClockedWebauth::$time - 60, ClockedWebauth::$time + 3600);
+        $name = $this->webauth()->full_cookie_name();
+        $_COOKIE[$name] = str_replace("!abc12!", "!xyz99!", $_COOKIE[$name]);
+
+        for ($i = 0; $i < 2; $i++)
+        {
+            list($complete, $webauth) = $this->authenticate();
+            $this->assertTrue($complete);
+            $this->assertEquals("600", $webauth->status());
+        }
+        $this->assertEquals(2, ClockedWebauth::$verified);
+        $this->assertEquals(array(), Ucam_Webauth::$sessions);
+    }
+
+    public function testCookieKeyChanged()
+    {
+        $this->setCookie(ClockedWebauth::$time - 60, ClockedWebauth::$time + 3600);
+        list($complete, $webauth) = $this->authenticate();
+        $this->assertEquals("200", $webauth->status());
+
+        list($complete, $webauth) = $this->authenticate(NULL, "new secret");
+        $this->assertEquals("600", $webauth->status());
+    }
+}
+?>
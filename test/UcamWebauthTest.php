@@ -0,0 +1,151 @@
+<?php
+/*
+    UcamWebauthTest
+    ---------------
+
+    Tests for signature checking and the public key cache in Ucam_Webauth,
+    using keys generated in a temporary key directory, and for session
+    cookie signing.
+
+    @file    UcamWebauthTest.php
+    @license BSD 3-Clause
+    @package WPRavenAuth
+    @author  Gideon Farrell <me@gideonfarrell.co.uk>
+ */
+
+require_once dirname(__FILE__) . "/../app/lib/ucam_webauth.php";
+
+use PHPUnit\Framework\TestCase;
+use WPRavenAuth\Ucam_Webauth;
+
+class UcamWebauthTest extends TestCase
+{
+    private $keyDir;
+    private $webauth;
+
+    public function setUp(): void
+    {
+        $this->keyDir = sys_get_temp_dir() . "/ucam_webauth_test_" . getmypid();
+        @mkdir($this->keyDir);
+        Ucam_Webauth::$keys = array();
+        $this->webauth = new Ucam_Webauth(array("key_dir"        => $this->keyDir,
+                                                "key_cache_apcu" => FALSE));
+    }
+
+    public function tearDown(): void
+    {
+        foreach (glob($this->keyDir . "/*") as $file)
+            unlink($file);
+        rmdir($this->keyDir);
+    }
+
+    /* Writes a new key pair's certificate as key 2, returning the private key */
+    private function writeKey($mtime)
+    {
+        $key = openssl_pkey_new(array("private_key_bits" => 2048));
+        $csr = openssl_csr_new(array("commonName" => "Raven test key"), $key);
+        openssl_x509_export(openssl_csr_sign($csr, null, $key, 1), $cert);
+        file_put_contents($this->keyDir . "/2.crt", $cert);
+        touch($this->keyDir . "/2.crt", $mtime);
+        return $key;
+    }
+
+    private function sign($key, $data)
+    {
+        openssl_sign($data, $sig, $key);
+        return $this->webauth->wls_encode($sig);
+    }
+
+    public function testCheckSig()
+    {
+        $key = $this->writeKey(1000000);
+        $sig = $this->sign($key, "1!200!!20240101T000000Z!id!url!abc12");
+
+        $this->assertEquals(1, $this->webauth->check_sig("1!200!!20240101T000000Z!id!url!abc12", $sig, "2"));
+        $this->assertEquals(0, $this->webauth->check_sig("1!200!!20240101T000000Z!id!url!xyz99", $sig, "2"));
+        $this->assertFalse($this->webauth->check_sig("data", $sig, "3"));
+        $this->assertFalse($this->webauth->check_sig("data", $sig, "../2"));
+    }
+
+    public function testKeyCached()
+    {
+        $key = $this->writeKey(1000000);
+        $sig = $this->sign($key, "data");
+        $this->assertEquals(1, $this->webauth->check_sig("data", $sig, "2"));
+
+        // With the same modification time, the file isn't read again
+        file_put_contents($this->keyDir . "/2.crt", "not a key");
+        touch($this->keyDir . "/2.crt", 1000000);
+        $this->assertEquals(1, $this->webauth->check_sig("data", $sig, "2"));
+
+        // The cache is shared by other instances
+        $other = new Ucam_Webauth(array("key_dir" => $this->keyDir, "key_cache_apcu" => FALSE));
+        $this->assertEquals(1, $other->check_sig("data", $sig, "2"));
+
+        touch($this->keyDir . "/2.crt", 1000001);
+        $this->assertFalse(@$this->webauth->check_sig("data", $sig, "2"));
+    }
+
+    public function testKeyReplaced()
+    {
+        $oldKey = $this->writeKey(1000000);
+        $oldSig = $this->sign($oldKey, "data");
+        $this->assertEquals(1, $this->webauth->check_sig("data", $oldSig, "2"));
+
+        $newKey = $this->writeKey(1000060);
+        $newSig = $this->sign($newKey, "data");
+        $this->assertEquals(1, $this->webauth->check_sig("data", $newSig, "2"));
+        $this->assertEquals(0, $this->webauth->check_sig("data", $oldSig, "2"));
+    }
+
+    public function testKeyCacheDisabled()
+    {
+        $key = $this->writeKey(1000000);
+        $sig = $this->sign($key, "data");
+        $this->webauth->key_cache(FALSE);
+        $this->assertEquals(1, $this->webauth->check_sig("data", $sig, "2"));
+        $this->assertEquals(array(), Ucam_Webauth::$keys);
+
+        file_put_contents($this->keyDir . "/2.crt", "not a key");
+        touch($this->keyDir . "/2.crt", 1000000);
+        $this->assertFalse(@$this->webauth->check_sig("data", $sig, "2"));
+    }
+
+    public function testHmacSha1()
+    {
+        // A well-known HMAC-SHA1 test vector, in the hex then wls_encode'd
+        // format of existing session cookies
+        $this->assertEquals($this->webauth->wls_encode("de7c9b85b8b78aa6bc8a7a36f70a90701c9db4d9"),
+                            $this->webauth->hmac_sha1("key", "The quick brown fox jumps over the lazy dog"));
+        $sig = $this->webauth->hmac_sha1(str_repeat("k", 100), "data");
+        $this->assertTrue($this->webauth->hmac_sha1_verify(str_repeat("k", 100), "data", $sig));
+        $this->assertFalse($this->webauth->hmac_sha1_verify(str_repeat("k", 100), "datb", $sig));
+        $this->assertFalse($this->webauth->hmac_sha1_verify(str_repeat("k", 100), "data", substr($sig, 1)));
+    }
+
+    public function testCookieSig()
+    {
+        $sig = $this->webauth->cookie_sig("key", "1!200!!ticket");
+        $this->assertStringStartsWith("sha256:", $sig);
+        $this->assertTrue($this->webauth->cookie_sig_verify("key", "1!200!!ticket", $sig));
+        $this->assertFalse($this->webauth->cookie_sig_verify("key", "1!200!!tickeT", $sig));
+        $this->assertFalse($this->webauth->cookie_sig_verify("other", "1!200!!ticket", $sig));
+        $this->assertFalse($this->webauth->cookie_sig_verify("key", "1!200!!ticket", "sha256:" . $sig));
+
+        // Cookies issued before are still accepted
+        $legacy = $this->webauth->hmac_sha1("key", "1!200!!ticket");
+        $this->assertTrue($this->webauth->cookie_sig_verify("key", "1!200!!ticket", $legacy));
+
+        // Only the configured digest is accepted with a digest name
+        $this->webauth->cookie_digest("sha512");
+        $this->assertFalse($this->webauth->cookie_sig_verify("key", "1!200!!ticket", $sig));
+        $sig = $this->webauth->cookie_sig("key", "1!200!!ticket");
+        $this->assertStringStartsWith("sha512:", $sig);
+        $this->assertTrue($this->webauth->cookie_sig_verify("key", "1!200!!ticket", $sig));
+        $this->assertFalse($this->webauth->cookie_sig_verify("key", "1!200!!ticket", "md5:abc"));
+
+        $this->webauth->cookie_digest("sha1");
+        $this->assertEquals($legacy, $this->webauth->cookie_sig("key", "1!200!!ticket"));
+    }
+}
+?>
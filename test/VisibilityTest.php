@@ -0,0 +1,78 @@
+<?php
+/*
+    VisibilityTest
+    --------------
+
+    Tests for compiling and checking post visibility.
+
+    @file    VisibilityTest.php
+    @license BSD 3-Clause
+    @package WPRavenAuth
+    @author  Gideon Farrell <me@gideonfarrell.co.uk>
+ */
+
+require_once dirname(__FILE__) . "/../app/core/ibis.php";
+require_once dirname(__FILE__) . "/../app/core/visibility.php";
+
+use PHPUnit\Framework\TestCase;
+use WPRavenAuth\Visibility;
+
+class VisibilityTest extends TestCase
+{
+    public function testCompile()
+    {
+        $this->assertEquals(array("level" => "public", "rules" => array()),
+                            Visibility::compile(null));
+        $this->assertEquals(array("level" => "public", "rules" => array()),
+                            Visibility::compile(array("COLL-TRIN", "public", "raven")));
+        $this->assertEquals(array("level" => "raven", "rules" => array()),
+                            Visibility::compile(array("COLL-TRIN", "raven")));
+        $this->assertEquals(array("level" => "members",
+                                  "rules" => array("COLL-TRIN", "INST-CHRSTUG")),
+                            Visibility::compile(array("COLL-TRIN", "INST-CHRSTUG",
+                                                      "COLL-TRIN", "bogus")));
+        $this->assertEquals(array("level" => "members", "rules" => array()),
+                            Visibility::compile(array()));
+    }
+
+    public function testCurrent()
+    {
+        $choices = array("COLL-TRIN", "INST-TRINUG");
+        $stored = Visibility::compileForStorage($choices);
+        $this->assertEquals("members", $stored["level"]);
+        $this->assertEquals(Visibility::sourceHash($choices), $stored["source"]);
+
+        // The stored visibility is used while the choices are unchanged
+        $this->assertSame($stored, Visibility::current($stored, array("COLL-TRIN", "INST-TRINUG")));
+
+        // Choices changed without the stored visibility being updated, and
+        // visibility stored before the hash was recorded, are recompiled
+        $this->assertEquals(Visibility::compileForStorage(array("raven")),
+                            Visibility::current($stored, array("raven")));
+        $this->assertEquals(Visibility::compileForStorage($choices),
+                            Visibility::current(Visibility::compile($choices), $choices));
+        $this->assertEquals(Visibility::compileForStorage(""),
+                            Visibility::current("", ""));
+    }
+
+    public function testAllows()
+    {
+        $public = Visibility::compile(array("public"));
+        $raven = Visibility::compile(array("raven"));
+        $trinity = Visibility::compile(array("COLL-TRIN", "INST-TRINUG"));
+
+        // Public and raven posts never need the membership set
+        $memberships = null;
+        $this->assertTrue(Visibility::allows($public, false, "", $memberships));
+        $this->assertFalse(Visibility::allows($raven, false, "", $memberships));
+        $this->assertTrue(Visibility::allows($raven, true, "abc12", $memberships));
+        $this->assertFalse(Visibility::allows($trinity, false, "", $memberships));
+        $this->assertNull($memberships);
+
+        $memberships = array("COLL-CHRISTS" => true, "INST-TRINUG" => true);
+        $this->assertTrue(Visibility::allows($trinity, true, "abc12", $memberships));
+        $memberships = array("COLL-CHRISTS" => true);
+        $this->assertFalse(Visibility::allows($trinity, true, "abc12", $memberships));
+    }
+}
+?>